@@ -0,0 +1,142 @@
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+from library_management_system import LibrarySystem
+
+
+# Methods that change state, applied in order by the single writer. Turning the
+# journal, events or metrics on and off is ordered with the writes around it
+WRITE_METHODS = (
+    "add_book", "add_books_bulk", "update_book", "add_user", "add_users_bulk",
+    "borrow_book", "borrow_books", "return_book", "return_books", "extend_borrowing",
+    "place_hold", "cancel_hold", "expire_holds",
+    "enable_journal", "sync_journal", "close_journal", "compact_journal",
+    "enable_events", "disable_events", "enable_metrics", "disable_metrics",
+)
+
+# Methods that can scan large parts of the data, run on the read executor. The
+# iter_* ones only open their cursor there: the caller consumes the iterator
+HEAVY_READ_METHODS = (
+    "get_all_books", "search_books", "get_all_users", "get_overdue_books",
+    "get_due_between", "get_borrow_history", "generate_reports", "recompute_reports",
+    "iter_books", "iter_users", "iter_overdue", "iter_borrow_history",
+    "export", "save", "get_metrics", "write_metrics",
+)
+
+# Dictionary lookups, cheap enough to answer on the event loop
+LIGHT_READ_METHODS = ("get_book", "get_book_by_isbn", "get_user", "get_user_by_email", "get_holds", "get_user_holds",
+                      "subscribe")
+
+
+class AsyncLibrarySystem:
+    """ asyncio facade over a LibrarySystem.
+
+    Writes go through a queue consumed by one writer task, which takes whatever has
+    piled up (up to `max_batch` commands) and applies it in a single hop to a dedicated
+    writer thread. Heavy reads run on a thread pool, so neither blocks the event loop.
+    Every public LibrarySystem instance method is available as a coroutine with the
+    same arguments and errors; for the classmethods load and recover, build the
+    system first and pass it in.
+
+        async with AsyncLibrarySystem() as library:
+            book_id = await library.add_book(...)
+    """
+
+    def __init__(self, system=None, read_workers=4, max_batch=256):
+        # Readers and the writer touch the system from different threads
+        self.system = system if system is not None else LibrarySystem(concurrent=True)
+        self.max_batch = max_batch
+        self.batches = 0
+        self.commands = 0
+        self._read_executor = ThreadPoolExecutor(read_workers, thread_name_prefix="library-read")
+        self._write_executor = ThreadPoolExecutor(1, thread_name_prefix="library-write")
+        self._queue = None
+        self._writer = None
+        self._closed = False
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.aclose()
+
+    def __getattr__(self, name):
+        if name in WRITE_METHODS:
+            return functools.partial(self._submit, name)
+        if name in HEAVY_READ_METHODS:
+            return functools.partial(self._read, name)
+        if name in LIGHT_READ_METHODS:
+            return functools.partial(self._lookup, name)
+        raise AttributeError(name)
+
+    async def _lookup(self, name, *args, **kwargs):
+        return getattr(self.system, name)(*args, **kwargs)
+
+    async def _read(self, name, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        call = functools.partial(getattr(self.system, name), *args, **kwargs)
+        return await loop.run_in_executor(self._read_executor, call)
+
+    async def _submit(self, name, *args, **kwargs):
+        if self._closed:
+            raise RuntimeError("AsyncLibrarySystem is closed")
+        if self._writer is None:
+            self._queue = asyncio.Queue()
+            self._writer = asyncio.get_running_loop().create_task(self._write_loop())
+
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((name, args, kwargs, future))
+        return await future
+
+    def _apply(self, batch):
+        outcomes = []
+        for name, args, kwargs, _ in batch:
+            try:
+                outcomes.append((True, getattr(self.system, name)(*args, **kwargs)))
+            except Exception as error:
+                outcomes.append((False, error))
+        return outcomes
+
+    async def _write_loop(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            command = await self._queue.get()
+            if command is None:
+                return
+
+            # Coalesce whatever else is already waiting into the same batch
+            batch = [command]
+            stop = False
+            while len(batch) < self.max_batch and not self._queue.empty():
+                command = self._queue.get_nowait()
+                if command is None:
+                    stop = True
+                    break
+                batch.append(command)
+
+            outcomes = await loop.run_in_executor(self._write_executor, self._apply, batch)
+            self.batches += 1
+            self.commands += len(batch)
+
+            for (_, _, _, future), (succeeded, value) in zip(batch, outcomes):
+                if future.cancelled():
+                    continue
+                if succeeded:
+                    future.set_result(value)
+                else:
+                    future.set_exception(value)
+
+            if stop:
+                return
+
+    async def aclose(self):
+        """ Applies every queued write, then stops the writer and the thread pools """
+        if self._closed:
+            return
+        self._closed = True
+        if self._writer is not None:
+            self._queue.put_nowait(None)
+            await self._writer
+        self._read_executor.shutdown(wait=True)
+        self._write_executor.shutdown(wait=True)
@@ -0,0 +1,45 @@
+""" Returning every loan of an institutional account holding thousands of books:
+the old borrowed_books list against ActiveLoans.
+
+    python -m benchmarks.bench_active_loans [loans]
+"""
+import sys
+import time
+import random
+
+from library_management_system import ActiveLoans, LibrarySystem, UserRole
+
+
+def churn(loans, record_ids):
+    # Loans come back in any order, not the order they were lent
+    returns = list(record_ids)
+    random.Random(1).shuffle(returns)
+    started = time.perf_counter()
+    for record_id in record_ids:
+        loans.append(record_id)
+    for record_id in returns:
+        loans.remove(record_id)
+    return time.perf_counter() - started
+
+
+def main(loans=20_000):
+    record_ids = [f"record-{i}" for i in range(loans)]
+    list_seconds = churn([], record_ids)
+    set_seconds = churn(ActiveLoans(), record_ids)
+    print(f"{loans} loans added then returned")
+    print(f"list         {list_seconds:8.3f}s")
+    print(f"ActiveLoans  {set_seconds:8.3f}s  ({list_seconds / set_seconds:.0f}x)")
+
+    system = LibrarySystem(borrow_limits={UserRole.LIBRARIAN: None})
+    school_id = system.add_user("School", "school@example.com", UserRole.LIBRARIAN)
+    book_ids = system.add_books_bulk(
+        (f"Title {i}", "Author", f"978-{i:010d}", 2000, "Fiction") for i in range(loans)
+    )["ids"]
+    started = time.perf_counter()
+    loaned = system.borrow_books(school_id, book_ids)["ids"]
+    system.return_books(loaned)
+    print(f"LibrarySystem borrow_books + return_books of {loans}: {time.perf_counter() - started:.2f}s")
+
+
+if __name__ == "__main__":
+    main(*(int(arg) for arg in sys.argv[1:]))
@@ -0,0 +1,58 @@
+""" In-process load generator for AsyncLibrarySystem: N concurrent clients doing
+checkout/return cycles with occasional searches, reporting throughput, latency
+percentiles and how well writes were batched.
+
+    python -m benchmarks.bench_async [clients] [operations per client]
+"""
+import sys
+import time
+import asyncio
+import statistics
+
+from async_library import AsyncLibrarySystem
+
+
+def percentile(sorted_values, fraction):
+    return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+
+async def run(clients, operations):
+    async with AsyncLibrarySystem() as library:
+        book_ids = (await library.add_books_bulk(
+            (f"Book {i}", f"Author {i % 100}", f"978-{i:010d}", 2000, "Fiction") for i in range(clients)
+        ))["ids"]
+        user_ids = (await library.add_users_bulk(
+            (f"User {i}", f"user{i}@example.com") for i in range(clients)
+        ))["ids"]
+        latencies = []
+
+        async def client(index):
+            for step in range(operations):
+                started = time.perf_counter()
+                if step % 10 == 9:
+                    await library.search_books(f"author {index % 100}", limit=10)
+                else:
+                    record_id = await library.borrow_book(book_ids[index], user_ids[index])
+                    await library.return_book(record_id)
+                latencies.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(client(index) for index in range(clients)))
+        elapsed = time.perf_counter() - started
+
+        latencies.sort()
+        print(f"{clients} clients x {operations} operations in {elapsed:.2f}s "
+              f"-> {len(latencies) / elapsed:,.0f} ops/s")
+        print(f"latency p50 {percentile(latencies, 0.5) * 1000:.1f}ms  "
+              f"p99 {percentile(latencies, 0.99) * 1000:.1f}ms  "
+              f"mean {statistics.fmean(latencies) * 1000:.1f}ms")
+        print(f"{library.commands} writes applied in {library.batches} batches "
+              f"({library.commands / library.batches:.1f} per batch)")
+
+
+def main(clients=10_000, operations=5):
+    asyncio.run(run(clients, operations))
+
+
+if __name__ == "__main__":
+    main(*(int(arg) for arg in sys.argv[1:]))
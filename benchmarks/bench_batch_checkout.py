@@ -0,0 +1,61 @@
+""" Kiosk checkouts: borrow_book / return_book in a loop against borrow_books /
+return_books, with one thread and with several threads on a concurrent system.
+
+    python -m benchmarks.bench_batch_checkout [patrons] [books_per_patron] [threads]
+"""
+import sys
+import time
+import threading
+
+from library_management_system import LibrarySystem
+
+
+def setup(patrons, per_patron, concurrent):
+    system = LibrarySystem(concurrent=concurrent)
+    book_ids = system.add_books_bulk(
+        (f"Title {i}", "Author", f"978-{i:010d}", 2000, "Fiction") for i in range(patrons * per_patron)
+    )["ids"]
+    user_ids = system.add_users_bulk((f"User {i}", f"user{i}@example.com") for i in range(patrons))["ids"]
+    baskets = [book_ids[i * per_patron:(i + 1) * per_patron] for i in range(patrons)]
+    return system, list(zip(user_ids, baskets))
+
+
+def looped(system, visits):
+    for user_id, basket in visits:
+        record_ids = [system.borrow_book(book_id, user_id) for book_id in basket]
+        for record_id in record_ids:
+            system.return_book(record_id)
+
+
+def batched(system, visits):
+    for user_id, basket in visits:
+        system.return_books(system.borrow_books(user_id, basket)["ids"])
+
+
+def timed(run, system, visits, threads):
+    chunks = [visits[index::threads] for index in range(threads)]
+    workers = [threading.Thread(target=run, args=(system, chunk)) for chunk in chunks]
+    started = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return time.perf_counter() - started
+
+
+def main(patrons=20_000, per_patron=3, threads=4):
+    loans = patrons * per_patron
+    print(f"{patrons} patrons x {per_patron} books, checkout + return")
+    for concurrent, count in ((False, 1), (True, threads)):
+        results = {}
+        for name, run in (("loop", looped), ("batch", batched)):
+            system, visits = setup(patrons, per_patron, concurrent)
+            results[name] = timed(run, system, visits, count)
+            assert system.generate_reports()["current_borrows"] == 0
+        label = f"{count} thread{'s' if count > 1 else ''}"
+        print(f"{label:10} loop  {2 * loans / results['loop']:10,.0f} ops/s   "
+              f"batch {2 * loans / results['batch']:10,.0f} ops/s  ({results['loop'] / results['batch']:.2f}x)")
+
+
+if __name__ == "__main__":
+    main(*(int(arg) for arg in sys.argv[1:]))
@@ -0,0 +1,53 @@
+""" add_book / add_user in a loop against add_books_bulk / add_users_bulk, on the
+same synthetic data. Bulk ingestion defers search indexing to the next search,
+whose cost is shown separately.
+
+    python -m benchmarks.bench_bulk_ingest [rows]
+"""
+import sys
+import time
+
+from library_management_system import LibrarySystem
+
+
+CATEGORIES = ["Fiction", "Non-fiction", "Science", "History", "Biography", "Other"]
+
+
+def catalog(rows):
+    return [
+        (f"Title {i} volume {i % 97}", f"Author {i % 5000}", f"978-{i:010d}", 1900 + i % 120, CATEGORIES[i % 6])
+        for i in range(rows)
+    ]
+
+
+def members(rows):
+    return [(f"User {i}", f"user{i}@example.com") for i in range(rows)]
+
+
+def timed(function):
+    start = time.perf_counter()
+    function()
+    return time.perf_counter() - start
+
+
+def compare(name, rows, add_one, add_bulk, data):
+    # The systems stay alive, so their teardown is not timed
+    loop_system, bulk_system = LibrarySystem(), LibrarySystem()
+    loop_seconds = timed(lambda: [add_one(loop_system, row) for row in data])
+    bulk_seconds = timed(lambda: add_bulk(bulk_system, data))
+    print(f"{name:6} loop {rows / loop_seconds:12,.0f} rows/s   bulk {rows / bulk_seconds:12,.0f} rows/s"
+          f"  ({loop_seconds / bulk_seconds:.1f}x)")
+    return loop_system, bulk_system
+
+
+def main(rows=100_000):
+    print(f"{rows} rows")
+    _, bulk_system = compare("books", rows, lambda system, row: system.add_book(*row),
+                             LibrarySystem.add_books_bulk, catalog(rows))
+    search_seconds = timed(lambda: bulk_system.search_books("volume 42"))
+    print(f"       first search after the bulk load indexes it: {search_seconds:.2f} s")
+    compare("users", rows, lambda system, row: system.add_user(*row), LibrarySystem.add_users_bulk, members(rows))
+
+
+if __name__ == "__main__":
+    main(*(int(arg) for arg in sys.argv[1:]))
@@ -0,0 +1,48 @@
+""" Bulk checkouts and returns with each clock of clock.py.
+
+    python -m benchmarks.bench_clock [loans]
+"""
+import sys
+import time
+from datetime import datetime
+
+from clock import CoarseClock, ManualClock, SYSTEM_CLOCK
+from library_management_system import LibrarySystem
+
+
+def run(clock, loans):
+    system = LibrarySystem(clock=clock)
+    book_ids = system.add_books_bulk(
+        (f"Title {i}", "Author", f"978-{i:010d}", 2000, "Fiction") for i in range(loans)
+    )["ids"]
+    user_ids = system.add_users_bulk((f"User {i}", f"user{i}@example.com") for i in range(loans // 3 + 1))["ids"]
+
+    started = time.perf_counter()
+    record_ids = [system.borrow_book(book_id, user_ids[i // 3]) for i, book_id in enumerate(book_ids)]
+    for record_id in record_ids:
+        system.return_book(record_id)
+    return time.perf_counter() - started
+
+
+def main(loans=100_000):
+    clocks = [
+        ("system", SYSTEM_CLOCK),
+        ("coarse 1ms", CoarseClock(0.001)),
+        ("manual", ManualClock(datetime(2024, 1, 1))),
+    ]
+    baseline = None
+    print(f"{loans} checkouts + returns")
+    for name, clock in clocks:
+        seconds = run(clock, loans)
+        baseline = baseline or seconds
+        print(f"{name:12} {2 * loans / seconds:12,.0f} ops/s  ({baseline / seconds:.2f}x)")
+
+    for name, clock in clocks:
+        started = time.perf_counter()
+        for _ in range(1_000_000):
+            clock()
+        print(f"{name:12} {(time.perf_counter() - started) * 1000:8.0f} ns per read")
+
+
+if __name__ == "__main__":
+    main(*(int(arg) for arg in sys.argv[1:]))
@@ -0,0 +1,60 @@
+""" Checkout/return throughput of a concurrent LibrarySystem against thread count.
+Every thread hammers a shared pool of books, and the run fails if a book is ever
+lent twice.
+
+    python -m benchmarks.bench_concurrency [operations per thread]
+"""
+import sys
+import time
+import threading
+
+from library_management_system import LibrarySystem
+
+
+def run(threads, operations, books=64):
+    system = LibrarySystem(concurrent=True)
+    book_ids = [system.add_book(f"Book {i}", "Author", f"978-{i:010d}", 2000, "Fiction") for i in range(books)]
+    user_ids = [system.add_user(f"User {i}", f"user{i}@example.com") for i in range(threads)]
+    lent = {}
+    double_lends = []
+    lent_lock = threading.Lock()
+    barrier = threading.Barrier(threads + 1)
+
+    def worker(index):
+        barrier.wait()
+        for step in range(operations):
+            book_id = book_ids[(index * 7 + step) % books]
+            try:
+                record_id = system.borrow_book(book_id, user_ids[index])
+            except ValueError:
+                continue
+            with lent_lock:
+                if lent.get(book_id):
+                    double_lends.append(book_id)
+                lent[book_id] = True
+            with lent_lock:
+                lent[book_id] = False
+            system.return_book(record_id)
+
+    workers = [threading.Thread(target=worker, args=(index,)) for index in range(threads)]
+    for thread in workers:
+        thread.start()
+    barrier.wait()
+    started = time.perf_counter()
+    for thread in workers:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    if double_lends:
+        raise AssertionError(f"Books lent twice: {sorted(set(double_lends))}")
+    return threads * operations / elapsed
+
+
+def main(operations=2000):
+    print("threads  attempts/s")
+    for threads in (1, 2, 4, 8, 16):
+        print(f"{threads:7d}  {run(threads, operations):10,.0f}")
+
+
+if __name__ == "__main__":
+    main(*(int(arg) for arg in sys.argv[1:]))
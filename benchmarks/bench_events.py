@@ -0,0 +1,58 @@
+""" Cost of the change feed for writers: borrow/return cycles with events off, on
+with nobody reading, and on with a subscriber thread draining batches meanwhile.
+
+    python -m benchmarks.bench_events [cycles] [capacity]
+"""
+import sys
+import time
+import threading
+
+from library_management_system import LibrarySystem
+
+
+def run(system, book_ids, user_ids, cycles):
+    started = time.perf_counter()
+    for i in range(cycles):
+        record_id = system.borrow_book(book_ids[i % len(book_ids)], user_ids[i % len(user_ids)])
+        system.return_book(record_id)
+    return time.perf_counter() - started
+
+
+def build():
+    system = LibrarySystem()
+    book_ids = system.add_books_bulk(
+        (f"Title {i}", "Author", f"978-{i:010d}", 2000, "Fiction") for i in range(1000)
+    )["ids"]
+    user_ids = system.add_users_bulk((f"User {i}", f"user{i}@example.com") for i in range(1000))["ids"]
+    return system, book_ids, user_ids
+
+
+def main(cycles=100_000, capacity=8192):
+    print(f"{cycles} borrow + return cycles, a fresh library each, ring of {capacity} events")
+    for name in ("events off", "events on", "with reader"):
+        system, book_ids, user_ids = build()
+        reader = None
+        received = [0]
+        if name != "events off":
+            system.enable_events(capacity)
+        if name == "with reader":
+            subscription = system.subscribe()
+            done = threading.Event()
+
+            def read():
+                while not done.is_set() or subscription.lag:
+                    received[0] += len(subscription.poll(max_events=1000, timeout=0.01))
+            reader = threading.Thread(target=read)
+            reader.start()
+
+        seconds = run(system, book_ids, user_ids, cycles)
+        line = f"{name:12} {cycles / seconds:12,.0f} cycles/s  {seconds / cycles * 1e6:8.2f} us per cycle"
+        if reader is not None:
+            done.set()
+            reader.join()
+            line += f"  read {received[0]:,} events, missed {subscription.missed:,}"
+        print(line)
+
+
+if __name__ == "__main__":
+    main(*(int(arg) for arg in sys.argv[1:]))
@@ -0,0 +1,42 @@
+""" LibrarySystem.export against a json.dumps(entity.to_dict()) loop.
+
+    python -m benchmarks.bench_export [books] [records]
+"""
+import os
+import sys
+import json
+import time
+import tempfile
+
+from benchmarks.bench_snapshot import build
+
+
+def to_dict_loop(entities, path):
+    with open(path, "w", encoding="utf-8") as handle:
+        for entity in entities:
+            handle.write(json.dumps(entity.to_dict(), ensure_ascii=False) + "\n")
+
+
+def main(books=50_000, records=500_000):
+    started = time.perf_counter()
+    system = build(books, records)
+    print(f"built {books} books / {records} borrow records in {time.perf_counter() - started:.1f}s")
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "export")
+        for kind, entities in (("books", system.iter_books), ("borrow_records", system.iter_borrow_history)):
+            started = time.perf_counter()
+            to_dict_loop(entities(), path)
+            baseline = time.perf_counter() - started
+            print(f"{kind:15} to_dict + json.dumps {baseline:8.2f}s")
+
+            for format in ("ndjson", "csv", "columns"):
+                started = time.perf_counter()
+                system.export(path, kind, format)
+                elapsed = time.perf_counter() - started
+                print(f"{kind:15} export {format:13} {elapsed:8.2f}s  {baseline / elapsed:5.1f}x"
+                      f"  {os.path.getsize(path) / 2 ** 20:.1f} MiB")
+
+
+if __name__ == "__main__":
+    main(*(int(arg) for arg in sys.argv[1:]))
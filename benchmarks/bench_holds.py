@@ -0,0 +1,46 @@
+""" Hold queues under load: placing many holds on a few popular books, then
+return + collect cycles that hand each copy to the next holder.
+
+    python -m benchmarks.bench_holds [holds] [books]
+"""
+import sys
+import time
+
+from library_management_system import LibrarySystem, UserRole
+
+
+def main(holds=200_000, books=100):
+    system = LibrarySystem(borrow_limits={UserRole.MEMBER: None})
+    book_ids = system.add_books_bulk(
+        (f"Title {i}", "Author", f"978-{i:010d}", 2000, "Fiction") for i in range(books)
+    )["ids"]
+    user_ids = system.add_users_bulk((f"User {i}", f"user{i}@example.com") for i in range(holds // books + 1))["ids"]
+    loans = {book_id: system.borrow_book(book_id, user_ids[-1]) for book_id in book_ids}
+
+    started = time.perf_counter()
+    for i in range(holds):
+        system.place_hold(book_ids[i % books], user_ids[i // books])
+    seconds = time.perf_counter() - started
+    print(f"place_hold      {holds / seconds:12,.0f} holds/s  ({holds:,} holds on {books} books)")
+
+    # Each cycle returns a copy, which becomes READY for the first holder, who collects it
+    cycles = min(holds, 50_000)
+    started = time.perf_counter()
+    for i in range(cycles):
+        book_id = book_ids[i % books]
+        system.return_book(loans[book_id])
+        holder = system._ready_holds[book_id].user_id
+        loans[book_id] = system.borrow_book(book_id, holder)
+    seconds = time.perf_counter() - started
+    print(f"return+collect  {cycles / seconds:12,.0f} cycles/s {seconds / cycles * 1e6:8.1f} us per cycle")
+
+    started = time.perf_counter()
+    for book_id in book_ids:
+        for hold in system.get_holds(book_id)[:100]:
+            system.cancel_hold(hold.id)
+    seconds = time.perf_counter() - started
+    print(f"cancel_hold     {books * 100 / seconds:12,.0f} holds/s  ({len(system.holds):,} holds left)")
+
+
+if __name__ == "__main__":
+    main(*(int(arg) for arg in sys.argv[1:]))
@@ -0,0 +1,64 @@
+""" Memory per borrow record: the original __dict__ layout, the __slots__ BorrowRecord and BorrowLog.
+
+    python -m benchmarks.bench_memory [records]
+"""
+import gc
+import sys
+import uuid
+import tracemalloc
+from datetime import datetime, timedelta
+
+from borrow_log import BorrowLog
+from library_management_system import BorrowRecord
+
+
+class DictBorrowRecord:
+    # Layout of BorrowRecord before it used __slots__
+    def __init__(self, book_id, user_id, borrow_days=14):
+        self.id = str(uuid.uuid4())
+        self.book_id = book_id
+        self.user_id = user_id
+        self.borrow_date = datetime.now()
+        self.due_date = self.borrow_date + timedelta(days=borrow_days)
+        self.return_date = None
+        self.is_returned = False
+        self.extended = False
+
+
+def measure(build):
+    gc.collect()
+    tracemalloc.start()
+    keep = build()
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del keep
+    return current
+
+
+def main(records=200_000):
+    book_ids = [str(uuid.uuid4()) for _ in range(1000)]
+    user_ids = [str(uuid.uuid4()) for _ in range(5000)]
+
+    def rows(record_class):
+        return {
+            record.id: record
+            for record in (record_class(book_ids[i % len(book_ids)], user_ids[i % len(user_ids)])
+                           for i in range(records))
+        }
+
+    results = {
+        "dict (baseline)": measure(lambda: rows(DictBorrowRecord)),
+        "__slots__ BorrowRecord": measure(lambda: rows(BorrowRecord)),
+    }
+
+    source = list(rows(BorrowRecord).values())
+    results["BorrowLog"] = measure(lambda: BorrowLog.from_records(source))
+
+    baseline = results["dict (baseline)"]
+    print(f"{records} borrow records")
+    for name, size in results.items():
+        print(f"{name:<24} {size / records:8.1f} bytes/record  {size / baseline:6.1%} of baseline")
+
+
+if __name__ == "__main__":
+    main(*(int(arg) for arg in sys.argv[1:]))
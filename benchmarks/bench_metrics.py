@@ -0,0 +1,45 @@
+""" Cost of the instrumentation: borrow/return cycles and lookups with metrics
+off, on, and after disable_metrics().
+
+    python -m benchmarks.bench_metrics [cycles]
+"""
+import sys
+import time
+
+from library_management_system import LibrarySystem
+
+
+def run(system, book_ids, user_ids, cycles):
+    started = time.perf_counter()
+    for i in range(cycles):
+        record_id = system.borrow_book(book_ids[i % len(book_ids)], user_ids[i % len(user_ids)])
+        system.get_book(book_ids[i % len(book_ids)])
+        system.return_book(record_id)
+    return time.perf_counter() - started
+
+
+def build():
+    system = LibrarySystem()
+    book_ids = system.add_books_bulk(
+        (f"Title {i}", "Author", f"978-{i:010d}", 2000, "Fiction") for i in range(1000)
+    )["ids"]
+    user_ids = system.add_users_bulk((f"User {i}", f"user{i}@example.com") for i in range(1000))["ids"]
+    return system, book_ids, user_ids
+
+
+def main(cycles=100_000):
+    calls = 3 * cycles
+    print(f"{cycles} borrow + get_book + return cycles, a fresh library each")
+    for name, enable, disable in (("metrics off", False, False), ("metrics on", True, False),
+                                  ("after disable", True, True)):
+        system, book_ids, user_ids = build()
+        if enable:
+            system.enable_metrics()
+        if disable:
+            system.disable_metrics()
+        seconds = run(system, book_ids, user_ids, cycles)
+        print(f"{name:14} {calls / seconds:12,.0f} calls/s  {seconds / calls * 1e9:8.0f} ns per call")
+
+
+if __name__ == "__main__":
+    main(*(int(arg) for arg in sys.argv[1:]))
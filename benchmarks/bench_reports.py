@@ -0,0 +1,48 @@
+""" generate_reports against the process-pool ParallelReportEngine, by worker count.
+
+    python -m benchmarks.bench_reports [books] [records] [max_workers]
+"""
+import os
+import sys
+import time
+import tempfile
+
+from benchmarks.bench_snapshot import build
+from parallel_reports import ParallelReportEngine
+
+
+def timed(function, repeat=3):
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = function()
+        best = min(best, time.perf_counter() - started)
+    return best, result
+
+
+def main(books=50_000, records=1_000_000, max_workers=os.cpu_count() or 1):
+    system = build(books, records)
+    print(f"{books} books / {records} borrow records, {os.cpu_count()} cores")
+
+    elapsed, expected = timed(system.generate_reports)
+    print(f"generate_reports           {elapsed * 1000:9.1f} ms")
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "library.snapshot")
+        started = time.perf_counter()
+        system.save(path)
+        print(f"export (snapshot)          {(time.perf_counter() - started) * 1000:9.1f} ms")
+
+        workers = 0
+        while workers <= max_workers:
+            with ParallelReportEngine(workers=workers) as engine:
+                engine.generate_reports(path)  # starts the pool and maps the file
+                elapsed, report = timed(lambda: engine.generate_reports(path))
+            assert report["current_borrows"] == expected["current_borrows"]
+            label = "in-process" if workers == 0 else f"{workers} workers"
+            print(f"parallel, {label:<16} {elapsed * 1000:9.1f} ms")
+            workers = 1 if workers == 0 else workers * 2
+
+
+if __name__ == "__main__":
+    main(*(int(arg) for arg in sys.argv[1:]))
@@ -0,0 +1,69 @@
+""" Save and cold-start times for LibrarySystem snapshots.
+
+    python -m benchmarks.bench_snapshot [books] [records]
+"""
+import os
+import sys
+import time
+import tempfile
+from datetime import datetime, timedelta
+
+from library_management_system import BorrowRecord, LibrarySystem
+
+
+CATEGORIES = ["Fiction", "Non-fiction", "Science", "History", "Biography", "Other"]
+
+
+def build(books, records, users=None):
+    users = users or max(1, books // 10)
+    system = LibrarySystem()
+    book_ids = system.add_books_bulk(
+        (f"Title {i}", f"Author {i % 5000}", f"978-{i:010d}", 1900 + i % 120, CATEGORIES[i % 6])
+        for i in range(books)
+    )["ids"]
+    user_ids = system.add_users_bulk((f"User {i}", f"user{i}@example.com") for i in range(users))["ids"]
+
+    start = datetime.now() - timedelta(days=365 * 5)
+    for i in range(records):
+        record = BorrowRecord(book_ids[i % books], user_ids[i % users],
+                              borrow_date=start + timedelta(minutes=i))
+        # All but the last few hundred loans are history
+        if i < records - 500:
+            record.return_date = record.borrow_date + timedelta(days=7)
+            record.is_returned = True
+        system.borrow_records[record.id] = record
+    return system
+
+
+def main(books=50_000, records=500_000):
+    started = time.perf_counter()
+    system = build(books, records)
+    print(f"built {books} books / {records} borrow records in {time.perf_counter() - started:.1f}s")
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "library.snapshot")
+
+        started = time.perf_counter()
+        system.save(path)
+        print(f"save              {time.perf_counter() - started:8.2f}s  {os.path.getsize(path) / 2 ** 20:.1f} MiB")
+
+        started = time.perf_counter()
+        loaded = LibrarySystem.load(path)
+        print(f"load (cold start) {time.perf_counter() - started:8.2f}s")
+
+        started = time.perf_counter()
+        loaded.search_books("title")
+        print(f"first search      {time.perf_counter() - started:8.2f}s  (builds the search index)")
+
+        user_id = next(iter(loaded.users))
+        started = time.perf_counter()
+        loaded.get_borrow_history(user_id=user_id)
+        print(f"first history     {time.perf_counter() - started:8.2f}s  (groups the archived records)")
+
+        started = time.perf_counter()
+        loaded.save(path)
+        print(f"re-save           {time.perf_counter() - started:8.2f}s")
+
+
+if __name__ == "__main__":
+    main(*(int(arg) for arg in sys.argv[1:]))
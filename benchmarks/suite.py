@@ -0,0 +1,276 @@
+""" Benchmark suite for the LibrarySystem hot paths, with a regression gate.
+
+Builds a synthetic library (`scale` books, scale / 10 users, `scale` returned
+loans of history and scale / 100 open loans, half of them overdue), then times
+each case call by call and reports latency percentiles, throughput and the peak
+memory allocated while the case runs.
+
+    python -m benchmarks.suite --scale 100000
+    python -m benchmarks.suite --scale 100000 --save baseline.json
+    python -m benchmarks.suite --scale 100000 --compare baseline.json --tolerance 0.25
+
+With --compare the run exits with status 1 when a case got slower (median latency
+or throughput) or allocates more than the baseline allows.
+"""
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import resource
+import tracemalloc
+from datetime import datetime, timedelta
+
+from library_management_system import BookStatus, BorrowRecord, LibrarySystem
+
+
+CATEGORIES = ["Fiction", "Non-fiction", "Science", "History", "Biography", "Other"]
+WORDS = ["river", "night", "garden", "silent", "empire", "winter", "glass", "shadow", "ocean", "iron",
+         "golden", "forest", "letters", "machine", "stone", "crown", "journey", "mirror", "storm", "island",
+         "secret", "city", "fire", "memory", "atlas", "orchard", "signal", "harbor", "paper", "comet"]
+
+# Percentiles reported for every case
+PERCENTILES = (50, 90, 99)
+
+# Memory growth below this is noise, whatever the tolerance
+MEMORY_SLACK_KIB = 64
+
+
+# Synthetic data
+
+def book_rows(count, rng, start=0):
+    for i in range(start, start + count):
+        title = " ".join(rng.choice(WORDS) for _ in range(3)).title()
+        yield (f"{title} {i}", f"Author {rng.randrange(max(1, count // 20))}", f"978-{i:010d}",
+               rng.randrange(1800, 2025), CATEGORIES[i % len(CATEGORIES)])
+
+
+def user_rows(count, start=0):
+    for i in range(start, start + count):
+        yield (f"User {i}", f"user{i}@example.com")
+
+
+def populate(scale, seed=1):
+    """ A LibrarySystem of the given scale, plus the ids the cases draw from """
+    rng = random.Random(seed)
+    system = LibrarySystem()
+    book_ids = system.add_books_bulk(book_rows(scale, rng))["ids"]
+    user_ids = system.add_users_bulk(user_rows(max(10, scale // 10)))["ids"]
+
+    # History: returned loans spread over the last two years
+    start = datetime.now() - timedelta(days=730)
+    step = timedelta(days=700) / max(1, scale)
+    for i in range(scale):
+        record = BorrowRecord(book_ids[rng.randrange(scale)], user_ids[rng.randrange(len(user_ids))],
+                              borrow_date=start + step * i)
+        record.return_date = record.borrow_date + timedelta(days=rng.randrange(1, 21))
+        record.is_returned = True
+        system.borrow_records[record.id] = record
+
+    # Open loans, one per user, every other one already overdue
+    open_loans = min(max(1, scale // 100), len(user_ids) // 2)
+    for i in range(open_loans):
+        system.borrow_book(book_ids[i], user_ids[i], borrow_days=-1 if i % 2 else 14)
+
+    return system, {"book_ids": book_ids, "user_ids": user_ids, "free_users": user_ids[open_loans:],
+                    "free_books": book_ids[open_loans:], "next": scale}
+
+
+# Cases: each returns the operation to time, called with no arguments
+
+CASES = {}  # name -> (setup, default number of calls)
+
+
+def case(name, calls):
+    def register(setup):
+        CASES[name] = (setup, calls)
+        return setup
+    return register
+
+
+@case("add_book", 2000)
+def _add_book(system, data, rng):
+    rows = book_rows(10 ** 9, rng, start=data["next"])
+
+    def operation():
+        system.add_book(*next(rows))
+    return operation
+
+
+@case("add_user", 2000)
+def _add_user(system, data, rng):
+    rows = user_rows(10 ** 9, start=data["next"])
+
+    def operation():
+        system.add_user(*next(rows))
+    return operation
+
+
+@case("search_books", 500)
+def _search_books(system, data, rng):
+    def operation():
+        system.search_books(" ".join(rng.sample(WORDS, rng.choice((1, 2)))))
+    return operation
+
+
+@case("get_all_books", 200)
+def _get_all_books(system, data, rng):
+    filters = [{"status": BookStatus.BORROWED}, {"category": "Science"},
+               {"status": BookStatus.AVAILABLE, "category": "History"}]
+
+    def operation():
+        system.get_all_books(**rng.choice(filters))
+    return operation
+
+
+@case("borrow_return", 2000)
+def _borrow_return(system, data, rng):
+    books = data["free_books"]
+    users = data["free_users"]
+
+    def operation():
+        record_id = system.borrow_book(rng.choice(books), rng.choice(users))
+        system.return_book(record_id)
+    return operation
+
+
+@case("get_overdue_books", 50)
+def _get_overdue_books(system, data, rng):
+    return system.get_overdue_books
+
+
+@case("get_borrow_history", 2000)
+def _get_borrow_history(system, data, rng):
+    users = data["user_ids"]
+    books = data["book_ids"]
+
+    def operation():
+        if rng.random() < 0.5:
+            system.get_borrow_history(user_id=rng.choice(users))
+        else:
+            system.get_borrow_history(book_id=rng.choice(books))
+    return operation
+
+
+@case("generate_reports", 2000)
+def _generate_reports(system, data, rng):
+    return system.generate_reports
+
+
+# Measurement
+
+def percentile(sorted_values, percent):
+    """ Nearest-rank percentile of an ascending list """
+    rank = max(1, -(-len(sorted_values) * percent // 100))
+    return sorted_values[rank - 1]
+
+
+def measure(operation, calls, memory_calls=100):
+    clock = time.perf_counter_ns
+    for _ in range(min(50, calls // 10)):
+        operation()
+
+    timings = []
+    for _ in range(calls):
+        started = clock()
+        operation()
+        timings.append(clock() - started)
+
+    # Allocations are traced in a separate, shorter pass: tracing slows every call down
+    tracemalloc.start()
+    for _ in range(min(calls, memory_calls)):
+        operation()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    timings.sort()
+    result = {f"p{percent}_us": percentile(timings, percent) / 1000 for percent in PERCENTILES}
+    result["max_us"] = timings[-1] / 1000
+    result["ops_per_s"] = calls / (sum(timings) / 1e9) if sum(timings) else float("inf")
+    result["peak_kib"] = peak / 1024
+    return result
+
+
+def run(scale, names=None, calls=None, seed=1):
+    started = time.perf_counter()
+    system, data = populate(scale, seed)
+    build_seconds = time.perf_counter() - started
+
+    results = {}
+    for name, (setup, default_calls) in CASES.items():
+        if names and name not in names:
+            continue
+        rng = random.Random(seed)
+        results[name] = measure(setup(system, data, rng), calls or default_calls)
+
+    return {
+        "scale": scale,
+        "python": platform.python_version(),
+        "build_seconds": build_seconds,
+        "max_rss_kib": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        "results": results,
+    }
+
+
+def compare(baseline, current, tolerance):
+    """ Regressions of `current` against `baseline`, as messages; empty when none """
+    if baseline["scale"] != current["scale"]:
+        raise ValueError(f"Baseline was recorded at scale {baseline['scale']}, not {current['scale']}")
+
+    regressions = []
+    for name, before in baseline["results"].items():
+        after = current["results"].get(name)
+        if after is None:
+            continue
+        if after["p50_us"] > before["p50_us"] * (1 + tolerance):
+            regressions.append(f"{name}: median {before['p50_us']:.1f}us -> {after['p50_us']:.1f}us")
+        if after["ops_per_s"] < before["ops_per_s"] / (1 + tolerance):
+            regressions.append(f"{name}: throughput {before['ops_per_s']:,.0f} -> {after['ops_per_s']:,.0f} ops/s")
+        if after["peak_kib"] > before["peak_kib"] * (1 + tolerance) + MEMORY_SLACK_KIB:
+            regressions.append(f"{name}: peak memory {before['peak_kib']:,.0f} -> {after['peak_kib']:,.0f} KiB")
+    return regressions
+
+
+def report(summary):
+    print(f"scale {summary['scale']:,}: built in {summary['build_seconds']:.1f}s, "
+          f"max RSS {summary['max_rss_kib'] / 1024:,.0f} MiB")
+    header = "".join(f"{f'p{percent} us':>10}" for percent in PERCENTILES)
+    print(f"{'case':20}{header}{'max us':>10}{'ops/s':>12}{'peak KiB':>10}")
+    for name, result in summary["results"].items():
+        columns = "".join(f"{result[f'p{percent}_us']:10.1f}" for percent in PERCENTILES)
+        print(f"{name:20}{columns}{result['max_us']:10.1f}{result['ops_per_s']:12,.0f}{result['peak_kib']:10,.0f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.suite", description=__doc__.split("\n")[0])
+    parser.add_argument("--scale", type=int, default=10_000, help="books in the synthetic library (10^3 to 10^7)")
+    parser.add_argument("--calls", type=int, help="calls per case, instead of each case's default")
+    parser.add_argument("--case", action="append", choices=sorted(CASES), help="run only this case (repeatable)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--save", metavar="PATH", help="write the results as a baseline JSON")
+    parser.add_argument("--compare", metavar="PATH", help="fail on regressions against this baseline JSON")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed slowdown, 0.2 = 20%%")
+    options = parser.parse_args(argv)
+
+    summary = run(options.scale, options.case, options.calls, options.seed)
+    report(summary)
+
+    if options.save:
+        with open(options.save, "w", encoding="utf-8") as file:
+            json.dump(summary, file, indent=2)
+
+    if options.compare:
+        with open(options.compare, encoding="utf-8") as file:
+            baseline = json.load(file)
+        regressions = compare(baseline, summary, options.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            return 1
+        print(f"no regression beyond {options.tolerance:.0%} of {options.compare}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
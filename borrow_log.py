@@ -0,0 +1,276 @@
+import uuid
+import bisect
+from array import array
+from collections.abc import Mapping
+from datetime import datetime, timedelta
+
+from library_management_system import BorrowRecord
+
+
+EPOCH = datetime(1970, 1, 1)
+MICROSECOND = timedelta(microseconds=1)
+NO_DATE = -2 ** 63  # return_date of a loan that is still open
+
+RETURNED = 1
+EXTENDED = 2
+
+
+def to_epoch(moment):
+    """ datetime -> integer microseconds since EPOCH """
+    return (moment - EPOCH) // MICROSECOND
+
+
+def from_epoch(micros):
+    return EPOCH + timedelta(microseconds=micros)
+
+
+class KeyTable:
+    """ Interns repeated string ids (book and user ids) as small integers """
+
+    def __init__(self, keys=()):
+        self.keys = list(keys)
+        self.positions = {key: position for position, key in enumerate(self.keys)}
+
+    def __len__(self):
+        return len(self.keys)
+
+    def intern(self, key):
+        position = self.positions.get(key)
+        if position is None:
+            position = self.positions[key] = len(self.keys)
+            self.keys.append(key)
+        return position
+
+
+class BorrowRecordView(BorrowRecord):
+    """ A BorrowRecord whose fields live in a row of a BorrowLog.
+    Reads and writes go straight to the log's columns """
+
+    __slots__ = ("_log", "_row")
+
+    def __init__(self, log, row):
+        self._log = log
+        self._row = row
+        self._owner = None
+
+    @property
+    def id(self):
+        start = self._row * 16
+        return str(uuid.UUID(bytes=bytes(self._log._ids[start:start + 16])))
+
+    @property
+    def book_id(self):
+        return self._log._books.keys[self._log._book_refs[self._row]]
+
+    @property
+    def user_id(self):
+        return self._log._users.keys[self._log._user_refs[self._row]]
+
+    @property
+    def borrow_date(self):
+        return from_epoch(self._log._borrow_dates[self._row])
+
+    @property
+    def due_date(self):
+        return from_epoch(self._log._due_dates[self._row])
+
+    @due_date.setter
+    def due_date(self, value):
+        self._log._due_dates[self._row] = to_epoch(value)
+
+    @property
+    def return_date(self):
+        micros = self._log._return_dates[self._row]
+        return None if micros == NO_DATE else from_epoch(micros)
+
+    @return_date.setter
+    def return_date(self, value):
+        self._log._return_dates[self._row] = NO_DATE if value is None else to_epoch(value)
+
+    def _flag(self, flag):
+        return bool(self._log._flags[self._row] & flag)
+
+    def _set_flag(self, flag, value):
+        if value:
+            self._log._flags[self._row] |= flag
+        else:
+            self._log._flags[self._row] &= ~flag
+
+    @property
+    def is_returned(self):
+        return self._flag(RETURNED)
+
+    @is_returned.setter
+    def is_returned(self, value):
+        self._set_flag(RETURNED, value)
+
+    @property
+    def extended(self):
+        return self._flag(EXTENDED)
+
+    @extended.setter
+    def extended(self, value):
+        self._set_flag(EXTENDED, value)
+
+    def __repr__(self):
+        return f"<BorrowRecordView {self.id} row={self._row}>"
+
+
+class BorrowLog(Mapping):
+    """ Columnar, append-only store of borrow records.
+
+    Each record costs 16 bytes of UUID, two 4-byte references into the interned
+    book/user id tables, three 8-byte epoch timestamps and one flag byte, instead
+    of a full BorrowRecord with its own strings and datetime objects. Lookups by id
+    hand out BorrowRecordView objects, which behave like BorrowRecord.
+
+    Columns can be any writable buffers of the right type, such as memoryviews over
+    a memory-mapped snapshot; only a log built from arrays can be appended to.
+    """
+
+    COLUMNS = ("ids", "book_refs", "user_refs", "borrow_dates", "due_dates", "return_dates", "flags")
+
+    def __init__(self):
+        self._ids = bytearray()
+        self._books = KeyTable()
+        self._users = KeyTable()
+        self._book_refs = array("i")
+        self._user_refs = array("i")
+        self._borrow_dates = array("q")
+        self._due_dates = array("q")
+        self._return_dates = array("q")
+        self._flags = bytearray()
+        self._rows = None  # id bytes -> row, built on the first lookup by id
+        self._sorted_rows = None  # rows ordered by id bytes, an alternative to `_rows`
+
+    @classmethod
+    def from_columns(cls, columns, book_keys, user_keys, sorted_rows=None):
+        """ Wraps existing column buffers (see `columns`) without copying them """
+        log = cls()
+        for name in cls.COLUMNS:
+            setattr(log, "_" + name, columns[name])
+        log._books = KeyTable(book_keys)
+        log._users = KeyTable(user_keys)
+        log._sorted_rows = sorted_rows
+        return log
+
+    def columns(self):
+        return {name: getattr(self, "_" + name) for name in self.COLUMNS}
+
+    @property
+    def book_keys(self):
+        return self._books.keys
+
+    @property
+    def user_keys(self):
+        return self._users.keys
+
+    def _id_bytes(self, row):
+        start = row * 16
+        return bytes(self._ids[start:start + 16])
+
+    def sorted_rows(self):
+        """ Row numbers ordered by record id, so ids can be found by bisection
+        without building a dict over the whole log """
+        if self._sorted_rows is None:
+            self._sorted_rows = array("i", sorted(range(len(self)), key=self._id_bytes))
+        return self._sorted_rows
+
+    def chronological_rows(self):
+        """ Row numbers ordered by borrow date, rows borrowed at the same time in row order """
+        borrow_dates = self._borrow_dates
+        if all(borrow_dates[i] <= borrow_dates[i + 1] for i in range(len(borrow_dates) - 1)):
+            return range(len(borrow_dates))
+        return array("i", sorted(range(len(borrow_dates)), key=borrow_dates.__getitem__))
+
+    def group_rows(self, field):
+        """ {book_id or user_id: rows ordered by borrow date} for field "book_id" / "user_id" """
+        if field == "book_id":
+            refs, keys = self._book_refs, self._books.keys
+        elif field == "user_id":
+            refs, keys = self._user_refs, self._users.keys
+        else:
+            raise ValueError("Field must be book_id or user_id")
+
+        groups = {}
+        for row, ref in enumerate(refs):
+            rows = groups.get(ref)
+            if rows is None:
+                rows = groups[ref] = array("i")
+            rows.append(row)
+
+        borrow_dates = self._borrow_dates
+        for ref, rows in groups.items():
+            if any(borrow_dates[rows[i]] > borrow_dates[rows[i + 1]] for i in range(len(rows) - 1)):
+                groups[ref] = array("i", sorted(rows, key=borrow_dates.__getitem__))
+        return {keys[ref]: rows for ref, rows in groups.items()}
+
+    @classmethod
+    def from_records(cls, records):
+        log = cls()
+        for record in records:
+            log.append(record)
+        return log
+
+    def append(self, record):
+        try:
+            id_bytes = uuid.UUID(record.id).bytes
+        except ValueError:
+            raise ValueError(f"Borrow record id must be a UUID, got {record.id!r}")
+
+        row = len(self._flags)
+        self._sorted_rows = None
+        self._ids += id_bytes
+        self._book_refs.append(self._books.intern(record.book_id))
+        self._user_refs.append(self._users.intern(record.user_id))
+        self._borrow_dates.append(to_epoch(record.borrow_date))
+        self._due_dates.append(to_epoch(record.due_date))
+        self._return_dates.append(NO_DATE if record.return_date is None else to_epoch(record.return_date))
+        self._flags.append((RETURNED if record.is_returned else 0) | (EXTENDED if record.extended else 0))
+
+        if self._rows is not None:
+            self._rows[id_bytes] = row
+        return row
+
+    def row(self, row):
+        if not 0 <= row < len(self._flags):
+            raise IndexError("Borrow log row out of range")
+        return BorrowRecordView(self, row)
+
+    def views(self):
+        for row in range(len(self._flags)):
+            yield BorrowRecordView(self, row)
+
+    def _row_of(self, record_id):
+        try:
+            id_bytes = uuid.UUID(record_id).bytes
+        except (AttributeError, TypeError, ValueError):
+            return None
+
+        if self._sorted_rows is not None:
+            rows = self._sorted_rows
+            index = bisect.bisect_left(rows, id_bytes, key=self._id_bytes)
+            if index < len(rows) and self._id_bytes(rows[index]) == id_bytes:
+                return rows[index]
+            return None
+
+        if self._rows is None:
+            self._rows = {self._id_bytes(row): row for row in range(len(self))}
+        return self._rows.get(id_bytes)
+
+    def __getitem__(self, record_id):
+        row = self._row_of(record_id)
+        if row is None:
+            raise KeyError(record_id)
+        return BorrowRecordView(self, row)
+
+    def __contains__(self, record_id):
+        return self._row_of(record_id) is not None
+
+    def __len__(self):
+        return len(self._flags)
+
+    def __iter__(self):
+        ids = self._ids
+        for start in range(0, len(ids), 16):
+            yield str(uuid.UUID(bytes=bytes(ids[start:start + 16])))
@@ -0,0 +1,86 @@
+""" Clocks for LibrarySystem and its entities.
+
+A clock is any callable returning the current datetime; `datetime.now` itself
+is one. LibrarySystem(clock=...) reads every timestamp it records from its
+clock, and Book, User and BorrowRecord fall back to their class attribute
+`clock` when they are used on their own:
+
+    clock = ManualClock(datetime(2024, 1, 1))
+    system = LibrarySystem(clock=clock)
+    record_id = system.borrow_book(book_id, user_id)
+    clock.advance(days=15)
+    system.get_overdue_books()  # the loan is now overdue
+
+CoarseClock trades precision for speed: it hands out the same datetime until
+its resolution has passed, so hot paths pay for a monotonic counter read
+instead of building a new datetime every call.
+"""
+import time
+import threading
+from datetime import datetime, timedelta
+
+
+class SystemClock:
+    """ The wall clock, datetime.now() """
+
+    def __call__(self):
+        return datetime.now()
+
+    def __repr__(self):
+        return "SystemClock()"
+
+
+class ManualClock:
+    """ A frozen clock that only moves when told to, for tests and simulations """
+
+    def __init__(self, start=None):
+        self._now = start or datetime.now()
+        self._lock = threading.Lock()
+
+    def __call__(self):
+        return self._now
+
+    def set(self, moment):
+        with self._lock:
+            self._now = moment
+
+    def advance(self, delta=None, **kwargs):
+        """ Moves forward by a timedelta, or by timedelta keyword arguments (days=1, ...) """
+        delta = delta if delta is not None else timedelta(**kwargs)
+        if delta < timedelta(0):
+            raise ValueError("A clock cannot go backwards")
+        with self._lock:
+            self._now += delta
+            return self._now
+
+    def __repr__(self):
+        return f"ManualClock({self._now.isoformat()})"
+
+
+class CoarseClock:
+    """ datetime.now() cached for `resolution` seconds. Timestamps taken within one
+    tick are equal, and never more than `resolution` behind the wall clock """
+
+    def __init__(self, resolution=0.001, source=datetime.now, ticks=time.monotonic):
+        if resolution <= 0:
+            raise ValueError("Resolution must be positive")
+        self.resolution = resolution
+        self._source = source
+        self._ticks = ticks
+        self._now = source()
+        self._expires = ticks() + resolution
+
+    def __call__(self):
+        if self._ticks() < self._expires:
+            return self._now
+        # Racing threads may both refresh, which only costs an extra datetime.now()
+        now = self._source()
+        self._now = now
+        self._expires = self._ticks() + self.resolution
+        return now
+
+    def __repr__(self):
+        return f"CoarseClock(resolution={self.resolution})"
+
+
+SYSTEM_CLOCK = SystemClock()
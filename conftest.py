@@ -1,5 +1,6 @@
 import pytest
 import library_management_system as library
+from storage import SQLiteStorage
 
 
 @pytest.fixture
@@ -33,8 +34,13 @@ def sample_book():
     )
 
 
-@pytest.fixture
-def sample_libray_system():
-    """ Dado que um sistema de biblioteca foi criado com seus atributos """
+@pytest.fixture(params=["memory", "sqlite"])
+def sample_libray_system(request):
+    """ Dado que um sistema de biblioteca foi criado com seus atributos, em cada backend de armazenamento """
+
+    if request.param == "memory":
+        return library.LibrarySystem()
 
-    return library.LibrarySystem()
+    storage = SQLiteStorage()
+    request.addfinalizer(storage.close)
+    return library.LibrarySystem(storage=storage)
@@ -0,0 +1,108 @@
+""" DueQueue: ids ordered by a key, usually a date, with lazy deletion.
+
+LibrarySystem keeps active loans in one by due date and READY holds by pickup
+deadline; holds.HoldQueue orders the waiting holds of a book by priority.
+"""
+import heapq
+import itertools
+
+
+class DueQueue:
+    """ Min-heap of ids keyed by due date, e.g. active loans. Any orderable key works.
+
+    Returned or extended loans are invalidated lazily: `_due` holds the live heap
+    entry of every active loan and any other entry is skipped, then dropped when the
+    heap is rebuilt. Entries are told apart by their sequence number, so a loan
+    discarded and scheduled again for the same date is not found twice.
+    """
+
+    def __init__(self):
+        self._heap = []  # (due_date, sequence, record_id)
+        self._due = {}  # record_id -> its live heap entry
+        self._sequence = itertools.count()
+
+    def __len__(self):
+        return len(self._due)
+
+    def __contains__(self, record_id):
+        return record_id in self._due
+
+    def due_date(self, record_id):
+        entry = self._due.get(record_id)
+        return entry[0] if entry else None
+
+    def schedule(self, record_id, due_date):
+        entry = (due_date, next(self._sequence), record_id)
+        self._due[record_id] = entry
+        heapq.heappush(self._heap, entry)
+        self._maybe_compact()
+
+    def discard(self, record_id):
+        if self._due.pop(record_id, None) is None:
+            return False
+        self._maybe_compact()
+        return True
+
+    def pop(self):
+        """ Removes and returns the id due first, None when the queue is empty """
+        heap = self._heap
+        while heap:
+            entry = heapq.heappop(heap)
+            if self._due.get(entry[2]) is entry:
+                del self._due[entry[2]]
+                return entry[2]
+        return None
+
+    def _maybe_compact(self):
+        # Rebuild once stale entries outnumber live ones
+        if len(self._heap) > 64 and len(self._heap) > 2 * len(self._due):
+            self._heap = list(self._due.values())
+            heapq.heapify(self._heap)
+
+    def due_between(self, start=None, end=None):
+        """ Ids of active loans with start <= due_date < end, earliest first.
+        Only the part of the heap below `end` is visited """
+
+        heap = self._heap
+        found = []
+        stack = [0] if heap else []
+
+        while stack:
+            index = stack.pop()
+            due_date, sequence, record_id = heap[index]
+            if end is not None and due_date >= end:
+                continue  # Everything under this node is due later
+
+            for child in (2 * index + 1, 2 * index + 2):
+                if child < len(heap):
+                    stack.append(child)
+
+            if self._due.get(record_id) is not heap[index]:
+                continue
+            if start is None or due_date >= start:
+                found.append((due_date, sequence, record_id))
+
+        found.sort()
+        return [record_id for _, _, record_id in found]
+
+    def iter_due(self, start=None, end=None, copy=False):
+        """ Same as due_between, but yields the ids in order while walking the heap,
+        holding only the frontier of the walk. With copy=True it walks a copy, so the
+        queue may change meanwhile """
+        heap = list(self._heap) if copy else self._heap
+        return self._walk(heap, start, end)
+
+    def _walk(self, heap, start, end):
+        frontier = [(heap[0], 0)] if heap else []
+        while frontier:
+            entry, index = heapq.heappop(frontier)
+            due_date, _, record_id = entry
+            if end is not None and due_date >= end:
+                return  # The frontier holds the smallest entries left
+
+            for child in (2 * index + 1, 2 * index + 2):
+                if child < len(heap):
+                    heapq.heappush(frontier, (heap[child], child))
+
+            if self._due.get(record_id) is entry and (start is None or due_date >= start):
+                yield record_id
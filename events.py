@@ -0,0 +1,214 @@
+""" In-process change feed of a LibrarySystem.
+
+    log = system.enable_events(capacity=8192)
+    subscription = system.subscribe()
+    while True:
+        for event in subscription.poll(max_events=500, timeout=1.0):
+            ...
+
+Every change is published as a typed event (BookAdded, BookUpdated, StatusChanged,
+UserAdded, Borrowed, Returned, Extended, HoldReady) into a bounded ring buffer and numbered
+with a sequence number. Subscribers keep their own cursor and read in batches, so
+the writer never waits for them: publishing is an append under a short lock, and
+once the buffer is full the oldest event is overwritten. A subscriber that fell
+more than `capacity` events behind learns how many it missed (Subscription.missed,
+or a ValueError with strict=True) and should resync from the LibrarySystem itself.
+Subscription.lag tells a consumer how far behind it is before that happens.
+Buffered events are live objects that the garbage collector walks, so a larger
+ring makes every write a little slower; size it to a few seconds of changes.
+"""
+import threading
+
+
+class Event:
+    """ Base of the change events. `seq` is set when the event is published """
+
+    __slots__ = ("seq",)
+    fields = ()
+
+    @property
+    def kind(self):
+        return type(self).__name__
+
+    def to_dict(self):
+        return {"seq": self.seq, "kind": self.kind, **{field: getattr(self, field) for field in self.fields}}
+
+    def __repr__(self):
+        values = ", ".join(f"{field}={getattr(self, field)!r}" for field in self.fields)
+        return f"{self.kind}(seq={self.seq}, {values})"
+
+
+class BookAdded(Event):
+    __slots__ = fields = ("book_id", "isbn", "title", "author", "category")
+
+    def __init__(self, book_id, isbn, title, author, category):
+        self.seq = None
+        self.book_id = book_id
+        self.isbn = isbn
+        self.title = title
+        self.author = author
+        self.category = category
+
+
+class BookUpdated(Event):
+    __slots__ = fields = ("book_id", "changes")
+
+    def __init__(self, book_id, changes):
+        self.seq = None
+        self.book_id = book_id
+        self.changes = changes  # {field: new value}
+
+
+class StatusChanged(Event):
+    __slots__ = fields = ("book_id", "old_status", "new_status")
+
+    def __init__(self, book_id, old_status, new_status):
+        self.seq = None
+        self.book_id = book_id
+        self.old_status = old_status
+        self.new_status = new_status
+
+
+class UserAdded(Event):
+    __slots__ = fields = ("user_id", "name", "email", "role")
+
+    def __init__(self, user_id, name, email, role):
+        self.seq = None
+        self.user_id = user_id
+        self.name = name
+        self.email = email
+        self.role = role
+
+
+class Borrowed(Event):
+    __slots__ = fields = ("record_id", "book_id", "user_id", "due_date")
+
+    def __init__(self, record_id, book_id, user_id, due_date):
+        self.seq = None
+        self.record_id = record_id
+        self.book_id = book_id
+        self.user_id = user_id
+        self.due_date = due_date
+
+
+class Returned(Event):
+    __slots__ = fields = ("record_id", "book_id", "user_id", "return_date")
+
+    def __init__(self, record_id, book_id, user_id, return_date):
+        self.seq = None
+        self.record_id = record_id
+        self.book_id = book_id
+        self.user_id = user_id
+        self.return_date = return_date
+
+
+class Extended(Event):
+    __slots__ = fields = ("record_id", "book_id", "user_id", "due_date")
+
+    def __init__(self, record_id, book_id, user_id, due_date):
+        self.seq = None
+        self.record_id = record_id
+        self.book_id = book_id
+        self.user_id = user_id
+        self.due_date = due_date
+
+
+class HoldReady(Event):
+    """ A returned book is reserved for the holder until `expiry_date`, see holds.py """
+
+    __slots__ = fields = ("hold_id", "book_id", "user_id", "expiry_date")
+
+    def __init__(self, hold_id, book_id, user_id, expiry_date):
+        self.seq = None
+        self.hold_id = hold_id
+        self.book_id = book_id
+        self.user_id = user_id
+        self.expiry_date = expiry_date
+
+
+class EventLog:
+    """ Bounded ring buffer of the last `capacity` events """
+
+    def __init__(self, capacity=8192):
+        if capacity < 1:
+            raise ValueError("An event log needs room for at least one event")
+        self.capacity = capacity
+        self._buffer = [None] * capacity
+        self._next = 0  # sequence number of the next event
+        self._waiting = 0  # subscribers blocked in poll
+        # Publishers take the bare lock, cheaper to enter than the condition
+        self._lock = threading.Lock()
+        self._arrived = threading.Condition(self._lock)
+
+    @property
+    def next_seq(self):
+        return self._next
+
+    @property
+    def oldest_seq(self):
+        """ Sequence number of the oldest event still buffered """
+        return max(0, self._next - self.capacity)
+
+    def publish(self, event):
+        with self._lock:
+            event.seq = self._next
+            self._buffer[self._next % self.capacity] = event
+            self._next += 1
+            if self._waiting:
+                self._arrived.notify_all()
+
+    def read(self, cursor, max_events, timeout=0):
+        """ (events from `cursor` on, events overwritten before `cursor` could read them).
+        Waits up to `timeout` seconds, None for ever, when nothing is there yet """
+        with self._arrived:
+            if cursor >= self._next and timeout != 0:
+                self._waiting += 1
+                try:
+                    self._arrived.wait_for(lambda: cursor < self._next, timeout)
+                finally:
+                    self._waiting -= 1
+
+            oldest = self.oldest_seq
+            missed = max(0, oldest - cursor)
+            start = cursor + missed
+            end = min(self._next, start + max_events)
+            buffer, capacity = self._buffer, self.capacity
+            return [buffer[seq % capacity] for seq in range(start, end)], missed
+
+    def subscribe(self, from_seq=None, strict=False):
+        """ A Subscription reading from `from_seq`, by default only events published from now on """
+        with self._arrived:
+            start = self._next if from_seq is None else from_seq
+        return Subscription(self, start, strict)
+
+
+class Subscription:
+    """ A reader's cursor into an EventLog """
+
+    def __init__(self, log, position, strict=False):
+        self.log = log
+        self.position = position  # sequence number of the next event to read
+        self.missed = 0  # events overwritten before this subscriber read them
+        self.strict = strict
+
+    @property
+    def lag(self):
+        """ Events published but not read yet """
+        return max(0, self.log.next_seq - self.position)
+
+    def poll(self, max_events=1000, timeout=0):
+        """ The next batch of at most `max_events` events, waiting up to `timeout`
+        seconds (None for ever) for one to arrive. With strict=True, falling
+        behind the buffer raises ValueError instead; the following poll resumes
+        at the oldest event still buffered """
+        if max_events < 1:
+            raise ValueError("max_events must be a positive integer")
+        events, missed = self.log.read(self.position, max_events, timeout)
+        if missed:
+            self.missed += missed
+            self.position += missed
+            if self.strict:
+                raise ValueError(f"Subscriber fell behind: {missed} events were overwritten")
+        if events:
+            self.position = events[-1].seq + 1
+        return events
@@ -0,0 +1,240 @@
+""" Bulk export of books, users and borrow records.
+
+Rows hold the same fields as the entities' to_dict(), but are formatted straight
+into text instead of going through a dict and json.dumps per object:
+
+    ndjson   one JSON object per line
+    csv      a header line, then one line per row; booleans as true/false,
+             None as an empty field, borrowed_books joined with ";"
+    columns  one JSON object mapping each field to the array of its values
+
+Timestamps are formatted once per distinct value (bulk-loaded data shares a few
+of them), "now" for is_overdue is read once per export, and output is written in
+chunks through a reused buffer. The target is a path, a text or binary file, or
+a socket.
+"""
+import io
+import re
+import json
+import tempfile
+from json.encoder import encode_basestring
+
+
+FORMATS = ("ndjson", "csv", "columns")
+
+FIELDS = {
+    "books": ("id", "title", "author", "isbn", "publication_year", "category", "status",
+              "added_date", "last_updated"),
+    "users": ("id", "name", "email", "role", "joined_date", "active", "borrowed_books", "borrowed_count"),
+    "borrow_records": ("id", "book_id", "user_id", "borrow_date", "due_date", "return_date",
+                       "is_returned", "extended", "is_overdue"),
+}
+
+CHUNK_ROWS = 4096
+STAMP_CACHE_SIZE = 65536
+
+JSON_BOOL = ("false", "true")
+CSV_SPECIAL = re.compile(r'[",\r\n]')
+
+
+def _json(value):
+    """ JSON text of a user-supplied field, normally a str """
+    if value.__class__ is str:
+        return encode_basestring(value)
+    return json.dumps(value, ensure_ascii=False)
+
+
+def _csv(value):
+    """ CSV field of a user-supplied value, quoted only when it has to be """
+    if value is None:
+        return ""
+    text = value if value.__class__ is str else str(value)
+    if CSV_SPECIAL.search(text):
+        return '"%s"' % text.replace('"', '""')
+    return text
+
+
+class _Timestamps(dict):
+    """ datetime -> isoformat(), for the values seen most recently """
+
+    FORMAT = "%s"
+
+    def __missing__(self, moment):
+        if len(self) >= STAMP_CACHE_SIZE:
+            self.clear()
+        text = self[moment] = self.FORMAT % moment.isoformat()
+        return text
+
+
+class _JSONTimestamps(_Timestamps):
+    """ datetime -> isoformat() as a JSON string """
+
+    FORMAT = '"%s"'
+
+
+# JSON fragments of each row, in FIELDS order
+
+def _book_json(book, stamps, now):
+    year = book.publication_year
+    return (encode_basestring(book.id), _json(book.title), _json(book.author), _json(book.isbn),
+            str(year) if year.__class__ is int else _json(year), _json(book.category),
+            encode_basestring(book.status.value),
+            stamps[book.added_date], stamps[book.last_updated])
+
+
+def _user_json(user, stamps, now):
+    return (encode_basestring(user.id), _json(user.name), _json(user.email), encode_basestring(user.role.value),
+            stamps[user.joined_date], JSON_BOOL[bool(user.active)],
+            "[%s]" % ",".join(map(_json, user.borrowed_books)), str(len(user.borrowed_books)))
+
+
+def _record_json(record, stamps, now):
+    due_date = record.due_date
+    return_date = record.return_date
+    returned = bool(record.is_returned)
+    return (encode_basestring(record.id), encode_basestring(record.book_id), encode_basestring(record.user_id),
+            stamps[record.borrow_date], stamps[due_date],
+            "null" if return_date is None else stamps[return_date],
+            JSON_BOOL[returned], JSON_BOOL[bool(record.extended)], JSON_BOOL[not returned and now > due_date])
+
+
+# CSV fields of each row; ids, enum values and timestamps never need quoting
+
+def _book_csv(book, stamps, now):
+    year = book.publication_year
+    return (book.id, _csv(book.title), _csv(book.author), _csv(book.isbn),
+            year if year.__class__ is int else _csv(year), _csv(book.category),
+            book.status.value, stamps[book.added_date], stamps[book.last_updated])
+
+
+def _user_csv(user, stamps, now):
+    return (user.id, _csv(user.name), _csv(user.email), user.role.value, stamps[user.joined_date],
+            JSON_BOOL[bool(user.active)], _csv(";".join(user.borrowed_books)), len(user.borrowed_books))
+
+
+def _record_csv(record, stamps, now):
+    due_date = record.due_date
+    return_date = record.return_date
+    returned = bool(record.is_returned)
+    return (record.id, record.book_id, record.user_id, stamps[record.borrow_date], stamps[due_date],
+            "" if return_date is None else stamps[return_date],
+            JSON_BOOL[returned], JSON_BOOL[bool(record.extended)], JSON_BOOL[not returned and now > due_date])
+
+
+ROW_BUILDERS = {
+    "books": (_book_json, _book_csv),
+    "users": (_user_json, _user_csv),
+    "borrow_records": (_record_json, _record_csv),
+}
+
+
+class _Sink:
+    """ Writes text to a path, a text or binary file, or a socket """
+
+    def __init__(self, target):
+        self._owned = None
+        if isinstance(target, (str, bytes)) or hasattr(target, "__fspath__"):
+            target = self._owned = open(target, "w", encoding="utf-8", newline="")
+        if isinstance(target, io.TextIOBase):
+            self.write = target.write
+        elif hasattr(target, "sendall"):
+            self.write = lambda text: target.sendall(text.encode("utf-8"))
+        else:
+            self.write = lambda text: target.write(text.encode("utf-8"))
+
+    def close(self):
+        if self._owned is not None:
+            self._owned.close()
+
+
+def _write_lines(sink, rows, template):
+    buffer = []
+    count = 0
+    for row in rows:
+        buffer.append(template % row)
+        if len(buffer) == CHUNK_ROWS:
+            sink.write("".join(buffer))
+            count += len(buffer)
+            buffer.clear()
+    sink.write("".join(buffer))
+    return count + len(buffer)
+
+
+def _write_ndjson(sink, rows, fields):
+    return _write_lines(sink, rows, "{" + ",".join('"%s":%%s' % field for field in fields) + "}\n")
+
+
+def _write_csv(sink, rows, fields):
+    sink.write(",".join(fields) + "\n")
+    return _write_lines(sink, rows, ",".join("%s" for _ in fields) + "\n")
+
+
+def _write_columns(sink, rows, fields):
+    # Each column goes to its own temporary file, so memory stays bounded by one chunk
+    columns = [tempfile.TemporaryFile("w+", encoding="utf-8") for _ in fields]
+    try:
+        buffers = [[] for _ in fields]
+        count = 0
+
+        def spill():
+            if not buffers[0]:
+                return
+            separator = "," if count > len(buffers[0]) else ""
+            for column, buffer in zip(columns, buffers):
+                column.write(separator + ",".join(buffer))
+                buffer.clear()
+
+        for row in rows:
+            for buffer, value in zip(buffers, row):
+                buffer.append(value)
+            count += 1
+            if len(buffers[0]) == CHUNK_ROWS:
+                spill()
+        spill()
+
+        separator = "{"
+        for field, column in zip(fields, columns):
+            sink.write('%s"%s":[' % (separator, field))
+            column.seek(0)
+            for chunk in iter(lambda: column.read(1 << 16), ""):
+                sink.write(chunk)
+            sink.write("]")
+            separator = ","
+        sink.write("}\n")
+        return count
+    finally:
+        for column in columns:
+            column.close()
+
+
+WRITERS = {"ndjson": _write_ndjson, "csv": _write_csv, "columns": _write_columns}
+
+
+def export(system, target, kind="books", format="ndjson"):
+    """ Writes every entity of `kind` ("books", "users" or "borrow_records") to
+    `target` and returns the number of rows """
+    if kind not in FIELDS:
+        raise ValueError(f"Kind must be one of: {', '.join(FIELDS)}")
+    if format not in WRITERS:
+        raise ValueError(f"Format must be one of: {', '.join(FORMATS)}")
+
+    # The cursors are read through the class, so enabled metrics count the export only
+    cls = type(system)
+    if kind == "books":
+        entities = cls.iter_books(system)
+    elif kind == "users":
+        entities = cls.iter_users(system, active_only=False)
+    else:
+        entities = cls.iter_borrow_history(system)
+
+    json_row, plain_row = ROW_BUILDERS[kind]
+    build = plain_row if format == "csv" else json_row
+    stamps = _Timestamps() if format == "csv" else _JSONTimestamps()
+    now = system.clock()
+    rows = (build(entity, stamps, now) for entity in entities)
+
+    sink = _Sink(target)
+    try:
+        return WRITERS[format](sink, rows, FIELDS[kind])
+    finally:
+        sink.close()
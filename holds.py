@@ -0,0 +1,91 @@
+""" Holds: users queueing for a book that is out.
+
+Each book with holds has a HoldQueue, a heap ordered by (role priority, arrival),
+so holders of the same priority are served first come, first served. When the
+book comes back the first holder's hold turns READY and the book is RESERVED for
+them until the pickup deadline; an uncollected hold expires and the next holder
+gets the book. Placing, cancelling and handing over a hold are O(log n) in the
+holds of that book.
+
+Holds live in memory only: they are not saved with snapshots or the journal.
+"""
+import uuid
+from enum import Enum
+
+from clock import SYSTEM_CLOCK
+from due_queue import DueQueue
+
+
+class HoldStatus(Enum):
+    WAITING = "waiting"
+    READY = "ready"
+    FULFILLED = "fulfilled"
+    CANCELLED = "cancelled"
+    EXPIRED = "expired"
+
+
+class Hold:
+    __slots__ = ("id", "book_id", "user_id", "priority", "placed_date", "ready_date", "expiry_date", "status")
+
+    clock = SYSTEM_CLOCK  # used when no placed_date is given, see clock.py
+
+    def __init__(self, book_id, user_id, priority=0, placed_date=None, hold_id=None):
+        self.id = hold_id or str(uuid.uuid4())
+        self.book_id = book_id
+        self.user_id = user_id
+        self.priority = priority  # lower is served first
+        self.placed_date = placed_date or type(self).clock()
+        self.ready_date = None
+        self.expiry_date = None  # pickup deadline once READY
+        self.status = HoldStatus.WAITING
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "book_id": self.book_id,
+            "user_id": self.user_id,
+            "priority": self.priority,
+            "placed_date": self.placed_date.isoformat(),
+            "ready_date": self.ready_date.isoformat() if self.ready_date else None,
+            "expiry_date": self.expiry_date.isoformat() if self.expiry_date else None,
+            "status": self.status.value,
+        }
+
+
+class HoldQueue:
+    """ Waiting holds of one book, by (priority, arrival).
+
+    A DueQueue keyed by priority orders the hold ids: its sequence numbers keep
+    arrival order among equal priorities and it drops cancelled holds lazily.
+    """
+
+    __slots__ = ("_queue", "_holds")
+
+    def __init__(self):
+        self._queue = DueQueue()
+        self._holds = {}  # hold_id -> waiting Hold
+
+    def __len__(self):
+        return len(self._holds)
+
+    def __contains__(self, hold_id):
+        return hold_id in self._holds
+
+    def push(self, hold):
+        self._holds[hold.id] = hold
+        self._queue.schedule(hold.id, hold.priority)
+
+    def pop(self):
+        """ The next waiting hold, None when there is none """
+        hold_id = self._queue.pop()
+        return None if hold_id is None else self._holds.pop(hold_id)
+
+    def discard(self, hold):
+        if self._holds.pop(hold.id, None) is None:
+            return False
+        self._queue.discard(hold.id)
+        return True
+
+    def ordered(self):
+        """ The waiting holds, next to be served first """
+        return [self._holds[hold_id] for hold_id in self._queue.due_between()]
@@ -0,0 +1,332 @@
+""" Write-ahead journal for LibrarySystem.
+
+Every change to a book, user or borrow record appends the new state of that entity
+to the current journal segment. Entries are framed as (length, crc32) + a compact
+JSON array, so a torn write at the end of a segment is detected and ignored on
+recovery. A background thread writes and fsyncs pending entries in groups, so a
+checkout never waits for the disk unless the journal is opened with durable=True,
+in which case LibrarySystem waits, once an operation is done and its locks are
+released, for the group fsync that covers the operation's last entry. Concurrent
+operations thus share fsyncs instead of queueing for one each.
+
+A journal directory holds:
+    MANIFEST         {"snapshot": name or null, "first_segment": n}
+    snapshot.<n>     snapshot covering every segment below first_segment
+    journal.<n>      journal segments, replayed in order on top of the snapshot
+"""
+import os
+import json
+import zlib
+import struct
+import threading
+
+from borrow_log import to_epoch, from_epoch
+from library_management_system import Book, BookStatus, BorrowRecord, User, UserRole
+
+
+FRAME = struct.Struct("<II")  # payload length, crc32 of the payload
+
+PUT_BOOK = "b"
+PUT_USER = "u"
+PUT_RECORD = "r"
+DELETE_BOOK = "B"
+DELETE_USER = "U"
+DELETE_RECORD = "R"
+
+
+def _micros(moment):
+    return None if moment is None else to_epoch(moment)
+
+
+def _moment(micros):
+    return None if micros is None else from_epoch(micros)
+
+
+def encode(entry):
+    payload = json.dumps(entry, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    return FRAME.pack(len(payload), zlib.crc32(payload)) + payload
+
+
+def read_entries(path):
+    """ Yields the entries of a segment, stopping at the first torn or corrupt frame """
+    with open(path, "rb") as file:
+        data = file.read()
+
+    offset = 0
+    while offset + FRAME.size <= len(data):
+        length, checksum = FRAME.unpack_from(data, offset)
+        payload = data[offset + FRAME.size:offset + FRAME.size + length]
+        if len(payload) < length or zlib.crc32(payload) != checksum:
+            return
+        yield json.loads(payload)
+        offset += FRAME.size + length
+
+
+class Journal:
+    """ Appends entries to one segment file with batched (group) fsync """
+
+    def __init__(self, path, flush_interval=0.005, durable=False):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.durable = durable
+        self._file = open(path, "ab")
+        self._condition = threading.Condition()
+        self._pending = []
+        self._appended = 0  # sequence number of the last appended entry
+        self._flushed = 0  # sequence number of the last entry known to be on disk
+        self._flush_requested = False
+        self._closed = False
+        self._error = None
+        self._local = threading.local()  # sequence number of the last entry each thread appended
+        self._thread = threading.Thread(target=self._run, name="library-journal", daemon=True)
+        self._thread.start()
+
+    def append(self, entry):
+        """ Queues `entry` and returns its sequence number, without waiting for the disk """
+        frame = encode(entry)
+        with self._condition:
+            if self._closed:
+                raise ValueError("Journal is closed")
+            self._pending.append(frame)
+            self._appended += 1
+            sequence = self._appended
+        self._local.sequence = sequence
+        return sequence
+
+    def wait(self, sequence=None):
+        """ Blocks until the entry `sequence`, by default the last one this thread
+        appended, is on disk. Waiters that arrive together share one fsync """
+        if sequence is None:
+            sequence = getattr(self._local, "sequence", 0)
+        with self._condition:
+            if self._flushed >= sequence:
+                return
+            self._flush_requested = True
+            self._condition.notify_all()
+            self._wait_for(sequence)
+
+    def sync(self):
+        """ Blocks until every entry appended so far is on disk """
+        with self._condition:
+            self._flush_requested = True
+            self._condition.notify_all()
+            self._wait_for(self._appended)
+
+    def _wait_for(self, sequence):
+        while self._flushed < sequence and self._error is None:
+            self._condition.wait()
+        if self._error is not None:
+            raise self._error
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._pending and not self._closed:
+                    self._condition.wait()
+                if not self._pending and self._closed:
+                    return
+                if not self._flush_requested and not self._closed:
+                    # Give concurrent writers a moment to join this group
+                    self._condition.wait(self.flush_interval)
+                frames, self._pending = self._pending, []
+                sequence = self._appended
+                self._flush_requested = False
+
+            try:
+                self._file.write(b"".join(frames))
+                self._file.flush()
+                os.fsync(self._file.fileno())
+            except OSError as error:
+                with self._condition:
+                    self._error = error
+                    self._condition.notify_all()
+                return
+
+            with self._condition:
+                self._flushed = sequence
+                self._condition.notify_all()
+
+    def close(self):
+        with self._condition:
+            if self._closed:
+                return
+            self._closed = True
+            self._condition.notify_all()
+        self._thread.join()
+        self._file.close()
+        if self._error is not None:
+            raise self._error
+
+    # Entry builders, called by LibrarySystem at each mutation point
+
+    def put_book(self, book):
+        return self.append([PUT_BOOK, book.id, book.title, book.author, book.isbn, book.publication_year,
+                     book.category, book.status.value, _micros(book.added_date), _micros(book.last_updated)])
+
+    def put_user(self, user):
+        return self.append([PUT_USER, user.id, user.name, user.email, user.role.value,
+                     _micros(user.joined_date), user.active])
+
+    def put_record(self, record):
+        return self.append([PUT_RECORD, record.id, record.book_id, record.user_id, _micros(record.borrow_date),
+                     _micros(record.due_date), _micros(record.return_date), record.is_returned, record.extended])
+
+    def delete_book(self, book_id):
+        return self.append([DELETE_BOOK, book_id])
+
+    def delete_user(self, user_id):
+        return self.append([DELETE_USER, user_id])
+
+    def delete_record(self, record_id):
+        return self.append([DELETE_RECORD, record_id])
+
+
+def apply_entry(system, entry):
+    """ Replays one journal entry on `system` (which must not be journaling itself) """
+    kind = entry[0]
+
+    if kind == PUT_BOOK:
+        _, book_id, title, author, isbn, year, category, status, added_date, last_updated = entry
+        book = system.books.get(book_id)
+        if book is None or book.isbn != isbn:
+            book = Book(title, author, isbn, year, category, book_id, _moment(added_date))
+            system.books[book_id] = book
+        elif (book.title, book.author, book.publication_year, book.category) != (title, author, year, category):
+            system.update_book(book_id, title=title, author=author, publication_year=year, category=category)
+        if book.status.value != status:
+            book.update_status(BookStatus(status))
+        book.last_updated = _moment(last_updated)
+
+    elif kind == PUT_USER:
+        _, user_id, name, email, role, joined_date, active = entry
+        user = system.users.get(user_id)
+        if user is None or user.email != email:
+            borrowed_books = user.borrowed_books if user is not None else []
+            user = User(name, email, UserRole(role), user_id, _moment(joined_date))
+            user.borrowed_books = borrowed_books
+            system.users[user_id] = user
+        user.name = name
+        user.role = UserRole(role)
+        if active and not user.active:
+            user.reactivate()
+        elif not active and user.active:
+            user.deactivate()
+
+    elif kind == PUT_RECORD:
+        _, record_id, book_id, user_id, borrow_date, due_date, return_date, is_returned, extended = entry
+        record = system.borrow_records.get(record_id)
+        if record is None:
+            record = BorrowRecord(book_id, user_id, record_id=record_id, borrow_date=_moment(borrow_date))
+            record.due_date = _moment(due_date)
+            record.return_date = _moment(return_date)
+            record.is_returned = is_returned
+            record.extended = extended
+            system.borrow_records[record_id] = record
+            if not is_returned and user_id in system.users:
+                system.users[user_id].borrowed_books.add(record_id)
+            return
+
+        was_returned = record.is_returned
+        record.due_date = _moment(due_date)
+        record.return_date = _moment(return_date)
+        record.is_returned = is_returned
+        record.extended = extended
+        system._sync_loan(record, was_returned)
+
+    elif kind == DELETE_BOOK:
+        system.books.pop(entry[1], None)
+    elif kind == DELETE_USER:
+        system.users.pop(entry[1], None)
+    elif kind == DELETE_RECORD:
+        system.borrow_records.pop(entry[1], None)
+    else:
+        raise ValueError(f"Unknown journal entry {kind!r}")
+
+
+class JournalDirectory:
+    MANIFEST = "MANIFEST"
+
+    def __init__(self, path):
+        self.path = os.fspath(path)
+        os.makedirs(self.path, exist_ok=True)
+        self._compaction_lock = threading.Lock()
+
+    def _file(self, name):
+        return os.path.join(self.path, name)
+
+    def manifest(self):
+        try:
+            with open(self._file(self.MANIFEST)) as file:
+                return json.load(file)
+        except FileNotFoundError:
+            return {"snapshot": None, "first_segment": 0}
+
+    def _write_manifest(self, manifest):
+        temporary = self._file(self.MANIFEST + ".tmp")
+        with open(temporary, "w") as file:
+            json.dump(manifest, file)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temporary, self._file(self.MANIFEST))
+
+    def segments(self, first=0, last=None):
+        numbers = []
+        for name in os.listdir(self.path):
+            prefix, _, number = name.partition(".")
+            if prefix == "journal" and number.isdigit():
+                number = int(number)
+                if number >= first and (last is None or number <= last):
+                    numbers.append(number)
+        return sorted(numbers)
+
+    def segment_path(self, number):
+        return self._file(f"journal.{number:08d}")
+
+    def is_empty(self):
+        manifest = self.manifest()
+        return manifest["snapshot"] is None and not self.segments(manifest["first_segment"])
+
+    def _replay(self, system_class, manifest, last=None):
+        from snapshot import load_snapshot
+
+        if manifest["snapshot"] is not None:
+            system = load_snapshot(self._file(manifest["snapshot"]), system_class)
+        else:
+            system = system_class()
+
+        for number in self.segments(manifest["first_segment"], last):
+            for entry in read_entries(self.segment_path(number)):
+                apply_entry(system, entry)
+        return system
+
+    def recover(self, system_class):
+        """ Latest snapshot plus every journal segment written after it """
+        return self._replay(system_class, self.manifest())
+
+    def initialize(self, system):
+        """ Makes the current state of a fresh system the base of this directory """
+        if not self.is_empty():
+            raise ValueError(f"{self.path} already holds a journaled library, use LibrarySystem.recover")
+        if system.books or system.users or system.borrow_records:
+            system.save(self._file("snapshot.0"))
+            self._write_manifest({"snapshot": "snapshot.0", "first_segment": 0})
+
+    def open_segment(self, **options):
+        """ Starts a new segment, so appends never follow a torn tail left by a crash """
+        existing = self.segments()
+        number = existing[-1] + 1 if existing else 0
+        return number, Journal(self.segment_path(number), **options)
+
+    def compact(self, system_class, up_to):
+        """ Folds the snapshot and the segments up to `up_to` into a new snapshot """
+        with self._compaction_lock:
+            manifest = self.manifest()
+            system = self._replay(system_class, manifest, last=up_to)
+            name = f"snapshot.{up_to + 1}"
+            system.save(self._file(name))
+            self._write_manifest({"snapshot": name, "first_segment": up_to + 1})
+
+            for number in self.segments(manifest["first_segment"], up_to):
+                os.remove(self.segment_path(number))
+            if manifest["snapshot"] not in (None, name):
+                os.remove(self._file(manifest["snapshot"]))
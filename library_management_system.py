@@ -1,6 +1,21 @@
+import os
 import uuid
+import bisect
+import heapq
+import functools
+import itertools
+import threading
+import contextlib
 from enum import Enum
-from datetime import datetime, timedelta
+from datetime import timedelta
+
+from clock import SYSTEM_CLOCK
+from due_queue import DueQueue
+from events import (BookAdded, BookUpdated, Borrowed, EventLog, Extended, HoldReady, Returned, StatusChanged,
+                    UserAdded)
+from holds import Hold, HoldQueue, HoldStatus
+from query_cache import QueryCache
+from search_index import SearchIndex
 
 
 class BookStatus(Enum):
@@ -8,6 +23,7 @@ class BookStatus(Enum):
     BORROWED = "borrowed"
     MAINTENANCE = "maintenance"
     LOST = "lost"
+    RESERVED = "reserved"  # back, waiting for the holder to collect it, see holds.py
 
 class UserRole(Enum):
     ADMIN = "admin"
@@ -15,22 +31,31 @@ class UserRole(Enum):
     MEMBER = "member"
 
 class Book:
-    def __init__( self, title, author, isbn, publication_year, category ):
-        self.id = str(uuid.uuid4())
+    __slots__ = ("id", "title", "author", "isbn", "publication_year", "category", "status",
+                 "added_date", "last_updated", "_owner", "__weakref__")
+
+    clock = SYSTEM_CLOCK  # used when the book has no LibrarySystem, see clock.py
+
+    def __init__( self, title, author, isbn, publication_year, category, book_id=None, added_date=None ):
+        self.id = book_id or str(uuid.uuid4())
         self.title = title
         self.author = author
         self.isbn = isbn
         self.publication_year = publication_year
         self.category = category
         self.status = BookStatus.AVAILABLE
-        self.added_date = datetime.now()
-        self.last_updated = datetime.now()
+        self.added_date = added_date or type(self).clock()
+        self.last_updated = self.added_date
+        self._owner = None  # LibrarySystem holding this book, told about status changes
 
     def update_status( self, new_status ):
         if not isinstance(new_status, BookStatus):
             raise TypeError("Status must be a BookStatus enum")
+        old_status = self.status
         self.status = new_status
-        self.last_updated = datetime.now()
+        self.last_updated = (self._owner.clock if self._owner is not None else type(self).clock)()
+        if self._owner is not None:
+            self._owner._book_status_changed(self, old_status)
         return True
 
     def to_dict( self ):
@@ -47,28 +72,119 @@ class Book:
         }
 
 
+class ActiveLoans:
+    """ Ids of a user's open borrow records, in the order they were lent.
+
+    Backed by a dict, so adding, removing and membership tests are O(1) however
+    many loans an account holds. It compares equal to a list of the same ids """
+
+    __slots__ = ("_ids", "_next")
+
+    def __init__(self, record_ids=()):
+        self._ids = {}  # record_id -> sequence number, in insertion order
+        self._next = 0
+        for record_id in record_ids:
+            self.add(record_id)
+
+    def add(self, record_id):
+        if record_id not in self._ids:
+            self._ids[record_id] = self._next
+            self._next += 1
+
+    append = add
+
+    def remove(self, record_id):
+        """ Removes `record_id` and returns its position for `restore` """
+        try:
+            return self._ids.pop(record_id)
+        except KeyError:
+            raise ValueError(f"{record_id} is not an active loan") from None
+
+    def discard(self, record_id):
+        self._ids.pop(record_id, None)
+
+    def position(self, record_id):
+        """ Position of an open loan, None if `record_id` is not one """
+        return self._ids.get(record_id)
+
+    def restore(self, record_id, position):
+        """ Puts back a removed loan where it was. Only rollbacks need this, so
+        reordering the rest costs O(n) when it is not the newest loan """
+        self._ids[record_id] = position
+        if any(other > position for other in self._ids.values()):
+            self._ids = dict(sorted(self._ids.items(), key=lambda item: item[1]))
+
+    def page(self, offset=0, limit=None):
+        stop = None if limit is None else offset + limit
+        return list(itertools.islice(self._ids, offset, stop))
+
+    def __contains__(self, record_id):
+        return record_id in self._ids
+
+    def __iter__(self):
+        return iter(self._ids)
+
+    def __len__(self):
+        return len(self._ids)
+
+    def __eq__(self, other):
+        if isinstance(other, ActiveLoans):
+            return list(self._ids) == list(other._ids)
+        if isinstance(other, (list, tuple)):
+            return list(self._ids) == list(other)
+        return NotImplemented
+
+    __hash__ = None
+
+    def __repr__(self):
+        return f"ActiveLoans({list(self._ids)!r})"
+
+
 class User:
-    def __init__( self, name, email, role=UserRole.MEMBER ):
-        self.id = str(uuid.uuid4())
+    __slots__ = ("id", "name", "email", "role", "joined_date", "active", "_loans", "_owner", "__weakref__")
+
+    clock = SYSTEM_CLOCK
+
+    def __init__( self, name, email, role=UserRole.MEMBER, user_id=None, joined_date=None ):
+        self.id = user_id or str(uuid.uuid4())
         self.name = name
         self.email = email
         self.role = role
-        self.joined_date = datetime.now()
+        self.joined_date = joined_date or type(self).clock()
         self.active = True
-        self.borrowed_books = []  # List of BorrowRecord IDs
+        self._loans = ActiveLoans()  # ids of open BorrowRecords
+        self._owner = None  # LibrarySystem holding this user, told about (de)activation
 
-    def can_borrow(self, max_books=3):
-        return len(self.borrowed_books) <= max_books and self.active
+    @property
+    def borrowed_books(self):
+        return self._loans
+
+    @borrowed_books.setter
+    def borrowed_books(self, record_ids):
+        self._loans = record_ids if isinstance(record_ids, ActiveLoans) else ActiveLoans(record_ids)
+
+    def can_borrow(self, max_books=3, count=1):
+        """ Whether `count` more books can be lent without going over `max_books`
+        (None for no limit) """
+        if not self.active:
+            return False
+        return max_books is None or len(self._loans) + count <= max_books
 
     def deactivate(self):
         self.active = False
+        if self._owner is not None:
+            self._owner._user_changed(self)
         return True
 
     def reactivate(self):
         self.active = True
+        if self._owner is not None:
+            self._owner._user_changed(self)
         return True
 
-    def to_dict(self):
+    def to_dict(self, loans_offset=0, loans_limit=None):
+        """ `loans_limit` caps the ids listed in borrowed_books, for accounts holding
+        many loans; borrowed_count always has the total """
         return {
             "id": self.id,
             "name": self.name,
@@ -76,40 +192,50 @@ class User:
             "role": self.role.value,
             "joined_date": self.joined_date.isoformat(),
             "active": self.active,
-            "borrowed_books": self.borrowed_books
+            "borrowed_books": self._loans.page(loans_offset, loans_limit),
+            "borrowed_count": len(self._loans)
         }
 
 
 class BorrowRecord:
-    def __init__(self, book_id, user_id, borrow_days=14):
-        self.id = str(uuid.uuid4())
+    __slots__ = ("id", "book_id", "user_id", "borrow_date", "due_date", "return_date", "is_returned", "extended",
+                 "_owner", "__weakref__")
+
+    clock = SYSTEM_CLOCK  # used when the record has no LibrarySystem and no `now` is given, see clock.py
+
+    def __init__(self, book_id, user_id, borrow_days=14, record_id=None, borrow_date=None):
+        self.id = record_id or str(uuid.uuid4())
         self.book_id = book_id
         self.user_id = user_id
 
-        self.borrow_date = datetime.now()
+        self.borrow_date = borrow_date or type(self).clock()
         self.due_date = self.borrow_date + timedelta(days=borrow_days)
         self.return_date = None
         self.is_returned = False
         self.extended = False
+        self._owner = None  # LibrarySystem holding this record, whose clock it reads
 
-    def return_book(self):
+    def _now(self):
+        return (self._owner.clock if self._owner is not None else type(self).clock)()
+
+    def return_book(self, now=None):
         if self.is_returned:
             return False
-        self.return_date = datetime.now()
+        self.return_date = now or self._now()
         self.is_returned = True
         return True
 
-    def extend_borrow(self, additional_days=7):
+    def extend_borrow(self, additional_days=7, now=None):
         """ Não é possivel extender o emprestimo se o livro já foi devolvido ou se o prazo já passou """
 
-        if self.extended or self.is_returned or datetime.now() > self.due_date:
+        if self.extended or self.is_returned or (now or self._now()) > self.due_date:
             return False
         self.due_date += timedelta(days=additional_days)
         self.extended = True
         return True
 
-    def is_overdue(self):
-        return not self.is_returned and datetime.now() > self.due_date
+    def is_overdue(self, now=None):
+        return not self.is_returned and (now or self._now()) > self.due_date
 
     def to_dict(self):
         return {
@@ -125,29 +251,828 @@ class BorrowRecord:
         }
 
 
-class LibrarySystem:
+class _Collection(dict):
+    """ dict that tells its owner when entries come and go, so secondary indexes stay consistent
+    even when callers write to `books` / `users` directly """
+
+    def __init__(self, on_add, on_remove):
+        super().__init__()
+        self._on_add = on_add
+        self._on_remove = on_remove
+
+    def __setitem__(self, key, value):
+        if dict.__contains__(self, key):
+            self._on_remove(dict.__getitem__(self, key))
+        dict.__setitem__(self, key, value)
+        self._on_add(value)
+
+    def __delitem__(self, key):
+        value = dict.pop(self, key)
+        self._on_remove(value)
+
+    def pop(self, key, *default):
+        if not dict.__contains__(self, key):
+            return dict.pop(self, key, *default)
+        value = dict.pop(self, key)
+        self._on_remove(value)
+        return value
+
+    def popitem(self):
+        key, value = dict.popitem(self)
+        self._on_remove(value)
+        return key, value
+
+    def setdefault(self, key, default=None):
+        if not dict.__contains__(self, key):
+            self[key] = default
+        return dict.__getitem__(self, key)
+
+    def update(self, *args, **kwargs):
+        for key, value in dict(*args, **kwargs).items():
+            self[key] = value
+
+    def clear(self):
+        for key in list(dict.keys(self)):
+            del self[key]
+
+    def put_many(self, values):
+        """ Stores new entities without telling the owner, which indexes them in bulk """
+        for value in values:
+            dict.__setitem__(self, value.id, value)
+
+    def persist(self, value):
+        """ Called after `value` changed in place. The dict holds the object itself,
+        so there is nothing to write back """
+
+
+class _RecordCollection(_Collection):
+    """ borrow_records: live records in the dict plus an optional `archive` of returned
+    records (a BorrowLog, typically memory-mapped from a snapshot) that is read on misses.
+    Archived records are history and are never indexed one by one or deleted """
+
+    def __init__(self, on_add, on_remove):
+        super().__init__(on_add, on_remove)
+        self.archive = None
+
+    def __missing__(self, key):
+        if self.archive is not None and key in self.archive:
+            return self.archive[key]
+        raise KeyError(key)
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __contains__(self, key):
+        return dict.__contains__(self, key) or (self.archive is not None and key in self.archive)
+
+    def __len__(self):
+        return dict.__len__(self) + (len(self.archive) if self.archive is not None else 0)
+
+    def __iter__(self):
+        if self.archive is not None:
+            yield from self.archive
+        yield from dict.__iter__(self)
+
+    def keys(self):
+        return iter(self)
+
+    def values(self):
+        if self.archive is None:
+            return dict.values(self)
+        return itertools.chain(self.archive.views(), dict.values(self))
+
+    def items(self):
+        if self.archive is None:
+            return dict.items(self)
+        return itertools.chain(((view.id, view) for view in self.archive.views()), dict.items(self))
+
+    def __eq__(self, other):
+        if self.archive is None:
+            return dict.__eq__(self, other)
+        return dict(self.items()) == other
+
+    __hash__ = None
+
+    def clear(self):
+        super().clear()
+        self.archive = None
+
+    def live(self):
+        """ Records held in the dict, i.e. everything but the archive """
+        return dict.values(self)
+
+
+class MemoryStorage:
+    """ Storage backend keeping every entity in a dict, the default.
+    A backend hands LibrarySystem its three collections; see storage.py for SQLite """
+
+    def collections(self, system):
+        return (
+            _Collection(system._index_book, system._unindex_book),  # book_id -> Book
+            _Collection(system._index_user, system._unindex_user),  # user_id -> User
+            _RecordCollection(system._index_record, system._unindex_record),  # record_id -> BorrowRecord
+        )
+
+    def close(self):
+        pass
+
+
+class SortedIds:
+    """ Ids in sorted order, for cursor pagination.
+
+    The ids live in sorted chunks of up to 2 * CHUNK_SIZE, found by bisecting the
+    last id of each chunk, so an addition or removal costs O(log n + CHUNK_SIZE) and
+    a page O(log n + its length). A read hands its iterator the current chunks; the
+    next write copies whatever it changes, so a paused iterator keeps walking the
+    ids as they were when it started.
+    """
+
+    CHUNK_SIZE = 512
+
     def __init__(self):
-        self.books = {}  # book_id -> Book
-        self.users = {}  # user_id -> User
-        self.borrow_records = {}  # record_id -> BorrowRecord
-        self.allowed_categories = ["Fiction", "Non-fiction", "Science", "History", "Biography", "Other"]
+        self._chunks = []  # sorted lists of ids, each one after the previous
+        self._lasts = []  # last id of each chunk
+        self._shared = False  # a reader holds `_chunks`, copy it before changing it
+        self._private = set()  # id() of the chunks created since the last read
+
+    def __len__(self):
+        return sum(map(len, self._chunks))
+
+    def _own(self):
+        if self._shared:
+            self._chunks = list(self._chunks)
+            self._private = set()
+            self._shared = False
+
+    def _writable(self, index):
+        """ The chunk at `index`, copied first if a reader may hold it """
+        self._own()
+        chunk = self._chunks[index]
+        if id(chunk) not in self._private:
+            chunk = self._chunks[index] = list(chunk)
+            self._private.add(id(chunk))
+        return chunk
+
+    def add(self, key):
+        lasts = self._lasts
+        index = bisect.bisect_left(lasts, key)
+        if index == len(lasts):
+            if not lasts:
+                self._own()
+                chunk = [key]
+                self._chunks.append(chunk)
+                self._private.add(id(chunk))
+                lasts.append(key)
+                return
+            index -= 1  # past the last id, goes at the end of the last chunk
+
+        chunk = self._chunks[index]
+        position = bisect.bisect_left(chunk, key)
+        if position < len(chunk) and chunk[position] == key:
+            return
+        if self._shared or id(chunk) not in self._private:
+            chunk = self._writable(index)
+        chunk.insert(position, key)
+        lasts[index] = chunk[-1]
+
+        if len(chunk) > 2 * self.CHUNK_SIZE:
+            tail = chunk[self.CHUNK_SIZE:]
+            del chunk[self.CHUNK_SIZE:]
+            self._chunks.insert(index + 1, tail)
+            self._private.add(id(tail))
+            lasts[index] = chunk[-1]
+            lasts.insert(index + 1, tail[-1])
+
+    def update(self, keys):
+        """ Adds many ids not there yet: they are sorted once and each chunk merges
+        its share in a single step, O(k log k + chunks touched * CHUNK_SIZE) """
+        keys = sorted(keys)
+        if not keys:
+            return
+        self._own()
+        size = self.CHUNK_SIZE
+        old_chunks, old_lasts = self._chunks or [[]], self._lasts
+        chunks = []
+        start = 0
+        for index, chunk in enumerate(old_chunks):
+            last_chunk = index == len(old_chunks) - 1
+            end = len(keys) if last_chunk else bisect.bisect_right(keys, old_lasts[index], start)
+            if end == start:
+                chunks.append(chunk)
+                continue
+            merged = chunk + keys[start:end]
+            merged.sort()  # two sorted runs
+            start = end
+            pieces = [merged] if len(merged) <= 2 * size else [merged[i:i + size] for i in range(0, len(merged), size)]
+            for piece in pieces:
+                self._private.add(id(piece))
+                chunks.append(piece)
+        self._chunks = chunks
+        self._lasts = [chunk[-1] for chunk in chunks]
+
+    def discard(self, key):
+        lasts = self._lasts
+        index = bisect.bisect_left(lasts, key)
+        if index == len(lasts):
+            return
+        position = bisect.bisect_left(self._chunks[index], key)
+        if self._chunks[index][position] != key:
+            return
+        chunk = self._writable(index)
+        del chunk[position]
+        if chunk:
+            lasts[index] = chunk[-1]
+        else:
+            del self._chunks[index]
+            del lasts[index]
+
+    def after(self, key=None):
+        """ Iterator over the ids greater than `key`, every id for None """
+        chunks = self._chunks
+        self._shared = True
+        index = position = 0
+        if key is not None:
+            index = bisect.bisect_right(self._lasts, key)
+            if index < len(chunks):
+                position = bisect.bisect_right(chunks[index], key)
+        return self._walk(chunks, index, position)
+
+    @staticmethod
+    def _walk(chunks, index, position):
+        for index in range(index, len(chunks)):
+            yield from itertools.islice(chunks[index], position, None) if position else chunks[index]
+            position = 0
+
+
+_NO_LOCK = contextlib.nullcontext()
+
+
+class _HeldLocks:
+    __slots__ = ("_locks",)
+
+    def __init__(self, locks):
+        self._locks = locks
+
+    def __enter__(self):
+        for lock in self._locks:
+            lock.acquire()
+        return self
+
+    def __exit__(self, *exc_info):
+        for lock in reversed(self._locks):
+            lock.release()
+        return False
+
+
+class LockTable:
+    """ Striped locks keyed by entity. hold() always acquires stripes in ascending
+    order, so two threads locking overlapping sets of entities cannot deadlock """
+
+    def __init__(self, stripes=1024):
+        self._locks = [threading.Lock() for _ in range(stripes)]
+
+    def hold(self, *keys):
+        stripes = sorted({hash(key) % len(self._locks) for key in keys})
+        return _HeldLocks([self._locks[stripe] for stripe in stripes])
+
+
+class _Operation(threading.local):
+    depth = 0  # durable operations the thread is running, nested ones included
+
+
+_operation = _Operation()
+
+
+def _durably(system, call, args, kwargs):
+    _operation.depth += 1
+    try:
+        return call(system, *args, **kwargs)
+    finally:
+        _operation.depth -= 1
+        if not _operation.depth:
+            for journal in system._journals():
+                journal.wait()
+
+
+def _durable(method):
+    """ Public write: with a durable journal, once `method` is done and has released
+    its locks, waits for the journal entries the thread wrote to be on disk. Waiting
+    outside the locks lets concurrent writes share one group fsync """
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        if self._journal_durable and not _operation.depth:
+            return _durably(self, wrapper, args, kwargs)
+        return method(self, *args, **kwargs)
+    return wrapper
+
+
+def _synchronized(method):
+    """ Runs `method` under the LibrarySystem index lock (a no-op unless concurrent=True).
+    Called outside a public write, e.g. by a direct write to `books`, it is durable itself """
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        if self._journal_durable and not _operation.depth:
+            return _durably(self, wrapper, args, kwargs)
+        with self._index_lock:
+            return method(self, *args, **kwargs)
+    return wrapper
+
+
+def normalize_email(email):
+    return email.strip().lower()
+
+
+# Random hex digit -> the digit after setting the RFC 4122 variant bits (10xx)
+_UUID_VARIANT = {digit: "89ab"[int(digit, 16) & 3] for digit in "0123456789abcdef"}
+
+
+def uuid_batches(batch_size=1024):
+    """ Endless stream of uuid4 strings, drawing randomness from the OS one batch at a time.
+    The strings are cut straight from the hex text, the same as str(uuid.uuid4()) """
+    while True:
+        text = os.urandom(16 * batch_size).hex()
+        for start in range(0, len(text), 32):
+            digits = text[start:start + 32]
+            yield (f"{digits[:8]}-{digits[8:12]}-4{digits[13:16]}-"
+                   f"{_UUID_VARIANT[digits[16]]}{digits[17:20]}-{digits[20:]}")
+
+
+DEFAULT_BORROW_LIMITS = {UserRole.MEMBER: 3, UserRole.LIBRARIAN: 10, UserRole.ADMIN: 10}
+# Holds of a lower priority are served first, then in the order they were placed
+DEFAULT_HOLD_PRIORITIES = {UserRole.MEMBER: 1, UserRole.LIBRARIAN: 0, UserRole.ADMIN: 0}
+
+BOOK_FIELDS = ("title", "author", "isbn", "publication_year", "category")
+SEARCHED_BOOK_FIELDS = ("title", "author", "publication_year")  # the updatable fields search_books reads
+BULK_CHUNK_ROWS = 1024  # rows add_*_bulk stores per hold of the index lock
+USER_FIELDS = ("name", "email", "role")
+
+
+def _check_limit(limit):
+    if limit is not None and limit < 0:
+        raise ValueError("Limit must not be negative")
+
+
+def _resume(items, after, position, cursor):
+    """ Skips `items` up to and including the one with id `after`. Items are ordered by
+    position(item), which is `cursor` for `after`, and start at that position. Items
+    sharing it come before `after` until it shows up """
+    waiting = True
+    for item in items:
+        if waiting and position(item) == cursor:
+            if item.id == after:
+                waiting = False
+            continue
+        waiting = False
+        yield item
+
+
+def _unpack_row(row, fields, required):
+    if isinstance(row, dict):
+        return tuple(row.get(field) for field in fields)
+    if isinstance(row, (tuple, list)) and required <= len(row) <= len(fields):
+        return tuple(row) + (None,) * (len(fields) - len(row))
+    raise ValueError(f"Row must be a dict or a sequence of {', '.join(fields)}")
+
+
+def _checkout(user, book_ids, books, borrow_days, now, limit, shard_of):
+    """ borrow_books over `books` (None for unknown ids), each lent by its
+    `shard_of(book)`, for a user allowed `limit` loans. The caller holds the
+    user and book locks """
+    errors = {}
+    seen = set()
+    wanted = 0
+    for index, (book_id, book) in enumerate(zip(book_ids, books)):
+        if book is None:
+            errors[index] = "Book not found"
+        elif book_id in seen:
+            errors[index] = f"Duplicate book {book_id} in batch"
+        else:
+            error = shard_of(book)._lend_error(book, user, now)
+            if error:
+                errors[index] = error
+            else:
+                wanted += 1
+                if not user.can_borrow(limit, count=wanted):
+                    errors[index] = "User cannot borrow more books"
+        seen.add(book_id)
+
+    if errors:
+        return {"ids": [None] * len(book_ids), "errors": errors}
+
+    lent = []
+    try:
+        for book in books:
+            shard = shard_of(book)
+            lent.append((shard, book, shard._lend(book, user, borrow_days, now, True)))
+    except Exception:
+        for shard, book, record_id in reversed(lent):
+            shard._undo_lend(record_id, book, user)
+        # The books are back where they were, their held status changes are void
+        for book in books:
+            shard_of(book)._held_status.pop(book.id, None)
+        raise
+    # Events, status changes included, and collected holds wait for the whole batch,
+    # so a rolled back loan leaves no trace
+    for shard, book, record_id in lent:
+        shard._lent(shard.borrow_records[record_id])
+    return {"ids": [record_id for _, _, record_id in lent], "errors": {}}
+
+
+def _checkin(record_ids, loans, users, now):
+    """ return_books over `loans`, (shard, record) pairs or None for unknown ids,
+    and the users holding them. The caller holds the book and user locks """
+    errors = {}
+    seen = set()
+    for index, (record_id, loan, user) in enumerate(zip(record_ids, loans, users)):
+        if loan is None:
+            errors[index] = "Borrow record not found"
+        elif record_id in seen:
+            errors[index] = f"Duplicate record {record_id} in batch"
+        elif loan[1].is_returned:
+            errors[index] = "Book already returned"
+        elif user is None:
+            errors[index] = "User not found"
+        seen.add(record_id)
+
+    if errors:
+        return {"returned": [False] * len(record_ids), "errors": errors}
+
+    returned = []
+    try:
+        for (shard, record), user in zip(loans, users):
+            position = user.borrowed_books.position(record.id)
+            shard._take_back(record, user, now, True)
+            returned.append((shard, record, user, position))
+    except Exception:
+        for shard, record, user, position in reversed(returned):
+            shard._undo_take_back(record, user, position)
+        for shard, record in loans:
+            shard._held_status.pop(record.book_id, None)
+        raise
+    # Events and the hand-over to holders wait for the whole batch, see _checkout
+    for shard, record, _, _ in returned:
+        shard._returned(record, now)
+    return {"returned": [True] * len(record_ids), "errors": {}}
 
-    def add_book(self, title, author, isbn, publication_year, category):
+
+class LibrarySystem:
+    def __init__(self, concurrent=False, storage=None, cache_size=0, cache_ttl=None, clock=None,
+                 borrow_limits=None, hold_priorities=None, hold_pickup_days=3):
+        # Every timestamp the system records comes from `clock` (see clock.py)
+        self.clock = clock if clock is not None else SYSTEM_CLOCK
+        # In concurrent mode loans lock their book and user, so unrelated checkouts
+        # proceed in parallel, and the shared indexes sit behind one short-lived lock
+        self.concurrent = concurrent
+        self._entity_locks = LockTable() if concurrent else None
+        self._index_lock = threading.RLock() if concurrent else _NO_LOCK
+
+        self._isbn_index = {}  # isbn -> book_id
+        self._email_index = {}  # normalized email -> user_id
+        self._search_index = SearchIndex()
+        self._books_by_status = {status: {} for status in BookStatus}  # status -> {book_id: None}
+        self._books_by_category = {}  # category -> {book_id: None}
+        self._active_users = {}  # {user_id: None} of active users
+        self._book_ids = SortedIds()  # for iter_books cursors
+        self._user_ids = SortedIds()  # for iter_users cursors
+        self._bucket_versions = {}  # ("status", status) / ("category", category) -> change counter
+        # Results of search_books and filtered get_all_books, off unless cache_size is set
+        self.cache = QueryCache(cache_size, cache_ttl) if cache_size else None
+        self._due_queue = DueQueue()  # active loans by due date
+        self._records_by_user = {}  # user_id -> [record_id, ...] ordered by borrow_date
+        self._records_by_book = {}  # book_id -> [record_id, ...] ordered by borrow_date
+
+        self.storage = storage if storage is not None else MemoryStorage()
+        self.books, self.users, self.borrow_records = self.storage.collections(self)
+        self._archive_history = {}  # "user_id" / "book_id" -> {id: archived rows}, None -> all rows, built on first use
+        self.allowed_categories = ["Fiction", "Non-fiction", "Science", "History", "Biography", "Other"]
+        # role -> how many open loans a user may hold, None for no limit
+        self.borrow_limits = dict(DEFAULT_BORROW_LIMITS)
+        if borrow_limits:
+            self.borrow_limits.update(borrow_limits)
+        # role -> priority of its holds, and how long a returned book waits for its holder
+        self.hold_priorities = dict(DEFAULT_HOLD_PRIORITIES)
+        if hold_priorities:
+            self.hold_priorities.update(hold_priorities)
+        self.hold_pickup_days = hold_pickup_days
+        self.holds = {}  # hold_id -> Hold, WAITING or READY
+        self._hold_queues = {}  # book_id -> HoldQueue of its WAITING holds
+        self._ready_holds = {}  # book_id -> the READY Hold it is reserved for
+        self._holds_by_user = {}  # user_id -> {hold_id: None}
+        self._pickup_queue = DueQueue()  # READY holds by pickup deadline
+        self._holders = None  # where holders are looked up, self.users unless sharded
+        self._journal = None  # journal.Journal receiving every change, see enable_journal
+        self._journal_durable = False  # writes wait for their journal entries to reach the disk
+        self.metrics = None  # metrics.Metrics while enable_metrics is on
+        self.events = None  # events.EventLog receiving every change, see enable_events
+        self._held_status = {}  # book_id -> status before a batch changed it, published once the batch is done
+        self._journal_directory = None
+        self._journal_segment = None
+
+        # A persistent storage may already hold a library, whose indexes live in memory
+        for book in self.books.values():
+            self._index_book(book, defer_search=True)
+        for user in self.users.values():
+            self._index_user(user)
+        for record in self.borrow_records.values():
+            self._index_record(record)
+
+    @_synchronized
+    def _index_book(self, book, defer_search=False):
+        book._owner = self
+        if self._journal is not None:
+            self._journal.put_book(book)
+        if self.events is not None:
+            self.events.publish(BookAdded(book.id, book.isbn, book.title, book.author, book.category))
+        self._isbn_index[book.isbn] = book.id
+        self._book_ids.add(book.id)
+        if defer_search:
+            self._search_index.add_later(book)
+        else:
+            self._search_index.add(book)
+        self._books_by_status[book.status][book.id] = None
+        self._books_by_category.setdefault(book.category, {})[book.id] = None
+        self._touch_buckets(("status", book.status), ("category", book.category))
+
+    def _index_books(self, books):
+        """ _index_book for many new books at once, searchable from the next search on.
+        The caller holds the index lock """
+        journal, events, add_later = self._journal, self.events, self._search_index.add_later
+        touched = set()
+        status = bucket = None
+        by_category = {}
+        for book in books:
+            book._owner = self
+            if journal is not None:
+                journal.put_book(book)
+            if events is not None:
+                events.publish(BookAdded(book.id, book.isbn, book.title, book.author, book.category))
+            add_later(book)
+            # New books nearly all share a status, so its bucket is looked up once per run
+            if book.status is not status:
+                status = book.status
+                bucket = self._books_by_status[status]
+                touched.add(("status", status))
+            bucket[book.id] = None
+            by_category.setdefault(book.category, []).append(book.id)
+
+        for category, book_ids in by_category.items():
+            self._books_by_category.setdefault(category, {}).update(dict.fromkeys(book_ids))
+            touched.add(("category", category))
+        self._isbn_index.update((book.isbn, book.id) for book in books)
+        self._book_ids.update(book.id for book in books)
+        self._touch_buckets(*touched)
+
+    @_synchronized
+    def _unindex_book(self, book):
+        if book._owner is self:
+            book._owner = None
+        if self._journal is not None:
+            self._journal.delete_book(book.id)
+        if self._isbn_index.get(book.isbn) == book.id:
+            del self._isbn_index[book.isbn]
+        self._book_ids.discard(book.id)
+        self._search_index.remove(book.id)
+        self._books_by_status[book.status].pop(book.id, None)
+        self._remove_from_category(book.id, book.category)
+        self._touch_buckets(("status", book.status), ("category", book.category))
+
+    def _touch_buckets(self, *buckets):
+        versions = self._bucket_versions
+        for bucket in buckets:
+            versions[bucket] = versions.get(bucket, 0) + 1
+
+    def _remove_from_category(self, book_id, category):
+        same_category = self._books_by_category.get(category)
+        if same_category is None:
+            return
+        same_category.pop(book_id, None)
+        if not same_category:
+            del self._books_by_category[category]
+
+    @_synchronized
+    def _book_status_changed(self, book, old_status):
+        self._books_by_status[old_status].pop(book.id, None)
+        self._books_by_status[book.status][book.id] = None
+        self._touch_buckets(("status", old_status), ("status", book.status))
+        self.books.persist(book)
+        if self._journal is not None:
+            self._journal.put_book(book)
+        if self.events is not None and book.id not in self._held_status:
+            self.events.publish(StatusChanged(book.id, old_status, book.status))
+
+    def _release_status(self, book):
+        """ Publishes the status change a batch held back for `book`, if there is one left """
+        old_status = self._held_status.pop(book.id, None)
+        if self.events is not None and old_status is not None and old_status != book.status:
+            self.events.publish(StatusChanged(book.id, old_status, book.status))
+
+    @_synchronized
+    def _index_user(self, user):
+        user._owner = self
+        self._email_index[normalize_email(user.email)] = user.id
+        self._user_ids.add(user.id)
+        if user.active:
+            self._active_users[user.id] = None
+        if self._journal is not None:
+            self._journal.put_user(user)
+        if self.events is not None:
+            self.events.publish(UserAdded(user.id, user.name, user.email, user.role))
+
+    def _index_users(self, users, emails):
+        """ _index_user for many new users at once, `emails` holding their normalized
+        addresses. The caller holds the index lock """
+        journal, events, active_users = self._journal, self.events, self._active_users
+        user_ids = []
+        for user in users:
+            user._owner = self
+            user_ids.append(user.id)
+            if user.active:
+                active_users[user.id] = None
+            if journal is not None:
+                journal.put_user(user)
+            if events is not None:
+                events.publish(UserAdded(user.id, user.name, user.email, user.role))
+        self._email_index.update(zip(emails, user_ids))
+        self._user_ids.update(user_ids)
+
+    @_synchronized
+    def _unindex_user(self, user):
+        if user._owner is self:
+            user._owner = None
+        email = normalize_email(user.email)
+        if self._email_index.get(email) == user.id:
+            del self._email_index[email]
+        self._user_ids.discard(user.id)
+        self._active_users.pop(user.id, None)
+        if self._journal is not None:
+            self._journal.delete_user(user.id)
+
+    @_synchronized
+    def _user_changed(self, user):
+        if user.active:
+            self._active_users[user.id] = None
+        else:
+            self._active_users.pop(user.id, None)
+        self.users.persist(user)
+        if self._journal is not None:
+            self._journal.put_user(user)
+
+    @_synchronized
+    def _index_record(self, record):
+        record._owner = self
+        if self._journal is not None:
+            self._journal.put_record(record)
+        if not record.is_returned:
+            self._due_queue.schedule(record.id, record.due_date)
+        self._add_to_history(self._records_by_user.setdefault(record.user_id, []), record)
+        self._add_to_history(self._records_by_book.setdefault(record.book_id, []), record)
+
+    @_synchronized
+    def _unindex_record(self, record):
+        if record._owner is self:
+            record._owner = None
+        if self._journal is not None:
+            self._journal.delete_record(record.id)
+        self._due_queue.discard(record.id)
+        for history, key in ((self._records_by_user, record.user_id), (self._records_by_book, record.book_id)):
+            record_ids = history.get(key)
+            if record_ids and record.id in record_ids:
+                record_ids.remove(record.id)
+                if not record_ids:
+                    del history[key]
+
+    def _lock_entities(self, *keys):
+        if self._entity_locks is None:
+            return _NO_LOCK
+        return self._entity_locks.hold(*keys)
+
+    def _sync_loan(self, record, was_returned):
+        """ Brings the due queue and the user's loans in line with a record changed in place """
+        self.borrow_records.persist(record)
+        user = self.users.get(record.user_id)
+        if record.is_returned:
+            self._due_queue.discard(record.id)
+            if not was_returned and user is not None:
+                user.borrowed_books.discard(record.id)
+        else:
+            self._due_queue.schedule(record.id, record.due_date)
+            if was_returned and user is not None:
+                user.borrowed_books.add(record.id)
+
+    def _borrow_date_of(self, record_id):
+        return self.borrow_records[record_id].borrow_date
+
+    def _add_to_history(self, record_ids, record):
+        # Loans normally arrive in borrow order, so this is almost always an append
+        if not record_ids or self._borrow_date_of(record_ids[-1]) <= record.borrow_date:
+            record_ids.append(record.id)
+        else:
+            bisect.insort(record_ids, record.id, key=self._borrow_date_of)
+
+    def _active_records_due(self, start=None, end=None):
+        records = []
+
+        for record_id in self._due_queue.due_between(start, end):
+            record = self.borrow_records[record_id]
+
+            # Catch up with records changed without going through the LibrarySystem
+            if record.is_returned:
+                self._due_queue.discard(record_id)
+                continue
+            if record.due_date != self._due_queue.due_date(record_id):
+                self._due_queue.schedule(record_id, record.due_date)
+                if end is not None and record.due_date >= end:
+                    continue
+
+            records.append(record)
+
+        return records
+
+    def _check_new_book(self, title, author, isbn, category):
         if not title or not author or not isbn:
             raise ValueError("Title, author and ISBN are required")
 
         if category not in self.allowed_categories:
             raise ValueError(f"Category must be one of: {', '.join(self.allowed_categories)}")
 
+    @_synchronized
+    def add_book(self, title, author, isbn, publication_year, category):
+        self._check_new_book(title, author, isbn, category)
+
         # Check for duplicate ISBN
-        for book in self.books.values():
-            if book.isbn == isbn:
-                raise ValueError(f"A book with ISBN {isbn} already exists")
+        if isbn in self._isbn_index:
+            raise ValueError(f"A book with ISBN {isbn} already exists")
 
-        book = Book(title, author, isbn, publication_year, category)
+        book = Book(title, author, isbn, publication_year, category, added_date=self.clock())
         self.books[book.id] = book
         return book.id
 
+    @_durable
+    def add_books_bulk(self, rows):
+        """ Adds many books in one pass.
+
+        `rows` is an iterable of dicts or (title, author, isbn, publication_year, category)
+        tuples. Bad rows do not stop the batch: the result has one entry in "ids" per row
+        (None when the row was rejected) and "errors" maps row index -> message """
+
+        allowed_categories = set(self.allowed_categories)
+        category_error = f"Category must be one of: {', '.join(self.allowed_categories)}"
+        added_date = self.clock()
+        new_ids = uuid_batches()
+        batch_isbns = {}  # isbn -> row index, for duplicates inside the batch
+
+        ids = []
+        errors = {}
+        pending = []  # (row index, book) checked, stored with the next chunk
+        isbn_index = self._isbn_index
+        for index, row in enumerate(rows):
+            try:
+                if row.__class__ is not tuple or len(row) != len(BOOK_FIELDS):
+                    row = _unpack_row(row, BOOK_FIELDS, len(BOOK_FIELDS))
+                title, author, isbn, publication_year, category = row
+
+                if not title or not author or not isbn:
+                    raise ValueError("Title, author and ISBN are required")
+                if category not in allowed_categories:
+                    raise ValueError(category_error)
+                if isbn in batch_isbns:
+                    raise ValueError(f"Duplicate ISBN {isbn} in batch, first seen at row {batch_isbns[isbn]}")
+                if isbn in isbn_index:
+                    raise ValueError(f"A book with ISBN {isbn} already exists")
+                book = Book(title, author, isbn, publication_year, category, next(new_ids), added_date)
+            except ValueError as error:
+                ids.append(None)
+                errors[index] = str(error)
+                continue
+
+            batch_isbns[isbn] = index
+            ids.append(book.id)
+            pending.append((index, book))
+            if len(pending) == BULK_CHUNK_ROWS:
+                self._add_books(pending, ids, errors)
+                pending = []
+
+        self._add_books(pending, ids, errors)
+        return {"ids": ids, "errors": errors}
+
+    def _add_books(self, pending, ids, errors):
+        """ Stores and indexes checked (row index, book) pairs under one hold of the
+        index lock, rejecting books whose ISBN was taken in the meantime """
+        with self._index_lock:
+            books = []
+            for index, book in pending:
+                if book.isbn in self._isbn_index:
+                    ids[index] = None
+                    errors[index] = f"A book with ISBN {book.isbn} already exists"
+                else:
+                    books.append(book)
+            self.books.put_many(books)
+            self._index_books(books)
+
+    @_synchronized
     def update_book( self, book_id, **kwargs ):
         if book_id not in self.books:
             raise ValueError("Book not found")
@@ -155,10 +1080,31 @@ class LibrarySystem:
         book = self.books[book_id]
         valid_fields = ["title", "author", "publication_year", "category"]
 
+        old_category = book.category
+        old_searched = [getattr(book, field) for field in SEARCHED_BOOK_FIELDS]
+
+        now = self.clock()
+        changes = {}
         for field, value in kwargs.items():
             if field in valid_fields:
                 setattr(book, field, value)
-                book.last_updated = datetime.now()
+                book.last_updated = now
+                changes[field] = value
+
+        # Keep the storage and the secondary indexes in step with the new field values
+        self.books.persist(book)
+        # Re-indexing bumps the search version, which would drop every cached search
+        if [getattr(book, field) for field in SEARCHED_BOOK_FIELDS] != old_searched:
+            self._search_index.add(book)
+        if book.category != old_category:
+            self._remove_from_category(book.id, old_category)
+            self._books_by_category.setdefault(book.category, {})[book.id] = None
+            self._touch_buckets(("category", old_category), ("category", book.category))
+
+        if self._journal is not None:
+            self._journal.put_book(book)
+        if self.events is not None:
+            self.events.publish(BookUpdated(book.id, changes))
 
         return True
 
@@ -167,49 +1113,174 @@ class LibrarySystem:
             return None
         return self.books[book_id]
 
-    def get_all_books(self, status=None, category=None):
-        result = list(self.books.values())
+    @_synchronized
+    def get_book_by_isbn(self, isbn):
+        book_id = self._isbn_index.get(isbn)
+        if book_id is None:
+            return None
+        return self.books[book_id]
 
+    @_synchronized
+    def get_all_books(self, status=None, category=None):
+        if not status and not category:
+            return list(self.books.values())
+
+        if self.cache is None:
+            return self._filter_books(status, category)
+
+        # Only the buckets that were read can change the answer
+        key = ("get_all_books", status, category)
+        version = (self._bucket_versions.get(("status", status)), self._bucket_versions.get(("category", category)))
+        books = self.cache.get(key, version)
+        if books is None:
+            books = self._filter_books(status, category)
+            self.cache.put(key, version, books)
+        return list(books)
+
+    def _filter_books(self, status, category):
+        # Walk the smaller bucket and check membership in the other one
+        buckets = []
         if status:
-            result = [book for book in result if book.status == status]
-
+            buckets.append(self._books_by_status.get(status, {}))
         if category:
-            result = [book for book in result if book.category == category]
-
-        return result
-
-    def search_books(self, query):
-
-        query = query.lower()
-        results = []
-
-        for book in self.books.values():
-            if (query in book.title.lower() or
-                query in book.author.lower() or
-                query in book.isbn.lower() or
-                query == book.publication_year):
-                results.append(book)
-
-        return results
-
-    def add_user(self, name, email, role=UserRole.MEMBER):
+            buckets.append(self._books_by_category.get(category, {}))
+        buckets.sort(key=len)
+
+        smallest, others = buckets[0], buckets[1:]
+        return [self.books[book_id] for book_id in smallest
+                if all(book_id in other for other in others)]
+
+    @_synchronized
+    def search_books(self, query, year=None, limit=None, offset=0):
+        """ Ranked search over title, author, ISBN and publication year.
+        Accents and case are ignored and partial words match, e.g. "aneis" finds "Anéis" """
+
+        if self.cache is None:
+            book_ids = self._search_index.search(query, year=year, limit=limit, offset=offset)
+            return [self.books[book_id] for book_id in book_ids]
+
+        # Status changes do not affect search results, only changes to the search index do
+        key = ("search_books", query, year, limit, offset)
+        books = self.cache.get(key, self._search_index.version)
+        if books is None:
+            book_ids = self._search_index.search(query, year=year, limit=limit, offset=offset)
+            books = [self.books[book_id] for book_id in book_ids]
+            self.cache.put(key, self._search_index.version, books)
+        return list(books)
+
+    def iter_books(self, status=None, category=None, after=None, limit=None):
+        """ Books ordered by id, optionally filtered like get_all_books. Pages resume
+        from the last id of the previous page: iter_books(after=last_id, limit=100).
+        Books are looked up one at a time as the iterator is consumed """
+        _check_limit(limit)
+        with self._index_lock:
+            book_ids = self._book_ids.after(after)
+
+        def books():
+            for book_id in book_ids:
+                book = self.books.get(book_id)
+                if book is None:
+                    continue  # Removed after the iterator was created
+                if (not status or book.status == status) and (not category or book.category == category):
+                    yield book
+
+        return itertools.islice(books(), limit)
+
+    def _check_new_user(self, name, email):
         if not name or not email:
             raise ValueError("Name and email are required")
 
+    @_synchronized
+    def add_user(self, name, email, role=UserRole.MEMBER):
+        self._check_new_user(name, email)
+
         # Check for duplicate email
-        for user in self.users.values():
-            if user.email == email:
-                raise ValueError(f"A user with email {email} already exists")
+        if normalize_email(email) in self._email_index:
+            raise ValueError(f"A user with email {email} already exists")
 
-        user = User(name, email, role)
+        user = User(name, email, role, joined_date=self.clock())
         self.users[user.id] = user
         return user.id
 
+    @_durable
+    def add_users_bulk(self, rows):
+        """ Adds many users in one pass. `rows` holds dicts or (name, email[, role]) tuples,
+        role being a UserRole or its value. Returns {"ids": [...], "errors": {row: message}}
+        like add_books_bulk """
+
+        joined_date = self.clock()
+        new_ids = uuid_batches()
+        batch_emails = {}  # normalized email -> row index
+
+        ids = []
+        errors = {}
+        pending = []  # (row index, user, normalized email) checked, stored with the next chunk
+        email_index = self._email_index
+        for index, row in enumerate(rows):
+            try:
+                if row.__class__ is tuple and len(row) == 2:
+                    (name, email), role = row, None
+                else:
+                    name, email, role = _unpack_row(row, USER_FIELDS, 2)
+
+                if not name or not email:
+                    raise ValueError("Name and email are required")
+                if role is None:
+                    role = UserRole.MEMBER
+                elif not isinstance(role, UserRole):
+                    try:
+                        role = UserRole(role)
+                    except ValueError:
+                        raise ValueError(f"Role must be one of: {', '.join(r.value for r in UserRole)}")
+
+                normalized = normalize_email(email)
+                if normalized in batch_emails:
+                    raise ValueError(f"Duplicate email {email} in batch, first seen at row {batch_emails[normalized]}")
+                if normalized in email_index:
+                    raise ValueError(f"A user with email {email} already exists")
+                user = User(name, email, role, next(new_ids), joined_date)
+            except ValueError as error:
+                ids.append(None)
+                errors[index] = str(error)
+                continue
+
+            batch_emails[normalized] = index
+            ids.append(user.id)
+            pending.append((index, user, normalized))
+            if len(pending) == BULK_CHUNK_ROWS:
+                self._add_users(pending, ids, errors)
+                pending = []
+
+        self._add_users(pending, ids, errors)
+        return {"ids": ids, "errors": errors}
+
+    def _add_users(self, pending, ids, errors):
+        """ Stores and indexes checked (row index, user, normalized email) triples, see _add_books """
+        with self._index_lock:
+            users = []
+            emails = []
+            for index, user, normalized in pending:
+                if normalized in self._email_index:
+                    ids[index] = None
+                    errors[index] = f"A user with email {user.email} already exists"
+                else:
+                    users.append(user)
+                    emails.append(normalized)
+            self.users.put_many(users)
+            self._index_users(users, emails)
+
     def get_user(self, user_id):
         if user_id not in self.users:
             return None
         return self.users[user_id]
 
+    @_synchronized
+    def get_user_by_email(self, email):
+        user_id = self._email_index.get(normalize_email(email))
+        if user_id is None:
+            return None
+        return self.users[user_id]
+
     def get_all_users(self, role=None, active_only=True):
         result = list(self.users.values())
 
@@ -221,6 +1292,23 @@ class LibrarySystem:
 
         return result
 
+    def iter_users(self, role=None, active_only=True, after=None, limit=None):
+        """ Users ordered by id, filtered like get_all_users, with the same cursor as iter_books """
+        _check_limit(limit)
+        with self._index_lock:
+            user_ids = self._user_ids.after(after)
+
+        def users():
+            for user_id in user_ids:
+                user = self.users.get(user_id)
+                if user is None:
+                    continue
+                if (not role or user.role == role) and (not active_only or user.active):
+                    yield user
+
+        return itertools.islice(users(), limit)
+
+    @_durable
     def borrow_book(self, book_id, user_id, borrow_days=14):
         if book_id not in self.books:
             raise ValueError("Book not found")
@@ -231,96 +1319,651 @@ class LibrarySystem:
         book = self.books[book_id]
         user = self.users[user_id]
 
-        if book.status != BookStatus.AVAILABLE:
-            raise ValueError(f"Book is not available, current status: {book.status.value}")
-
-        if not user.can_borrow():
+        # Check-then-act on the book and the user must not interleave with another loan
+        with self._lock_entities(("book", book_id), ("user", user_id)):
+            return self._lend(book, user, borrow_days)
+
+    def _lend(self, book, user, borrow_days, now=None, batch=False):
+        """ Loan of one of our books to `user`, who may live in another shard of a
+        ShardedLibrarySystem. The caller holds the book and user locks. A batch
+        calls _lent itself once every loan went through """
+        borrow_date = now if now is not None else self.clock()
+        # Books nobody holds skip the hold bookkeeping
+        if book.status != BookStatus.AVAILABLE or book.id in self._hold_queues:
+            error = self._lend_error(book, user, borrow_date)
+            if error:
+                raise ValueError(error)
+
+        if not user.can_borrow(self.borrow_limits.get(user.role)):
             raise ValueError("User cannot borrow more books")
 
-        borrow_record = BorrowRecord(book_id, user_id, borrow_days)
+        borrow_record = BorrowRecord(book.id, user.id, borrow_days, borrow_date=borrow_date)
         self.borrow_records[borrow_record.id] = borrow_record
 
         # Update book status
+        if batch:
+            self._held_status.setdefault(book.id, book.status)
         book.update_status(BookStatus.BORROWED)
 
         # Update user's borrowed books
-        user.borrowed_books.append(borrow_record.id)
+        user.borrowed_books.add(borrow_record.id)
+
+        if not batch and (self._ready_holds or self.events is not None):
+            self._lent(borrow_record)
 
         return borrow_record.id
 
+    def _lend_error(self, book, user, now):
+        """ Why `book` cannot be lent to `user`, None if it can. Brings the book's
+        holds up to date first, so a book back on the shelf goes to the first holder """
+        if book.status == BookStatus.RESERVED or book.id in self._hold_queues:
+            self._settle_holds(book, now)
+            if book.status == BookStatus.RESERVED and self._ready_holds[book.id].user_id == user.id:
+                return None
+        if book.status != BookStatus.AVAILABLE:
+            return f"Book is not available, current status: {book.status.value}"
+        return None
+
+    def _lent(self, record):
+        """ Completes a loan: the holder collected their hold, subscribers hear of it """
+        if self._held_status:
+            self._release_status(self.books[record.book_id])
+        if self._ready_holds:
+            hold = self._ready_holds.get(record.book_id)
+            if hold is not None and hold.user_id == record.user_id:
+                self._end_hold(hold, HoldStatus.FULFILLED)
+        if self.events is not None:
+            self._publish_loan(Borrowed, record)
+
+    def _publish_loan(self, event_type, record):
+        moment = record.return_date if event_type is Returned else record.due_date
+        self.events.publish(event_type(record.id, record.book_id, record.user_id, moment))
+
+    @_durable
     def return_book(self, record_id):
         if record_id not in self.borrow_records:
             raise ValueError("Borrow record not found")
 
         record = self.borrow_records[record_id]
 
+        with self._lock_entities(("book", record.book_id), ("user", record.user_id)):
+            return self._take_back(record, self.users[record.user_id])
+
+    def _take_back(self, record, user, now=None, batch=False):
+        """ Return of one of our loans, see _lend """
         if record.is_returned:
             raise ValueError("Book already returned")
 
         # Update record
-        record.return_book()
+        now = now if now is not None else self.clock()
+        record.return_book(now)
+        self.borrow_records.persist(record)
+        with self._index_lock:
+            self._due_queue.discard(record.id)
+            if self._journal is not None:
+                self._journal.put_record(record)
 
         # Update book status
         book = self.books[record.book_id]
+        if batch:
+            self._held_status.setdefault(book.id, book.status)
         book.update_status(BookStatus.AVAILABLE)
 
         # Update user's borrowed books
-        user = self.users[record.user_id]
-        user.borrowed_books.remove(record_id)
+        user.borrowed_books.remove(record.id)
+
+        if not batch and (record.book_id in self._hold_queues or self.events is not None):
+            self._returned(record, now)
 
         return True
 
+    def _returned(self, record, now):
+        """ Completes a return: subscribers hear of it and the first holder gets the book """
+        if self._held_status:
+            self._release_status(self.books[record.book_id])
+        if self.events is not None:
+            self._publish_loan(Returned, record)
+        if record.book_id in self._hold_queues:
+            self._settle_holds(self.books[record.book_id], now)
+
+    @_durable
+    def borrow_books(self, user_id, book_ids, borrow_days=14):
+        """ Lends several books to one user, all or none of them.
+
+        Returns {"ids": [...], "errors": {index: message}} with one record id per book.
+        If any book cannot be lent, or the batch goes over the user's limit, nothing
+        changes: "ids" is all None and "errors" says what was wrong with which book """
+        if user_id not in self.users:
+            raise ValueError("User not found")
+
+        user = self.users[user_id]
+        book_ids = list(book_ids)
+        books = [self.books.get(book_id) for book_id in book_ids]
+
+        # The index lock keeps readers such as generate_reports from seeing half a batch
+        with self._lock_entities(("user", user_id), *(("book", book_id) for book_id in book_ids)), self._index_lock:
+            return _checkout(user, book_ids, books, borrow_days, self.clock(), self.borrow_limits.get(user.role),
+                             lambda book: self)
+
+    def _undo_lend(self, record_id, book, user):
+        """ Reverts a _lend of a batch that could not be completed """
+        user.borrowed_books.discard(record_id)
+        if record_id in self.borrow_records:
+            del self.borrow_records[record_id]
+        if book.status == BookStatus.BORROWED:
+            book.update_status(BookStatus.RESERVED if book.id in self._ready_holds else BookStatus.AVAILABLE)
+
+    @_durable
+    def return_books(self, record_ids):
+        """ Returns several loans, all or none of them.
+
+        Returns {"returned": [...], "errors": {index: message}} with one flag per
+        record; unknown, repeated or already returned records leave every loan open """
+        record_ids = list(record_ids)
+        loans = []
+        for record_id in record_ids:
+            record = self.borrow_records.get(record_id)
+            loans.append(None if record is None else (self, record))
+        users = [None if loan is None else self.users.get(loan[1].user_id) for loan in loans]
+
+        keys = {key for loan in loans if loan is not None
+                for key in (("book", loan[1].book_id), ("user", loan[1].user_id))}
+        with self._lock_entities(*keys), self._index_lock:
+            return _checkin(record_ids, loans, users, self.clock())
+
+    def _undo_take_back(self, record, user, position=None):
+        """ Reopens a loan returned by a batch that could not be completed, back at
+        `position` in the user's loans """
+        record.return_date = None
+        record.is_returned = False
+        self.borrow_records.persist(record)
+        with self._index_lock:
+            self._due_queue.schedule(record.id, record.due_date)
+            if self._journal is not None:
+                self._journal.put_record(record)
+
+        book = self.books[record.book_id]
+        if book.status == BookStatus.AVAILABLE:
+            book.update_status(BookStatus.BORROWED)
+        if record.id not in user.borrowed_books:
+            if position is None:
+                user.borrowed_books.add(record.id)
+            else:
+                user.borrowed_books.restore(record.id, position)
+
+    @_durable
     def extend_borrowing(self, record_id, additional_days=7):
         if record_id not in self.borrow_records:
             raise ValueError("Borrow record not found")
 
         record = self.borrow_records[record_id]
 
-        if not record.extend_borrow(additional_days):
+        with self._lock_entities(("book", record.book_id), ("user", record.user_id)):
+            return self._extend(record, additional_days)
+
+    def _extend(self, record, additional_days):
+        if record.book_id in self._hold_queues:
+            raise ValueError("Cannot extend this borrowing: other users hold this book")
+        if not record.extend_borrow(additional_days, self.clock()):
             raise ValueError("Cannot extend this borrowing")
 
+        self.borrow_records.persist(record)
+        with self._index_lock:
+            self._due_queue.schedule(record.id, record.due_date)
+            if self._journal is not None:
+                self._journal.put_record(record)
+        if self.events is not None:
+            self._publish_loan(Extended, record)
+
+        return True
+
+    # Holds: a queue per book, see holds.py
+
+    @_durable
+    def place_hold(self, book_id, user_id):
+        """ Queues the user for a book that is out and returns the hold id. When the
+        book comes back and it is the user's turn, it is RESERVED for them for
+        hold_pickup_days; borrow_book collects it """
+        if book_id not in self.books:
+            raise ValueError("Book not found")
+        if user_id not in self.users:
+            raise ValueError("User not found")
+
+        book = self.books[book_id]
+        user = self.users[user_id]
+        with self._lock_entities(("book", book_id)):
+            return self._place_hold(book, user, self.clock())
+
+    def _place_hold(self, book, user, now):
+        """ Hold on one of our books for `user`, who may live in another shard.
+        The caller holds the book lock """
+        if not user.active:
+            raise ValueError("User is not active")
+
+        self._settle_holds(book, now)
+        if book.status == BookStatus.AVAILABLE:
+            raise ValueError("Book is available, borrow it instead")
+
+        with self._index_lock:
+            for hold_id in self._holds_by_user.get(user.id, ()):
+                if self.holds[hold_id].book_id == book.id:
+                    raise ValueError("User already holds this book")
+            # A book has at most one open loan, its latest one, kept in this shard
+            record_ids = self._records_by_book.get(book.id)
+            if record_ids:
+                record = self.borrow_records[record_ids[-1]]
+                if not record.is_returned and record.user_id == user.id:
+                    raise ValueError("User already has this book")
+
+            hold = Hold(book.id, user.id, self.hold_priorities[user.role], placed_date=now)
+            self.holds[hold.id] = hold
+            self._holds_by_user.setdefault(user.id, {})[hold.id] = None
+            self._hold_queues.setdefault(book.id, HoldQueue()).push(hold)
+        return hold.id
+
+    @_durable
+    def cancel_hold(self, hold_id):
+        hold = self.holds.get(hold_id)
+        if hold is None:
+            raise ValueError("Hold not found")
+
+        with self._lock_entities(("book", hold.book_id)):
+            return self._cancel_hold(hold, self.clock())
+
+    def _cancel_hold(self, hold, now):
+        # The hold may have been collected or expired while we waited for the lock
+        if hold.status not in (HoldStatus.WAITING, HoldStatus.READY):
+            raise ValueError(f"Hold is already {hold.status.value}")
+
+        was_ready = hold.status == HoldStatus.READY
+        self._end_hold(hold, HoldStatus.CANCELLED)
+        if was_ready:
+            self._settle_holds(self.books[hold.book_id], now)
         return True
 
+    def get_holds(self, book_id):
+        """ Live holds on a book: the READY one first, then the waiting ones in serving order """
+        with self._index_lock:
+            ready = self._ready_holds.get(book_id)
+            queue = self._hold_queues.get(book_id)
+            return ([ready] if ready is not None else []) + (queue.ordered() if queue is not None else [])
+
+    def get_user_holds(self, user_id):
+        with self._index_lock:
+            return [self.holds[hold_id] for hold_id in self._holds_by_user.get(user_id, ())]
+
+    @_durable
+    def expire_holds(self):
+        """ Ends the READY holds past their pickup deadline and hands each book to its
+        next holder. Returns how many expired. Holds also expire when their book is
+        next touched, so calling this periodically only keeps the shelf moving """
+        now = self.clock()
+        expired = 0
+        for hold in self._holds_past_pickup(now):
+            with self._lock_entities(("book", hold.book_id)):
+                expired += self._expire_hold(hold, now)
+        return expired
+
+    def _holds_past_pickup(self, now):
+        with self._index_lock:
+            hold_ids = self._pickup_queue.due_between(end=now)
+            return [self.holds[hold_id] for hold_id in hold_ids if hold_id in self.holds]
+
+    def _expire_hold(self, hold, now):
+        """ 1 if `hold` was still READY and expired now, else 0. The caller holds the book lock """
+        if self._ready_holds.get(hold.book_id) is not hold or hold.expiry_date >= now:
+            return 0
+        self._settle_holds(self.books[hold.book_id], now)
+        return 1
+
+    def _settle_holds(self, book, now):
+        """ Expires the book's READY hold once its pickup deadline passed and, while
+        the book is on the shelf without one, reserves it for the next holder """
+        with self._index_lock:
+            hold = self._ready_holds.get(book.id)
+            if hold is not None and hold.expiry_date < now:
+                self._end_hold(hold, HoldStatus.EXPIRED)
+                hold = None
+            if hold is None and book.status in (BookStatus.AVAILABLE, BookStatus.RESERVED):
+                if self._promote(book, now) is None and book.status == BookStatus.RESERVED:
+                    book.update_status(BookStatus.AVAILABLE)
+
+    def _promote(self, book, now):
+        """ Makes the first eligible waiting hold READY, O(log n). Holds of users who
+        are gone or inactive are cancelled on the way """
+        holders = self._holders if self._holders is not None else self.users
+        queue = self._hold_queues.get(book.id)
+        ready = None
+        while queue and ready is None:
+            hold = queue.pop()
+            user = holders.get(hold.user_id)
+            if user is None or not user.active:
+                self._end_hold(hold, HoldStatus.CANCELLED)
+                continue
+
+            hold.status = HoldStatus.READY
+            hold.ready_date = now
+            hold.expiry_date = now + timedelta(days=self.hold_pickup_days)
+            self._ready_holds[book.id] = hold
+            self._pickup_queue.schedule(hold.id, hold.expiry_date)
+            if book.status != BookStatus.RESERVED:
+                book.update_status(BookStatus.RESERVED)
+            if self.events is not None:
+                self.events.publish(HoldReady(hold.id, book.id, hold.user_id, hold.expiry_date))
+            ready = hold
+
+        if queue is not None and not queue:
+            self._hold_queues.pop(book.id, None)
+        return ready
+
+    def _end_hold(self, hold, status):
+        with self._index_lock:
+            if hold.status == HoldStatus.WAITING:
+                queue = self._hold_queues.get(hold.book_id)
+                if queue is not None:
+                    queue.discard(hold)
+                    if not queue:
+                        del self._hold_queues[hold.book_id]
+            elif hold.status == HoldStatus.READY:
+                if self._ready_holds.get(hold.book_id) is hold:
+                    del self._ready_holds[hold.book_id]
+                self._pickup_queue.discard(hold.id)
+
+            hold.status = status
+            self.holds.pop(hold.id, None)
+            user_holds = self._holds_by_user.get(hold.user_id)
+            if user_holds is not None:
+                user_holds.pop(hold.id, None)
+                if not user_holds:
+                    del self._holds_by_user[hold.user_id]
+
+    @_synchronized
     def get_overdue_books(self):
         overdue_records = []
 
-        for record in self.borrow_records.values():
-            if record.is_overdue():
-                overdue_records.append({
-                    "record": record,
-                    "book": self.books[record.book_id],
-                    "user": self.users[record.user_id]
-                })
+        # Oldest due date first
+        for record in self._active_records_due(end=self.clock()):
+            overdue_records.append({
+                "record": record,
+                "book": self.books[record.book_id],
+                "user": self.users[record.user_id]
+            })
 
         return overdue_records
 
-    def get_borrow_history(self, user_id=None, book_id=None):
-        results = list(self.borrow_records.values())
-
+    def iter_overdue(self, after=None, limit=None):
+        """ Overdue borrow records, oldest due date first, produced while walking the
+        due queue. `after` is the id of the last record of the previous page """
+        _check_limit(limit)
+        now = self.clock()
+        start = None
+        if after is not None:
+            cursor = self.borrow_records.get(after)
+            if cursor is None:
+                raise ValueError("Borrow record not found")
+            start = cursor.due_date
+
+        overdue = self._overdue(start, now)
+        if after is not None:
+            overdue = _resume(overdue, after, lambda record: record.due_date, start)
+        return itertools.islice(overdue, limit)
+
+    def _overdue(self, start, now):
+        with self._index_lock:
+            record_ids = self._due_queue.iter_due(start, now, copy=self.concurrent)
+
+        for record_id in record_ids:
+            record = self.borrow_records.get(record_id)
+            # Skip loans returned or extended without going through the LibrarySystem
+            if record is not None and not record.is_returned and record.due_date < now:
+                yield record
+
+    @_synchronized
+    def get_due_between(self, start, end):
+        """ Active borrow records with start <= due_date < end, earliest first """
+        if start > end:
+            raise ValueError("Start must not be after end")
+        return self._active_records_due(start, end)
+
+    def get_borrow_history(self, user_id=None, book_id=None, start=None, end=None):
+        """ Borrow records in chronological order, optionally restricted to
+        start <= borrow_date < end """
+        # Through the class, so enabled metrics count only the outer call
+        return list(type(self).iter_borrow_history(self, user_id, book_id, start, end))
+
+    def iter_borrow_history(self, user_id=None, book_id=None, start=None, end=None, after=None, limit=None):
+        """ Same as get_borrow_history, but yields the records one at a time.
+        `after` is the id of the last record of the previous page and `limit` the page size """
+        _check_limit(limit)
+        if after is None:
+            return itertools.islice(self._history(user_id, book_id, start, end), limit)
+
+        cursor = self.borrow_records.get(after)
+        if cursor is None:
+            raise ValueError("Borrow record not found")
+        if end is not None and cursor.borrow_date >= end:
+            return iter(())
+        # Restart the walk at the cursor's borrow date, then step over what came before it
+        if start is None or start < cursor.borrow_date:
+            start = cursor.borrow_date
+        records = _resume(self._history(user_id, book_id, start, end), after,
+                          lambda record: record.borrow_date, cursor.borrow_date)
+        return itertools.islice(records, limit)
+
+    def _history(self, user_id, book_id, start, end):
+        if not user_id and not book_id:
+            # Copy the live records at once, so writers are free to add loans meanwhile
+            with self._index_lock:
+                live = list(self.borrow_records.live())
+            live = [record for record in live
+                    if (start is None or record.borrow_date >= start) and (end is None or record.borrow_date < end)]
+            # Almost always in borrow order already, which the sort only has to confirm
+            live.sort(key=lambda record: record.borrow_date)
+            if self.borrow_records.archive is None:
+                yield from live
+            else:
+                yield from heapq.merge(self._archived_history(None, None, start, end), live,
+                                       key=lambda record: record.borrow_date)
+            return
+
+        # Walk the shorter of the two histories and check the other id
+        candidates = []
         if user_id:
-            results = [record for record in results if record.user_id == user_id]
-
+            candidates.append(("user_id", user_id, "book_id", book_id))
         if book_id:
-            results = [record for record in results if record.book_id == book_id]
-
-        return results
-
+            candidates.append(("book_id", book_id, "user_id", user_id))
+        field, key, other_field, other_id = min(candidates, key=lambda candidate: self._history_size(*candidate[:2]))
+
+        records = self._live_history(field, key, start, end)
+        if self.borrow_records.archive is not None:
+            # Archived history holds returned loans only, interleave it by borrow date
+            records = heapq.merge(self._archived_history(field, key, start, end), records,
+                                  key=lambda record: record.borrow_date)
+
+        for record in records:
+            if not other_id or getattr(record, other_field) == other_id:
+                yield record
+
+    def _history_size(self, field, key):
+        live = self._records_by_user if field == "user_id" else self._records_by_book
+        size = len(live.get(key, ()))
+        if self.borrow_records.archive is not None:
+            size += len(self._archived_rows(field).get(key, ()))
+        return size
+
+    def _live_history(self, field, key, start, end):
+        with self._index_lock:
+            record_ids = (self._records_by_user if field == "user_id" else self._records_by_book).get(key, [])
+            low = 0 if start is None else bisect.bisect_left(record_ids, start, key=self._borrow_date_of)
+            high = len(record_ids) if end is None else bisect.bisect_left(record_ids, end, key=self._borrow_date_of)
+            if self.concurrent:
+                # Copy only the requested window, so writers are free to change the list meanwhile
+                record_ids, low, high = record_ids[low:high], 0, high - low
+
+        for index in range(low, high):
+            yield self.borrow_records[record_ids[index]]
+
+    @_synchronized
+    def _archived_rows(self, field):
+        """ {id: rows} of the archive grouped by `field`, or every row when field is None,
+        each in borrow date order """
+        if field not in self._archive_history:
+            archive = self.borrow_records.archive
+            self._archive_history[field] = archive.chronological_rows() if field is None else archive.group_rows(field)
+        return self._archive_history[field]
+
+    def _archived_history(self, field, key, start, end):
+        archive = self.borrow_records.archive
+        rows = self._archived_rows(field) if field is None else self._archived_rows(field).get(key, ())
+
+        def borrow_date_of(row):
+            return archive.row(row).borrow_date
+
+        low = 0 if start is None else bisect.bisect_left(rows, start, key=borrow_date_of)
+        high = len(rows) if end is None else bisect.bisect_left(rows, end, key=borrow_date_of)
+
+        for index in range(low, high):
+            yield archive.row(rows[index])
+
+    @_synchronized
+    def save(self, path):
+        """ Writes a binary snapshot of the whole system to `path` (see snapshot.py) """
+        from snapshot import save_snapshot
+        save_snapshot(self, path)
+
+    def export(self, target, kind="books", format="ndjson"):
+        """ Streams every book, user or borrow record as NDJSON, CSV or columnar JSON
+        to a path, file or socket (see export.py). Returns the number of rows. The
+        index lock is only taken for the cursors' snapshots, so writers go on meanwhile """
+        from export import export
+        return export(self, target, kind, format)
+
+    @classmethod
+    def load(cls, path):
+        """ Opens a snapshot written by `save`. Returned loans stay memory-mapped and
+        are only turned into objects when read; the search index is built on first use """
+        from snapshot import load_snapshot
+        return load_snapshot(path, cls)
+
+    def enable_journal(self, directory, flush_interval=0.005, durable=False):
+        """ Starts journaling every change to `directory` (see journal.py). The current
+        state becomes the base snapshot. With durable=True each write returns once the
+        group fsync covering its changes is done, otherwise fsyncs trail by about
+        `flush_interval` """
+        from journal import JournalDirectory
+
+        if self._journal is not None:
+            raise ValueError("Journal is already enabled")
+        journal_directory = JournalDirectory(directory)
+        journal_directory.initialize(self)
+        self._attach_journal(journal_directory, flush_interval=flush_interval, durable=durable)
+
+    def _attach_journal(self, journal_directory, **options):
+        self._journal_directory = journal_directory
+        self._journal_options = options
+        self._journal_segment, self._journal = journal_directory.open_segment(**options)
+        self._journal_durable = self._journal.durable
+
+    def _journals(self):
+        return () if self._journal is None else (self._journal,)
+
+    @classmethod
+    def recover(cls, directory, flush_interval=0.005, durable=False):
+        """ Rebuilds a journaled system from its latest snapshot and journal, then keeps journaling """
+        from journal import JournalDirectory
+
+        journal_directory = JournalDirectory(directory)
+        system = journal_directory.recover(cls)
+        system._attach_journal(journal_directory, flush_interval=flush_interval, durable=durable)
+        return system
+
+    def sync_journal(self):
+        if self._journal is not None:
+            self._journal.sync()
+
+    def close_journal(self):
+        if self._journal is not None:
+            self._journal.close()
+            self._journal = None
+            self._journal_durable = False
+
+    @_synchronized
+    def compact_journal(self, wait=False):
+        """ Switches to a fresh journal segment and folds the older ones into a new
+        snapshot on a background thread, which is returned """
+        if self._journal is None:
+            raise ValueError("Journal is not enabled")
+
+        sealed_segment, sealed_journal = self._journal_segment, self._journal
+        self._journal_segment, self._journal = self._journal_directory.open_segment(**self._journal_options)
+        sealed_journal.close()
+
+        worker = threading.Thread(target=self._journal_directory.compact, args=(type(self), sealed_segment),
+                                  name="library-journal-compaction", daemon=True)
+        worker.start()
+        if wait:
+            worker.join()
+        return worker
+
+    def enable_metrics(self):
+        """ Starts recording calls, latencies, errors and result sizes of every public
+        method (see metrics.py). Returns the metrics.Metrics collecting them """
+        from metrics import Metrics, instrument
+        if self.metrics is None:
+            self.metrics = Metrics()
+            instrument(self, self.metrics)
+        return self.metrics
+
+    def disable_metrics(self):
+        """ Removes the instrumentation; the recorded metrics stay readable on `metrics` """
+        from metrics import uninstrument
+        uninstrument(self)
+        metrics, self.metrics = self.metrics, None
+        return metrics
+
+    def get_metrics(self):
+        """ Snapshot of the recorded metrics by method, empty when metrics are off """
+        return self.metrics.snapshot() if self.metrics is not None else {}
+
+    def write_metrics(self, path):
+        """ Writes the metrics to `path` in the Prometheus text format """
+        if self.metrics is None:
+            raise ValueError("Metrics are not enabled")
+        self.metrics.write_prometheus(path)
+
+    def enable_events(self, capacity=8192):
+        """ Starts publishing every change to an events.EventLog keeping the last
+        `capacity` events, and returns it """
+        if self.events is None:
+            self.events = EventLog(capacity)
+        return self.events
+
+    def disable_events(self):
+        """ Stops publishing; existing subscriptions can still read what was buffered """
+        events, self.events = self.events, None
+        return events
+
+    def subscribe(self, from_seq=None, strict=False):
+        """ An events.Subscription to the changes, from now on unless `from_seq` is given """
+        if self.events is None:
+            raise ValueError("Events are not enabled")
+        return self.events.subscribe(from_seq, strict)
+
+    @_synchronized
     def generate_reports(self):
+        # Every count but the overdue one is the size of an index kept up to date
+        # at each change, so this does not depend on the size of the library
         total_books = len(self.books)
-        available_books = len([b for b in self.books.values() if b.status == BookStatus.AVAILABLE])
-        borrowed_books = len([b for b in self.books.values() if b.status == BookStatus.BORROWED])
+        available_books = len(self._books_by_status[BookStatus.AVAILABLE])
+        borrowed_books = len(self._books_by_status[BookStatus.BORROWED])
 
         total_users = len(self.users)
-        active_users = len([u for u in self.users.values() if u.active])
+        active_users = len(self._active_users)
 
-        books_by_category = {}
-        for book in self.books.values():
-            if book.category not in books_by_category:
-                books_by_category[book.category] = 0
-            books_by_category[book.category] += 1
+        books_by_category = {category: len(book_ids) for category, book_ids in self._books_by_category.items()}
 
-        current_borrows = len([r for r in self.borrow_records.values() if not r.is_returned])
-        overdue_borrows = len([r for r in self.borrow_records.values() if r.is_overdue()])
+        overdue_borrows = len(self._active_records_due(end=self.clock()))
+        current_borrows = len(self._due_queue)
 
         return {
             "total_books": total_books,
@@ -332,3 +1975,27 @@ class LibrarySystem:
             "current_borrows": current_borrows,
             "overdue_borrows": overdue_borrows
         }
+
+    @_synchronized
+    def recompute_reports(self):
+        """ generate_reports computed by scanning every book, user and borrow record,
+        to check the incrementally maintained counters against """
+        books = list(self.books.values())
+        users = list(self.users.values())
+        open_records = [record for record in self.borrow_records.values() if not record.is_returned]
+        now = self.clock()
+
+        books_by_category = {}
+        for book in books:
+            books_by_category[book.category] = books_by_category.get(book.category, 0) + 1
+
+        return {
+            "total_books": len(books),
+            "available_books": len([b for b in books if b.status == BookStatus.AVAILABLE]),
+            "borrowed_books": len([b for b in books if b.status == BookStatus.BORROWED]),
+            "total_users": len(users),
+            "active_users": len([u for u in users if u.active]),
+            "books_by_category": books_by_category,
+            "current_borrows": len(open_records),
+            "overdue_borrows": len([r for r in open_records if r.is_overdue(now)])
+        }
@@ -0,0 +1,299 @@
+""" Opt-in instrumentation of the public LibrarySystem methods.
+
+    system.enable_metrics()
+    ...
+    system.get_metrics()["borrow_book"]["latency_us"]["p99"]
+    system.write_metrics("/var/lib/node_exporter/library.prom")
+
+enable_metrics() shadows every public method of the instance with a wrapper
+that counts calls, records the latency in a log-linear (HDR-style) histogram,
+counts exceptions by message class and, for the query methods, records how
+many items came back. Nothing is wrapped until then, and disable_metrics()
+removes the wrappers again, so a system without metrics runs the plain methods.
+iter_* methods return lazy iterators: only creating them is timed.
+"""
+import os
+import re
+import time
+import inspect
+import tempfile
+import threading
+import functools
+
+
+# Log-linear buckets: values below 2 ** (SUB_BUCKET_BITS + 1) get a bucket each,
+# above that every power of two is split into 2 ** SUB_BUCKET_BITS buckets,
+# so a recorded value is known to within 1 / 2 ** SUB_BUCKET_BITS (12.5%)
+SUB_BUCKET_BITS = 3
+LINEAR_LIMIT = 1 << (SUB_BUCKET_BITS + 1)
+
+# Exported bucket bounds: powers of two, which bucket boundaries always line up with
+LATENCY_BOUNDS_NS = [1 << power for power in range(10, 36)]  # ~1us to ~69s
+SIZE_BOUNDS = [1 << power for power in range(0, 21)]  # 1 to ~1M items
+
+# Methods whose result size is recorded
+QUERY_METHODS = frozenset((
+    "get_all_books", "search_books", "get_all_users", "get_overdue_books", "get_due_between",
+    "get_borrow_history",
+))
+
+# Methods that are not wrapped: the metrics API itself and constructors
+NOT_INSTRUMENTED = frozenset(("enable_metrics", "disable_metrics", "get_metrics", "write_metrics", "load", "recover"))
+
+_VARIABLE = re.compile(r"\S*\d\S*")
+
+
+def error_class(error):
+    """ The message of an error with ids, numbers and anything after a colon
+    dropped, so errors about different books fall in the same class """
+    message = str(error).split(":", 1)[0]
+    return f"{type(error).__name__}: {_VARIABLE.sub('<id>', message).strip()}"
+
+
+def _bucket_upper(index):
+    """ Largest value that falls in bucket `index` (see Histogram.record) """
+    if index < LINEAR_LIMIT:
+        return index + 1
+    shift = (index >> SUB_BUCKET_BITS) - 1
+    mantissa = index - (shift << SUB_BUCKET_BITS)
+    return (mantissa + 1) << shift
+
+
+class Histogram:
+    """ Log-linear histogram of non-negative integers """
+
+    __slots__ = ("counts", "count", "total", "max")
+
+    def __init__(self):
+        self.counts = [0] * 256  # enough for values up to ~2 ** 32, grown past that
+        self.count = 0
+        self.total = 0
+        self.max = 0
+
+    def record(self, value):
+        # Buckets cover (lower, upper], so a power of two closes a bucket, like Prometheus' le
+        shifted = value - 1 if value > 0 else 0
+        if shifted < LINEAR_LIMIT:
+            index = shifted
+        else:
+            shift = shifted.bit_length() - SUB_BUCKET_BITS - 1
+            index = (shift << SUB_BUCKET_BITS) + (shifted >> shift)
+        try:
+            self.counts[index] += 1
+        except IndexError:
+            self.counts.extend([0] * (index + 1 - len(self.counts)))
+            self.counts[index] += 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    @property
+    def min(self):
+        """ Lower bound of the lowest non-empty bucket """
+        for index, count in enumerate(self.counts):
+            if count:
+                return _bucket_upper(index - 1) if index else 0
+        return 0
+
+    def percentile(self, percent):
+        """ Upper bound of the bucket holding the `percent` percentile, capped at max """
+        if not self.count:
+            return 0
+        rank = max(1, -(-self.count * percent // 100))
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                return min(_bucket_upper(index), self.max)
+        return self.max
+
+    def cumulative(self, bounds):
+        """ [(bound, values <= bound)] for ascending `bounds` that are powers of two """
+        result = []
+        seen = 0
+        index = 0
+        for bound in bounds:
+            while index < len(self.counts) and _bucket_upper(index) <= bound:
+                seen += self.counts[index]
+                index += 1
+            result.append((bound, seen))
+        return result
+
+
+class _MethodMetrics:
+    __slots__ = ("errors", "latency", "sizes")
+
+    def __init__(self, sized):
+        self.errors = {}  # error class -> count
+        self.latency = Histogram()  # nanoseconds, one value per call
+        self.sizes = Histogram() if sized else None
+
+
+class Metrics:
+    """ Counters and histograms of every instrumented method """
+
+    def __init__(self):
+        self._methods = {}
+        self._lock = threading.Lock()
+
+    def _method(self, name):
+        method = self._methods.get(name)
+        if method is None:
+            method = self._methods.setdefault(name, _MethodMetrics(name in QUERY_METHODS))
+        return method
+
+    def record(self, name, elapsed_ns, error=None, size=None):
+        method = self._method(name)
+        with self._lock:
+            method.latency.record(elapsed_ns)
+            if error is not None:
+                key = error_class(error)
+                method.errors[key] = method.errors.get(key, 0) + 1
+            if size is not None and method.sizes is not None:
+                method.sizes.record(size)
+
+    def snapshot(self):
+        """ {method: {"calls", "errors", "latency_us", "result_size"}} """
+        with self._lock:
+            result = {}
+            for name, method in sorted(self._methods.items()):
+                latency = method.latency
+                entry = {
+                    "calls": latency.count,
+                    "errors": dict(method.errors),
+                    "latency_us": {
+                        "sum": latency.total / 1000,
+                        "min": latency.min / 1000,
+                        "max": latency.max / 1000,
+                        "p50": latency.percentile(50) / 1000,
+                        "p90": latency.percentile(90) / 1000,
+                        "p99": latency.percentile(99) / 1000,
+                    },
+                }
+                if method.sizes is not None:
+                    sizes = method.sizes
+                    entry["result_size"] = {"count": sizes.count, "sum": sizes.total, "max": sizes.max,
+                                            "p50": sizes.percentile(50), "p99": sizes.percentile(99)}
+                result[name] = entry
+            return result
+
+    def prometheus(self, prefix="library"):
+        """ The metrics in the Prometheus text exposition format """
+        lines = [
+            f"# HELP {prefix}_calls_total Calls of each LibrarySystem method.",
+            f"# TYPE {prefix}_calls_total counter",
+        ]
+        with self._lock:
+            methods = sorted(self._methods.items())
+            lines += [f'{prefix}_calls_total{{method="{name}"}} {method.latency.count}' for name, method in methods]
+
+            lines += [f"# HELP {prefix}_errors_total Exceptions raised by each method, by message class.",
+                      f"# TYPE {prefix}_errors_total counter"]
+            for name, method in methods:
+                for error, count in sorted(method.errors.items()):
+                    lines.append(f'{prefix}_errors_total{{method="{name}",error="{_label(error)}"}} {count}')
+
+            lines += [f"# HELP {prefix}_call_duration_seconds Latency of each method.",
+                      f"# TYPE {prefix}_call_duration_seconds histogram"]
+            for name, method in methods:
+                lines += _histogram_lines(f"{prefix}_call_duration_seconds", name, method.latency,
+                                          LATENCY_BOUNDS_NS, 1e-9)
+
+            lines += [f"# HELP {prefix}_result_size Items returned by each query method.",
+                      f"# TYPE {prefix}_result_size histogram"]
+            for name, method in methods:
+                if method.sizes is not None:
+                    lines += _histogram_lines(f"{prefix}_result_size", name, method.sizes, SIZE_BOUNDS, 1)
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path, prefix="library"):
+        """ Writes prometheus() to `path` atomically, for the node_exporter textfile collector """
+        directory = os.path.dirname(os.path.abspath(path))
+        with tempfile.NamedTemporaryFile("w", dir=directory, delete=False, encoding="utf-8", suffix=".tmp") as file:
+            file.write(self.prometheus(prefix))
+        os.replace(file.name, path)
+
+
+def _label(value):
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _histogram_lines(metric, name, histogram, bounds, scale):
+    lines = [f'{metric}_bucket{{method="{name}",le="{_number(bound * scale)}"}} {count}'
+             for bound, count in histogram.cumulative(bounds)]
+    lines.append(f'{metric}_bucket{{method="{name}",le="+Inf"}} {histogram.count}')
+    lines.append(f'{metric}_sum{{method="{name}"}} {_number(histogram.total * scale)}')
+    lines.append(f'{metric}_count{{method="{name}"}} {histogram.count}')
+    return lines
+
+
+def public_methods(cls):
+    """ Names of the instance methods of `cls` to instrument """
+    return [
+        name for name, member in inspect.getmembers(cls)
+        if not name.startswith("_") and name not in NOT_INSTRUMENTED
+        and inspect.isfunction(inspect.getattr_static(cls, name))
+    ]
+
+
+def instrument(system, metrics):
+    """ Shadows every public method of `system` with a recording wrapper. Only a
+    concurrent system pays for a lock around the recording """
+    lock = metrics._lock if system.concurrent else None
+    for name in public_methods(type(system)):
+        setattr(system, name, _wrap(getattr(system, name), name, metrics, lock))
+
+
+def uninstrument(system):
+    for name in public_methods(type(system)):
+        system.__dict__.pop(name, None)
+
+
+def _wrap(method, name, metrics, lock):
+    clock = time.perf_counter_ns
+    stats = metrics._method(name)
+    latency = stats.latency
+    sizes = stats.sizes
+
+    def record(elapsed, result):
+        latency.record(elapsed)
+        if sizes is not None and hasattr(result, "__len__"):
+            sizes.record(len(result))
+
+    if lock is not None:
+        def record(elapsed, result, unlocked=record):
+            with lock:
+                unlocked(elapsed, result)
+
+    if sizes is None and lock is None:
+        # The common case, kept to the bare minimum
+        record_latency = latency.record
+
+        @functools.wraps(method)
+        def wrapper(*args, **kwargs):
+            started = clock()
+            try:
+                result = method(*args, **kwargs)
+            except Exception as error:
+                metrics.record(name, clock() - started, error=error)
+                raise
+            record_latency(clock() - started)
+            return result
+        return wrapper
+
+    @functools.wraps(method)
+    def wrapper(*args, **kwargs):
+        started = clock()
+        try:
+            result = method(*args, **kwargs)
+        except Exception as error:
+            metrics.record(name, clock() - started, error=error)
+            raise
+        record(clock() - started, result)
+        return result
+    return wrapper
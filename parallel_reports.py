@@ -0,0 +1,158 @@
+""" generate_reports computed by a pool of worker processes.
+
+The library is exported as a snapshot (see snapshot.py), which is already a
+columnar file: book statuses and categories, user active flags and the flags and
+due dates of every borrow record are plain arrays. Each worker memory-maps the
+file once, aggregates the row ranges (shards) it is handed and returns a few
+counters; the parent adds them up into the same dict as
+LibrarySystem.generate_reports. Nothing but file paths, row ranges and counters
+crosses process boundaries, and "now" is read once per report, not per record.
+
+    with ParallelReportEngine(workers=8) as engine:
+        report = engine.generate_reports(system)
+        report = engine.generate_reports("library.snapshot")
+"""
+import os
+import tempfile
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+from borrow_log import RETURNED, EXTENDED, to_epoch
+from library_management_system import BookStatus
+from snapshot import STATUSES, open_snapshot
+
+
+AVAILABLE = STATUSES.index(BookStatus.AVAILABLE)
+BORROWED = STATUSES.index(BookStatus.BORROWED)
+
+# Flag bytes of a record that is still out
+OPEN_FLAGS = (b"\0", bytes([EXTENDED]))
+
+# Below this many rows a table is not worth splitting any further
+MIN_SHARD_ROWS = 16_384
+
+_snapshots = {}  # (path, inode, mtime) -> (header, reader), one cache per worker process
+
+
+def _open(path):
+    stat = os.stat(path)
+    key = (path, stat.st_ino, stat.st_mtime_ns)
+    if key not in _snapshots:
+        _snapshots.clear()
+        _snapshots[key] = open_snapshot(path)
+    return _snapshots[key]
+
+
+def _book_shard(reader, start, stop):
+    statuses = bytes(reader.column("books.status")[start:stop])
+    return {
+        "total_books": stop - start,
+        "available_books": statuses.count(AVAILABLE),
+        "borrowed_books": statuses.count(BORROWED),
+        "categories": Counter(reader.column("books.category")[start:stop].tolist()),
+    }
+
+
+def _user_shard(reader, start, stop):
+    return {
+        "total_users": stop - start,
+        "active_users": bytes(reader.column("users.active")[start:stop]).count(1),
+    }
+
+
+def _record_shard(reader, log, start, stop, now):
+    flags = bytes(reader.column(log + ".flags")[start:stop])
+    current = sum(flags.count(flag) for flag in OPEN_FLAGS)
+    overdue = 0
+    if current:
+        # Only shards holding open loans need their due dates
+        due_dates = reader.column(log + ".due_dates")[start:stop]
+        for flag, due in zip(flags, due_dates):
+            if not flag & RETURNED and due < now:
+                overdue += 1
+    return {"current_borrows": current, "overdue_borrows": overdue}
+
+
+def aggregate_shard(path, table, start, stop, now):
+    """ Partial report over rows [start, stop) of one table of a snapshot.
+    `now` is in epoch microseconds (see borrow_log.to_epoch) """
+    _, reader = _open(path)
+    if table == "books":
+        return _book_shard(reader, start, stop)
+    if table == "users":
+        return _user_shard(reader, start, stop)
+    if table in ("active", "archive"):
+        return _record_shard(reader, table, start, stop, now)
+    raise ValueError(f"Unknown table {table!r}")
+
+
+def _ranges(count, shards):
+    size = max(MIN_SHARD_ROWS, -(-count // shards))
+    return [(start, min(start + size, count)) for start in range(0, count, size)]
+
+
+class ParallelReportEngine:
+    """ Computes LibrarySystem.generate_reports over a snapshot with a process pool.
+    workers=0 aggregates the shards in the calling process """
+
+    def __init__(self, workers=None, shards_per_worker=4):
+        self.workers = (os.cpu_count() or 1) if workers is None else workers
+        self.shards_per_worker = shards_per_worker
+        self._executor = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+    def _map(self, tasks):
+        if not self.workers:
+            return [aggregate_shard(*task) for task in tasks]
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(self.workers)
+        futures = [self._executor.submit(aggregate_shard, *task) for task in tasks]
+        return [future.result() for future in futures]
+
+    def generate_reports(self, source, now=None):
+        """ `source` is a LibrarySystem, exported to a temporary snapshot first,
+        or the path of a snapshot written by LibrarySystem.save """
+        if not isinstance(source, (str, os.PathLike)):
+            with tempfile.TemporaryDirectory() as directory:
+                path = os.path.join(directory, "report.snapshot")
+                source.save(path)
+                return self.generate_reports(path, now if now is not None else source.clock())
+
+        path = os.path.abspath(source)
+        header, _ = open_snapshot(path)
+        now = to_epoch(now if now is not None else datetime.now())
+
+        shards = max(1, self.workers) * self.shards_per_worker
+        tasks = [
+            (path, table, start, stop, now)
+            for table in ("books", "users", "active", "archive")
+            for start, stop in _ranges(header["counts"][table], shards)
+        ]
+
+        totals = Counter()
+        categories = Counter()
+        for partial in self._map(tasks):
+            categories.update(partial.pop("categories", {}))
+            totals.update(partial)
+
+        return {
+            "total_books": totals["total_books"],
+            "available_books": totals["available_books"],
+            "borrowed_books": totals["borrowed_books"],
+            "total_users": totals["total_users"],
+            "active_users": totals["active_users"],
+            "books_by_category": {header["categories"][code]: count for code, count in sorted(categories.items())},
+            "current_borrows": totals["current_borrows"],
+            "overdue_borrows": totals["overdue_borrows"],
+        }
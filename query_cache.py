@@ -0,0 +1,68 @@
+import time
+from collections import OrderedDict
+
+
+class QueryCache:
+    """ LRU cache of query results with an optional time to live.
+
+    Every entry is stored with the version of the data it was computed from (any
+    comparable value, e.g. a tuple of counters). A lookup with a different version
+    is a miss and drops the entry, so writers invalidate exactly the results that
+    depend on what they changed by bumping a counter, without scanning the cache.
+    """
+
+    def __init__(self, maxsize=1024, ttl=None, clock=time.monotonic):
+        if maxsize < 1:
+            raise ValueError("Cache size must be at least 1")
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._clock = clock
+        self._entries = OrderedDict()  # key -> (version, expires at or None, value)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0  # dropped to stay within maxsize
+        self.expirations = 0  # dropped because the ttl ran out
+        self.invalidations = 0  # dropped because the data changed
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key, version, default=None):
+        entry = self._entries.get(key)
+        if entry is not None:
+            entry_version, expires, value = entry
+            if entry_version != version:
+                del self._entries[key]
+                self.invalidations += 1
+            elif expires is not None and self._clock() >= expires:
+                del self._entries[key]
+                self.expirations += 1
+            else:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return value
+
+        self.misses += 1
+        return default
+
+    def put(self, key, version, value):
+        expires = None if self.ttl is None else self._clock() + self.ttl
+        self._entries[key] = (version, expires, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self):
+        return {
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "invalidations": self.invalidations,
+        }
@@ -0,0 +1,249 @@
+import re
+import heapq
+import itertools
+import unicodedata
+
+
+_TOKEN_RE = re.compile(r"[^\W_]+")
+
+# How much a hit in each field is worth when ranking results
+FIELD_WEIGHTS = {
+    "title": 3.0,
+    "author": 2.0,
+    "isbn": 1.0,
+    "year": 1.0,
+}
+
+# How much each kind of token match is worth
+EXACT_MATCH = 1.0
+PREFIX_MATCH = 0.75
+SUBSTRING_MATCH = 0.5
+
+GRAM_SIZE = 3
+
+
+def fold(text):
+    """ Lowercases and strips accents, so "Anéis" and "aneis" compare equal """
+    text = str(text)
+    if text.isascii():
+        return text.lower()
+    text = unicodedata.normalize("NFKD", text)
+    return "".join(char for char in text if not unicodedata.combining(char)).casefold()
+
+
+def tokenize(text):
+    return _TOKEN_RE.findall(fold(text))
+
+
+def year_key(year):
+    try:
+        return int(year)
+    except (TypeError, ValueError):
+        return year
+
+
+class SearchIndex:
+    """ Inverted index over book title, author, ISBN and publication year.
+
+    Postings map each token to the books that contain it. A second index maps the
+    1..GRAM_SIZE-grams of every token in the vocabulary to the tokens themselves,
+    so substring queries, even of one or two characters, only touch the vocabulary
+    and the matching postings, never the whole catalog.
+    """
+
+    def __init__(self):
+        self._postings = {}  # token -> {book_id: field weight}
+        self._grams = {}  # 1..GRAM_SIZE-gram -> set of tokens
+        self._documents = {}  # book_id -> (insertion order, year, {token: field weight})
+        self._by_year = {}  # year -> set of book_ids
+        self._order = itertools.count()
+        self._pending = {}  # book_id -> Book, indexed on the next search
+        self.version = 0  # changes whenever a search could return something else
+
+    def __len__(self):
+        self._flush()
+        return len(self._documents)
+
+    def __contains__(self, book_id):
+        return book_id in self._pending or book_id in self._documents
+
+    def add_later(self, book):
+        """ Queues `book` to be indexed right before the next search, e.g. while loading a snapshot """
+        self._pending[book.id] = book
+        self.version += 1
+
+    def _flush(self):
+        if not self._pending:
+            return
+        pending, self._pending = self._pending, {}
+        for book in pending.values():
+            self.add(book)
+
+    @staticmethod
+    def _document_tokens(book):
+        tokens = {}
+
+        def add(token, field):
+            weight = FIELD_WEIGHTS[field]
+            if tokens.get(token, 0) < weight:
+                tokens[token] = weight
+
+        for token in tokenize(book.title):
+            add(token, "title")
+        for token in tokenize(book.author):
+            add(token, "author")
+
+        isbn_parts = tokenize(book.isbn)
+        for token in isbn_parts:
+            add(token, "isbn")
+        if len(isbn_parts) > 1:
+            add("".join(isbn_parts), "isbn")
+
+        if book.publication_year is not None:
+            for token in tokenize(book.publication_year):
+                add(token, "year")
+
+        return tokens
+
+    @staticmethod
+    def _token_grams(token):
+        grams = set(token)  # the single characters, cheapest built apart
+        for size in range(2, GRAM_SIZE + 1):
+            grams.update(token[start:start + size] for start in range(len(token) - size + 1))
+        return grams
+
+    def add(self, book):
+        """ Indexes `book`, or re-indexes it in place when it is already known """
+        self.version += 1
+        if self._pending:
+            # Keep insertion order: anything added behind queued books waits with them
+            self._pending[book.id] = book
+            return
+
+        if book.id in self._documents:
+            order = self._documents[book.id][0]
+            self.remove(book.id)
+        else:
+            order = next(self._order)
+
+        tokens = self._document_tokens(book)
+        year = year_key(book.publication_year)
+        self._documents[book.id] = (order, year, tokens)
+        self._by_year.setdefault(year, set()).add(book.id)
+
+        for token, weight in tokens.items():
+            posting = self._postings.get(token)
+            if posting is None:
+                posting = self._postings[token] = {}
+                grams = self._grams
+                for gram in self._token_grams(token):
+                    vocabulary = grams.get(gram)
+                    if vocabulary is None:
+                        grams[gram] = {token}
+                    else:
+                        vocabulary.add(token)
+            posting[book.id] = weight
+
+    def remove(self, book_id):
+        self.version += 1
+        if self._pending.pop(book_id, None) is not None:
+            return True
+
+        document = self._documents.pop(book_id, None)
+        if document is None:
+            return False
+
+        _, year, tokens = document
+
+        same_year = self._by_year[year]
+        same_year.discard(book_id)
+        if not same_year:
+            del self._by_year[year]
+
+        for token in tokens:
+            posting = self._postings[token]
+            del posting[book_id]
+            if posting:
+                continue
+            # Last book using this token, drop it from the vocabulary
+            del self._postings[token]
+            for gram in self._token_grams(token):
+                vocabulary = self._grams[gram]
+                vocabulary.discard(token)
+                if not vocabulary:
+                    del self._grams[gram]
+
+        return True
+
+    def _matching_tokens(self, query_token):
+        if len(query_token) <= GRAM_SIZE:
+            # Up to a trigram long the query is a gram itself
+            candidates = self._grams.get(query_token, ())
+        else:
+            grams = [query_token[i:i + GRAM_SIZE] for i in range(len(query_token) - GRAM_SIZE + 1)]
+            gram_sets = sorted((self._grams.get(gram, set()) for gram in grams), key=len)
+            candidates = set(gram_sets[0]).intersection(*gram_sets[1:])
+
+        for token in candidates:
+            if token == query_token:
+                yield token, EXACT_MATCH
+            elif token.startswith(query_token):
+                yield token, PREFIX_MATCH
+            elif query_token in token:
+                yield token, SUBSTRING_MATCH
+
+    def _score_query_token(self, query_token):
+        scores = {}
+        for token, match_weight in self._matching_tokens(query_token):
+            for book_id, field_weight in self._postings[token].items():
+                score = field_weight * match_weight
+                if scores.get(book_id, 0) < score:
+                    scores[book_id] = score
+        return scores
+
+    def search(self, query, year=None, limit=None, offset=0):
+        """ Returns the ids of the books matching every token of `query`, best matches first """
+
+        if offset < 0:
+            raise ValueError("Offset must not be negative")
+        if limit is not None and limit < 0:
+            raise ValueError("Limit must not be negative")
+
+        ranked = self.ranked(query, year=year, limit=None if limit is None else offset + limit)
+        return [book_id for _, book_id in ranked[offset:]]
+
+    def ranked(self, query, year=None, limit=None):
+        """ (rank, book_id) pairs of the `limit` best matches, in rank order. Ranks are
+        (-score, insertion order), so indexes sharing an order counter can be merged """
+
+        self._flush()
+        query_tokens = list(dict.fromkeys(tokenize(query)))
+
+        if not query_tokens:
+            # Empty query lists the catalog, optionally restricted to one year
+            if year is None:
+                book_ids = self._documents.keys()
+            else:
+                book_ids = self._by_year.get(year_key(year), ())
+            ranked = sorted(((0, self._documents[book_id][0]), book_id) for book_id in book_ids)
+            return ranked[:limit]
+
+        per_token = sorted((self._score_query_token(token) for token in query_tokens), key=len)
+        if not per_token[0]:
+            return []
+
+        scores = dict(per_token[0])
+        for token_scores in per_token[1:]:
+            scores = {book_id: score + token_scores[book_id]
+                      for book_id, score in scores.items() if book_id in token_scores}
+            if not scores:
+                return []
+
+        if year is not None:
+            same_year = self._by_year.get(year_key(year), set())
+            scores = {book_id: score for book_id, score in scores.items() if book_id in same_year}
+
+        ranked = (((-score, self._documents[book_id][0]), book_id) for book_id, score in scores.items())
+        if limit is None:
+            return sorted(ranked)
+        return heapq.nsmallest(limit, ranked)
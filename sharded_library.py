@@ -0,0 +1,551 @@
+""" A library split over several independent LibrarySystem shards.
+
+Books and users are hash-partitioned by id, so every lookup by id touches one
+shard. A borrow record lives in the shard of its book; when the user lives in
+another shard the coordinator locks both and applies the loan to the two shards
+in one step. Lookups that cannot be routed (ISBN, email, search, overdue loans,
+reports) are scattered to every shard and the answers gathered.
+
+    library = ShardedLibrarySystem(shards=8)
+    book_id = library.add_book(...)
+"""
+import os
+import uuid
+import zlib
+import heapq
+import itertools
+import threading
+from collections.abc import Mapping
+
+from clock import SYSTEM_CLOCK
+from events import EventLog
+from library_management_system import (Book, BOOK_FIELDS, LibrarySystem, LockTable, User, UserRole,
+                                       USER_FIELDS, _NO_LOCK, _check_limit, _checkin, _checkout, _durable,
+                                       _resume, _unpack_row)
+
+
+def shard_index(entity_id, shards):
+    """ Stable across processes, unlike hash() """
+    return zlib.crc32(entity_id.encode("utf-8")) % shards
+
+
+class _ShardedView(Mapping):
+    """ Read-only union of one collection (books, users, borrow_records) of every shard """
+
+    def __init__(self, system, attribute, routed):
+        self._system = system
+        self._attribute = attribute
+        self._routed = routed
+
+    def _collections(self):
+        return [getattr(shard, self._attribute) for shard in self._system.shards]
+
+    def __getitem__(self, key):
+        if self._routed:
+            return getattr(self._system._shard_of(key), self._attribute)[key]
+        for collection in self._collections():
+            if key in collection:
+                return collection[key]
+        raise KeyError(key)
+
+    def __contains__(self, key):
+        try:
+            self[key]
+        except (KeyError, AttributeError):
+            return False
+        return True
+
+    def __iter__(self):
+        return itertools.chain.from_iterable(self._collections())
+
+    def __len__(self):
+        return sum(len(collection) for collection in self._collections())
+
+
+class ShardedLibrarySystem:
+    def __init__(self, shards=4, concurrent=False, clock=None, borrow_limits=None, hold_priorities=None,
+                 hold_pickup_days=3):
+        if shards < 1:
+            raise ValueError("A sharded library needs at least one shard")
+        self.concurrent = concurrent
+        self.clock = clock if clock is not None else SYSTEM_CLOCK
+        self._entity_locks = LockTable() if concurrent else None
+        # Serializes the scatter-gather uniqueness checks of ISBNs and emails with the inserts
+        self._catalog_lock = threading.Lock() if concurrent else _NO_LOCK
+        self._search_order = itertools.count()
+        self.metrics = None  # metrics.Metrics of the coordinator's public methods, see enable_metrics
+
+        self.books = _ShardedView(self, "books", routed=True)
+        self.users = _ShardedView(self, "users", routed=True)
+        self.borrow_records = _ShardedView(self, "borrow_records", routed=False)
+        self._attach([LibrarySystem(concurrent=concurrent, borrow_limits=borrow_limits, hold_priorities=hold_priorities,
+                                    hold_pickup_days=hold_pickup_days) for _ in range(shards)])
+
+    def _attach(self, shards):
+        self.shards = shards
+        for shard in shards:
+            shard.clock = self.clock
+            shard.allowed_categories = shards[0].allowed_categories
+            shard.borrow_limits = shards[0].borrow_limits
+            # Holds live in the shard of their book, their holder may live in any shard
+            shard._holders = self.users
+            # One insertion order across shards, so scattered search results merge stably
+            shard._search_index._order = self._search_order
+
+        # Loans whose user lives in another shard are not linked by a shard's own
+        # load or recovery, since that shard does not know the user
+        for shard in shards:
+            for record in shard.borrow_records.live():
+                if record.is_returned or record.user_id in shard.users:
+                    continue
+                user = self._user(record.user_id)
+                if user is not None:
+                    user.borrowed_books.add(record.id)
+
+    def _shard_of(self, entity_id):
+        return self.shards[shard_index(entity_id, len(self.shards))]
+
+    def _record_shard(self, record_id):
+        for shard in self.shards:
+            if record_id in shard.borrow_records:
+                return shard
+        return None
+
+    def _lock_entities(self, *keys):
+        if self._entity_locks is None:
+            return _NO_LOCK
+        return self._entity_locks.hold(*keys)
+
+    @property
+    def allowed_categories(self):
+        return self.shards[0].allowed_categories
+
+    @allowed_categories.setter
+    def allowed_categories(self, categories):
+        for shard in self.shards:
+            shard.allowed_categories = categories
+
+    @property
+    def borrow_limits(self):
+        return self.shards[0].borrow_limits
+
+    @borrow_limits.setter
+    def borrow_limits(self, limits):
+        for shard in self.shards:
+            shard.borrow_limits = limits
+
+    @property
+    def _journal_durable(self):
+        return any(shard._journal_durable for shard in self.shards)
+
+    def _journals(self):
+        return [journal for shard in self.shards for journal in shard._journals()]
+
+    @property
+    def events(self):
+        return self.shards[0].events
+
+    @events.setter
+    def events(self, events):
+        for shard in self.shards:
+            shard.events = events
+
+    # Books
+
+    @_durable
+    def add_book(self, title, author, isbn, publication_year, category):
+        self.shards[0]._check_new_book(title, author, isbn, category)
+
+        with self._catalog_lock:
+            if self._book_by_isbn(isbn) is not None:
+                raise ValueError(f"A book with ISBN {isbn} already exists")
+            book = Book(title, author, isbn, publication_year, category, str(uuid.uuid4()), self.clock())
+            self._shard_of(book.id).books[book.id] = book
+        return book.id
+
+    @_durable
+    def add_books_bulk(self, rows):
+        """ Same contract as LibrarySystem.add_books_bulk, one add_book per row """
+        ids = []
+        errors = {}
+        for index, row in enumerate(rows):
+            try:
+                ids.append(type(self).add_book(self, *_unpack_row(row, BOOK_FIELDS, len(BOOK_FIELDS))))
+            except ValueError as error:
+                ids.append(None)
+                errors[index] = str(error)
+        return {"ids": ids, "errors": errors}
+
+    @_durable
+    def update_book(self, book_id, **kwargs):
+        return self._shard_of(book_id).update_book(book_id, **kwargs)
+
+    def get_book(self, book_id):
+        return self._book(book_id)
+
+    def _book(self, book_id):
+        # The lookups the other methods make go through these, so enabled metrics count only the outer call
+        return self._shard_of(book_id).get_book(book_id)
+
+    def get_book_by_isbn(self, isbn):
+        return self._book_by_isbn(isbn)
+
+    def _book_by_isbn(self, isbn):
+        for shard in self.shards:
+            book = shard.get_book_by_isbn(isbn)
+            if book is not None:
+                return book
+        return None
+
+    def get_all_books(self, status=None, category=None):
+        return [book for shard in self.shards for book in shard.get_all_books(status, category)]
+
+    def iter_books(self, status=None, category=None, after=None, limit=None):
+        """ Every shard's books in id order, merged, so cursors work as in LibrarySystem """
+        _check_limit(limit)
+        books = heapq.merge(*(shard.iter_books(status, category, after) for shard in self.shards),
+                            key=lambda book: book.id)
+        return itertools.islice(books, limit)
+
+    def search_books(self, query, year=None, limit=None, offset=0):
+        """ Same ranking as LibrarySystem.search_books: every shard returns its best
+        offset + limit matches and the sorted lists are merged """
+        if offset < 0:
+            raise ValueError("Offset must not be negative")
+        if limit is not None and limit < 0:
+            raise ValueError("Limit must not be negative")
+
+        stop = None if limit is None else offset + limit
+        ranked = []
+        for shard in self.shards:
+            with shard._index_lock:
+                ranked.append([(rank, book_id, shard) for rank, book_id in
+                               shard._search_index.ranked(query, year=year, limit=stop)])
+
+        matches = itertools.islice(heapq.merge(*ranked), offset, stop)
+        return [shard.books[book_id] for _, book_id, shard in matches]
+
+    # Users
+
+    @_durable
+    def add_user(self, name, email, role=UserRole.MEMBER):
+        self.shards[0]._check_new_user(name, email)
+
+        with self._catalog_lock:
+            if self._user_by_email(email) is not None:
+                raise ValueError(f"A user with email {email} already exists")
+            user = User(name, email, role, str(uuid.uuid4()), self.clock())
+            self._shard_of(user.id).users[user.id] = user
+        return user.id
+
+    @_durable
+    def add_users_bulk(self, rows):
+        """ Same contract as LibrarySystem.add_users_bulk, one add_user per row """
+        ids = []
+        errors = {}
+        for index, row in enumerate(rows):
+            try:
+                name, email, role = _unpack_row(row, USER_FIELDS, 2)
+                if role is None:
+                    role = UserRole.MEMBER
+                elif not isinstance(role, UserRole):
+                    try:
+                        role = UserRole(role)
+                    except ValueError:
+                        raise ValueError(f"Role must be one of: {', '.join(r.value for r in UserRole)}")
+                ids.append(type(self).add_user(self, name, email, role))
+            except ValueError as error:
+                ids.append(None)
+                errors[index] = str(error)
+        return {"ids": ids, "errors": errors}
+
+    def get_user(self, user_id):
+        return self._user(user_id)
+
+    def _user(self, user_id):
+        return self._shard_of(user_id).get_user(user_id)
+
+    def get_user_by_email(self, email):
+        return self._user_by_email(email)
+
+    def _user_by_email(self, email):
+        for shard in self.shards:
+            user = shard.get_user_by_email(email)
+            if user is not None:
+                return user
+        return None
+
+    def get_all_users(self, role=None, active_only=True):
+        return [user for shard in self.shards for user in shard.get_all_users(role, active_only)]
+
+    def iter_users(self, role=None, active_only=True, after=None, limit=None):
+        _check_limit(limit)
+        users = heapq.merge(*(shard.iter_users(role, active_only, after) for shard in self.shards),
+                            key=lambda user: user.id)
+        return itertools.islice(users, limit)
+
+    # Loans, kept in the shard of the book
+
+    @_durable
+    def borrow_book(self, book_id, user_id, borrow_days=14):
+        book = self._book(book_id)
+        if book is None:
+            raise ValueError("Book not found")
+
+        user = self._user(user_id)
+        if user is None:
+            raise ValueError("User not found")
+
+        with self._lock_entities(("book", book_id), ("user", user_id)):
+            return self._shard_of(book_id)._lend(book, user, borrow_days)
+
+    def _loan(self, record_id):
+        shard = self._record_shard(record_id)
+        if shard is None:
+            raise ValueError("Borrow record not found")
+        return shard, shard.borrow_records[record_id]
+
+    @_durable
+    def return_book(self, record_id):
+        shard, record = self._loan(record_id)
+        with self._lock_entities(("book", record.book_id), ("user", record.user_id)):
+            return shard._take_back(record, self._user(record.user_id))
+
+    @_durable
+    def borrow_books(self, user_id, book_ids, borrow_days=14):
+        user = self._user(user_id)
+        if user is None:
+            raise ValueError("User not found")
+
+        book_ids = list(book_ids)
+        books = [self._book(book_id) for book_id in book_ids]
+        with self._lock_entities(("user", user_id), *(("book", book_id) for book_id in book_ids)):
+            return _checkout(user, book_ids, books, borrow_days, self.clock(), self.borrow_limits.get(user.role),
+                             lambda book: self._shard_of(book.id))
+
+    @_durable
+    def return_books(self, record_ids):
+        record_ids = list(record_ids)
+        loans = []
+        for record_id in record_ids:
+            shard = self._record_shard(record_id)
+            loans.append(None if shard is None else (shard, shard.borrow_records[record_id]))
+        users = [None if loan is None else self._user(loan[1].user_id) for loan in loans]
+
+        keys = {key for loan in loans if loan is not None
+                for key in (("book", loan[1].book_id), ("user", loan[1].user_id))}
+        with self._lock_entities(*keys):
+            return _checkin(record_ids, loans, users, self.clock())
+
+    # Holds, kept in the shard of the book
+
+    @_durable
+    def place_hold(self, book_id, user_id):
+        book = self._book(book_id)
+        if book is None:
+            raise ValueError("Book not found")
+
+        user = self._user(user_id)
+        if user is None:
+            raise ValueError("User not found")
+
+        with self._lock_entities(("book", book_id)):
+            return self._shard_of(book_id)._place_hold(book, user, self.clock())
+
+    @_durable
+    def cancel_hold(self, hold_id):
+        for shard in self.shards:
+            hold = shard.holds.get(hold_id)
+            if hold is not None:
+                with self._lock_entities(("book", hold.book_id)):
+                    return shard._cancel_hold(hold, self.clock())
+        raise ValueError("Hold not found")
+
+    def get_holds(self, book_id):
+        return self._shard_of(book_id).get_holds(book_id)
+
+    def get_user_holds(self, user_id):
+        return [hold for shard in self.shards for hold in shard.get_user_holds(user_id)]
+
+    @_durable
+    def expire_holds(self):
+        now = self.clock()
+        expired = 0
+        for shard in self.shards:
+            for hold in shard._holds_past_pickup(now):
+                with self._lock_entities(("book", hold.book_id)):
+                    expired += shard._expire_hold(hold, now)
+        return expired
+
+    @_durable
+    def extend_borrowing(self, record_id, additional_days=7):
+        shard, record = self._loan(record_id)
+        with self._lock_entities(("book", record.book_id), ("user", record.user_id)):
+            return shard._extend(record, additional_days)
+
+    def _records_due(self, start=None, end=None):
+        due = []
+        for shard in self.shards:
+            with shard._index_lock:
+                due.append(shard._active_records_due(start, end))
+        return heapq.merge(*due, key=lambda record: record.due_date)
+
+    def get_overdue_books(self):
+        return [
+            {"record": record, "book": self._book(record.book_id), "user": self._user(record.user_id)}
+            for record in self._records_due(end=self.clock())
+        ]
+
+    def iter_overdue(self, after=None, limit=None):
+        _check_limit(limit)
+        now = self.clock()
+        start = None
+        if after is not None:
+            shard, cursor = self._loan(after)
+            start = cursor.due_date
+
+        overdue = heapq.merge(*(shard._overdue(start, now) for shard in self.shards),
+                              key=lambda record: record.due_date)
+        if after is not None:
+            overdue = _resume(overdue, after, lambda record: record.due_date, start)
+        return itertools.islice(overdue, limit)
+
+    def get_due_between(self, start, end):
+        """ Active borrow records with start <= due_date < end, earliest first """
+        if start > end:
+            raise ValueError("Start must not be after end")
+        return list(self._records_due(start, end))
+
+    def get_borrow_history(self, user_id=None, book_id=None, start=None, end=None):
+        return list(type(self).iter_borrow_history(self, user_id, book_id, start, end))
+
+    def iter_borrow_history(self, user_id=None, book_id=None, start=None, end=None, after=None, limit=None):
+        if book_id:
+            return self._shard_of(book_id).iter_borrow_history(user_id, book_id, start, end, after, limit)
+
+        _check_limit(limit)
+        if after is not None:
+            shard, cursor = self._loan(after)
+            if end is not None and cursor.borrow_date >= end:
+                return iter(())
+            if start is None or start < cursor.borrow_date:
+                start = cursor.borrow_date
+
+        # Each shard's history is in borrow order, so the merge is too, as the cursor needs
+        histories = [shard._history(user_id, None, start, end) for shard in self.shards]
+        records = heapq.merge(*histories, key=lambda record: record.borrow_date)
+        if after is not None:
+            records = _resume(records, after, lambda record: record.borrow_date, cursor.borrow_date)
+        return itertools.islice(records, limit)
+
+    # Reports
+
+    def _merge_reports(self, reports):
+        merged = {}
+        for report in reports:
+            for key, value in report.items():
+                if key == "books_by_category":
+                    categories = merged.setdefault(key, {})
+                    for category, count in value.items():
+                        categories[category] = categories.get(category, 0) + count
+                else:
+                    merged[key] = merged.get(key, 0) + value
+        return merged
+
+    def generate_reports(self):
+        return self._merge_reports(shard.generate_reports() for shard in self.shards)
+
+    def recompute_reports(self):
+        return self._merge_reports(shard.recompute_reports() for shard in self.shards)
+
+    # Persistence: one snapshot or journal directory per shard
+
+    @staticmethod
+    def _shard_path(directory, index):
+        return os.path.join(directory, f"shard.{index}")
+
+    @classmethod
+    def _shard_paths(cls, directory):
+        count = len([name for name in os.listdir(directory) if name.startswith("shard.")])
+        if not count:
+            raise ValueError(f"{directory} holds no shards")
+        return [cls._shard_path(directory, index) for index in range(count)]
+
+    def save(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        for index, shard in enumerate(self.shards):
+            shard.save(self._shard_path(directory, index))
+
+    @classmethod
+    def load(cls, directory):
+        paths = cls._shard_paths(directory)
+        system = cls(shards=len(paths))
+        system._attach([LibrarySystem.load(path) for path in paths])
+        return system
+
+    def export(self, target, kind="books", format="ndjson"):
+        """ LibrarySystem.export over the merged cursors of every shard """
+        from export import export
+        return export(self, target, kind, format)
+
+    def enable_journal(self, directory, flush_interval=0.005, durable=False):
+        for index, shard in enumerate(self.shards):
+            shard.enable_journal(self._shard_path(directory, index), flush_interval, durable)
+
+    @classmethod
+    def recover(cls, directory, flush_interval=0.005, durable=False):
+        paths = cls._shard_paths(directory)
+        system = cls(shards=len(paths))
+        system._attach([LibrarySystem.recover(path, flush_interval, durable) for path in paths])
+        return system
+
+    def sync_journal(self):
+        for shard in self.shards:
+            shard.sync_journal()
+
+    def close_journal(self):
+        for shard in self.shards:
+            shard.close_journal()
+
+    def compact_journal(self, wait=False):
+        for shard in self.shards:
+            shard.compact_journal(wait)
+
+    # Change feed: one event log shared by every shard, so events keep a single order
+
+    def enable_events(self, capacity=8192):
+        if self.events is None:
+            self.events = EventLog(capacity)
+        return self.events
+
+    def disable_events(self):
+        events, self.events = self.events, None
+        return events
+
+    def subscribe(self, from_seq=None, strict=False):
+        if self.events is None:
+            raise ValueError("Events are not enabled")
+        return self.events.subscribe(from_seq, strict)
+
+    # Metrics of the coordinator's public methods, one call per request whatever the shards do
+
+    def enable_metrics(self):
+        from metrics import Metrics, instrument
+        if self.metrics is None:
+            self.metrics = Metrics()
+            instrument(self, self.metrics)
+        return self.metrics
+
+    def disable_metrics(self):
+        from metrics import uninstrument
+        uninstrument(self)
+        metrics, self.metrics = self.metrics, None
+        return metrics
+
+    def get_metrics(self):
+        return self.metrics.snapshot() if self.metrics is not None else {}
+
+    def write_metrics(self, path):
+        if self.metrics is None:
+            raise ValueError("Metrics are not enabled")
+        self.metrics.write_prometheus(path)
@@ -0,0 +1,261 @@
+""" Binary snapshots of a LibrarySystem.
+
+Layout: an 8-byte magic, the offset of the header (uint64), then one 8-byte aligned
+section per column and finally the JSON header describing every section as
+[offset, length, typecode]. Numbers are stored in native byte order, which the
+header records. Strings are stored as one UTF-8 text plus an int64 column of
+character offsets.
+
+Books and users are columnar too. Borrow records are written as two BorrowLogs:
+"open" loans, which become BorrowRecord objects on load, and "archive" (returned
+loans), which stays memory-mapped and is only read when a record is looked up.
+"""
+import os
+import sys
+import json
+import mmap
+import struct
+from array import array
+
+from borrow_log import BorrowLog, NO_DATE, to_epoch, from_epoch
+from library_management_system import Book, BookStatus, BorrowRecord, LibrarySystem, User, UserRole
+
+
+MAGIC = b"LIBSNAP1"
+VERSION = 1
+PREAMBLE = struct.Struct("<8sQ")
+ALIGNMENT = 8
+
+STATUSES = list(BookStatus)
+ROLES = list(UserRole)
+
+LOG_COLUMN_TYPES = {
+    "ids": "B",
+    "book_refs": "i",
+    "user_refs": "i",
+    "borrow_dates": "q",
+    "due_dates": "q",
+    "return_dates": "q",
+    "flags": "B",
+}
+
+
+class SnapshotError(ValueError):
+    pass
+
+
+class _Writer:
+    def __init__(self, file):
+        self.file = file
+        self.sections = {}
+
+    def column(self, name, typecode, values):
+        if not isinstance(values, (array, bytes, bytearray, memoryview)):
+            values = array(typecode, values)
+
+        padding = -self.file.tell() % ALIGNMENT
+        self.file.write(b"\0" * padding)
+        offset = self.file.tell()
+        data = memoryview(values).cast("B")
+        self.file.write(data)
+        self.sections[name] = [offset, data.nbytes, typecode]
+
+    def strings(self, name, values):
+        offsets = array("q", [0])
+        total = 0
+        for value in values:
+            total += len(value)
+            offsets.append(total)
+        self.column(name + ".offsets", "q", offsets)
+        self.column(name + ".text", "B", "".join(values).encode("utf-8"))
+
+    def log(self, name, log):
+        for column, buffer in log.columns().items():
+            self.column(f"{name}.{column}", LOG_COLUMN_TYPES[column], buffer)
+        self.strings(name + ".book_keys", log.book_keys)
+        self.strings(name + ".user_keys", log.user_keys)
+
+
+class _Reader:
+    def __init__(self, mapped, sections):
+        self.buffer = memoryview(mapped)
+        self.sections = sections
+
+    def column(self, name):
+        offset, length, typecode = self.sections[name]
+        view = self.buffer[offset:offset + length]
+        return view if typecode == "B" else view.cast(typecode)
+
+    def strings(self, name):
+        offsets = self.column(name + ".offsets").tolist()
+        text = str(self.column(name + ".text"), "utf-8")
+        return [text[start:stop] for start, stop in zip(offsets, offsets[1:])]
+
+    def log(self, name, sorted_rows=None):
+        columns = {column: self.column(f"{name}.{column}") for column in BorrowLog.COLUMNS}
+        return BorrowLog.from_columns(columns, self.strings(name + ".book_keys"),
+                                      self.strings(name + ".user_keys"), sorted_rows)
+
+
+def _copy_log(log):
+    """ In-memory, appendable copy of a (possibly memory-mapped) BorrowLog """
+    columns = {}
+    for name, buffer in log.columns().items():
+        if LOG_COLUMN_TYPES[name] == "B":
+            columns[name] = bytearray(buffer)
+        else:
+            columns[name] = array(LOG_COLUMN_TYPES[name])
+            columns[name].frombytes(memoryview(buffer).cast("B"))
+    return BorrowLog.from_columns(columns, log.book_keys, log.user_keys, log._sorted_rows)
+
+
+def _split_records(system):
+    archive = system.borrow_records.archive
+    returned = _copy_log(archive) if archive is not None else BorrowLog()
+    active = BorrowLog()
+
+    for record in system.borrow_records.live():
+        (returned if record.is_returned else active).append(record)
+
+    return returned, active
+
+
+def save_snapshot(system, path):
+    books = list(system.books.values())
+    users = list(system.users.values())
+    returned, active = _split_records(system)
+
+    years = [book.publication_year for book in books]
+    if all(year is None or (isinstance(year, int) and not isinstance(year, bool)) for year in years):
+        year_encoding = "int"
+    else:
+        year_encoding = "json"
+
+    categories = list(dict.fromkeys(book.category for book in books))
+    category_codes = {category: code for code, category in enumerate(categories)}
+
+    temporary_path = f"{path}.tmp"
+    with open(temporary_path, "wb") as file:
+        file.write(PREAMBLE.pack(MAGIC, 0))
+        writer = _Writer(file)
+
+        writer.strings("books.id", [book.id for book in books])
+        writer.strings("books.title", [book.title for book in books])
+        writer.strings("books.author", [book.author for book in books])
+        writer.strings("books.isbn", [book.isbn for book in books])
+        if year_encoding == "int":
+            writer.column("books.publication_year", "q", (NO_DATE if year is None else year for year in years))
+        else:
+            writer.strings("books.publication_year", [json.dumps(year) for year in years])
+        writer.column("books.category", "i", (category_codes[book.category] for book in books))
+        writer.column("books.status", "B", (STATUSES.index(book.status) for book in books))
+        writer.column("books.added_date", "q", (to_epoch(book.added_date) for book in books))
+        writer.column("books.last_updated", "q", (to_epoch(book.last_updated) for book in books))
+
+        writer.strings("users.id", [user.id for user in users])
+        writer.strings("users.name", [user.name for user in users])
+        writer.strings("users.email", [user.email for user in users])
+        writer.column("users.role", "B", (ROLES.index(user.role) for user in users))
+        writer.column("users.joined_date", "q", (to_epoch(user.joined_date) for user in users))
+        writer.column("users.active", "B", (user.active for user in users))
+
+        writer.log("active", active)
+        writer.log("archive", returned)
+        writer.column("archive.sorted_rows", "i", returned.sorted_rows())
+
+        header = {
+            "version": VERSION,
+            "byteorder": sys.byteorder,
+            "allowed_categories": system.allowed_categories,
+            "borrow_limits": {role.value: limit for role, limit in system.borrow_limits.items()},
+            "categories": categories,
+            "publication_year": year_encoding,
+            "counts": {"books": len(books), "users": len(users),
+                       "active": len(active), "archive": len(returned)},
+            "sections": writer.sections,
+        }
+        header_offset = file.tell()
+        file.write(json.dumps(header).encode("utf-8"))
+        file.seek(0)
+        file.write(PREAMBLE.pack(MAGIC, header_offset))
+
+    os.replace(temporary_path, path)
+
+
+def open_snapshot(path):
+    """ Memory-maps a snapshot and returns (header, reader) without materializing anything """
+    with open(path, "rb") as file:
+        # Copy-on-write: archived records stay writable without touching the file
+        mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_COPY)
+
+    magic, header_offset = PREAMBLE.unpack_from(mapped)
+    if magic != MAGIC:
+        raise SnapshotError(f"{path} is not a library snapshot")
+    header = json.loads(str(mapped[header_offset:], "utf-8"))
+    if header["version"] != VERSION:
+        raise SnapshotError(f"Unsupported snapshot version {header['version']}")
+    if header["byteorder"] != sys.byteorder:
+        raise SnapshotError(f"Snapshot was written on a {header['byteorder']}-endian machine")
+
+    return header, _Reader(mapped, header["sections"])
+
+
+def load_snapshot(path, system_class=LibrarySystem):
+    header, reader = open_snapshot(path)
+    system = system_class()
+    system.allowed_categories = header["allowed_categories"]
+    # Snapshots written before per-role limits keep the defaults
+    system.borrow_limits.update((UserRole(role), limit) for role, limit in header.get("borrow_limits", {}).items())
+
+    _load_books(system, reader, header)
+    _load_users(system, reader)
+
+    for view in reader.log("active").views():
+        record = BorrowRecord(view.book_id, view.user_id, record_id=view.id, borrow_date=view.borrow_date)
+        record.due_date = view.due_date
+        record.extended = view.extended
+        system.borrow_records[record.id] = record
+        if record.user_id in system.users:
+            system.users[record.user_id].borrowed_books.add(record.id)
+
+    if header["counts"]["archive"]:
+        system.borrow_records.archive = reader.log("archive", reader.column("archive.sorted_rows"))
+
+    return system
+
+
+def _load_books(system, reader, header):
+    ids = reader.strings("books.id")
+    titles = reader.strings("books.title")
+    authors = reader.strings("books.author")
+    isbns = reader.strings("books.isbn")
+    if header["publication_year"] == "int":
+        years = [None if year == NO_DATE else year for year in reader.column("books.publication_year").tolist()]
+    else:
+        years = [json.loads(year) for year in reader.strings("books.publication_year")]
+    categories = [header["categories"][code] for code in reader.column("books.category").tolist()]
+    statuses = [STATUSES[code] for code in reader.column("books.status").tolist()]
+    added_dates = reader.column("books.added_date").tolist()
+    last_updated = reader.column("books.last_updated").tolist()
+
+    for index, book_id in enumerate(ids):
+        book = Book(titles[index], authors[index], isbns[index], years[index], categories[index],
+                    book_id, from_epoch(added_dates[index]))
+        book.status = statuses[index]
+        book.last_updated = from_epoch(last_updated[index])
+        dict.__setitem__(system.books, book_id, book)
+        system._index_book(book, defer_search=True)
+
+
+def _load_users(system, reader):
+    ids = reader.strings("users.id")
+    names = reader.strings("users.name")
+    emails = reader.strings("users.email")
+    roles = reader.column("users.role").tolist()
+    joined_dates = reader.column("users.joined_date").tolist()
+    active = reader.column("users.active").tolist()
+
+    for index, user_id in enumerate(ids):
+        user = User(names[index], emails[index], ROLES[roles[index]], user_id, from_epoch(joined_dates[index]))
+        user.active = bool(active[index])  # before it is added, which counts active users
+        system.users[user_id] = user
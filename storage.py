@@ -0,0 +1,330 @@
+""" Storage backends for LibrarySystem.
+
+A backend provides the three collections of a LibrarySystem (books, users,
+borrow_records) through `collections(system)`. MemoryStorage, the default, keeps
+plain dicts. SQLiteStorage keeps the entities in SQLite tables instead:
+
+    storage = SQLiteStorage("library.db")
+    system = LibrarySystem(storage=storage)
+
+Entities are loaded on access and kept in an identity map only while something
+still references them, so the process holds the in-memory indexes (ids, ISBNs,
+emails, search terms) but not every Book, User and BorrowRecord. Changes made
+through LibrarySystem and the entity methods are written through to SQLite at
+once; reopening the same file rebuilds the indexes from the tables.
+
+Lookups by ISBN, email, status, category, book and due date are all answered
+by those in-memory indexes, never by SQL, so the tables carry no secondary
+index for them: SQLite is the store, not the query engine. The process
+therefore needs RAM for the whole index set, roughly the in-memory library
+minus the entity objects: every id, ISBN and email, the search postings, and
+the loan history id lists of every book and user. The only SQL lookup is a
+user's open loans, read when a User is loaded.
+
+Writes share one connection behind a lock; readers take a connection from a
+pool, so several threads can read at the same time. Every statement is a
+constant, parameterized SQL string, which sqlite3 prepares once per connection
+and keeps in its statement cache.
+"""
+import json
+import uuid
+import queue
+import sqlite3
+import weakref
+import threading
+import contextlib
+from collections.abc import MutableMapping
+
+from borrow_log import to_epoch, from_epoch
+from library_management_system import Book, BookStatus, BorrowRecord, User, UserRole
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS books (
+    id TEXT PRIMARY KEY,
+    title TEXT NOT NULL,
+    author TEXT NOT NULL,
+    isbn TEXT NOT NULL,
+    publication_year TEXT NOT NULL,
+    category TEXT NOT NULL,
+    status TEXT NOT NULL,
+    added_date INTEGER NOT NULL,
+    last_updated INTEGER NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS users (
+    id TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    email TEXT NOT NULL,
+    role TEXT NOT NULL,
+    joined_date INTEGER NOT NULL,
+    active INTEGER NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS borrow_records (
+    id TEXT PRIMARY KEY,
+    book_id TEXT NOT NULL,
+    user_id TEXT NOT NULL,
+    borrow_date INTEGER NOT NULL,
+    due_date INTEGER NOT NULL,
+    return_date INTEGER,
+    is_returned INTEGER NOT NULL,
+    extended INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS borrow_records_user_id ON borrow_records (user_id, is_returned);  -- _UserTable.LOANS
+
+-- Indexes older files carry, only slowing writes down; the in-memory indexes answer these lookups
+DROP INDEX IF EXISTS books_isbn;
+DROP INDEX IF EXISTS books_status;
+DROP INDEX IF EXISTS books_category;
+DROP INDEX IF EXISTS users_email;
+DROP INDEX IF EXISTS borrow_records_book_id;
+DROP INDEX IF EXISTS borrow_records_due_date;
+"""
+
+
+class _SQLiteCollection(MutableMapping):
+    """ One table seen as a dict of entities, calling the same hooks as the in-memory collections """
+
+    TABLE = None
+    COLUMNS = ()
+
+    def __init__(self, storage, system, on_add, on_remove):
+        self._storage = storage
+        self._system = system
+        self._on_add = on_add
+        self._on_remove = on_remove
+        self._live = weakref.WeakValueDictionary()  # id -> entity, while referenced elsewhere
+        self._lock = threading.Lock()
+
+        columns = ", ".join(self.COLUMNS)
+        updates = ", ".join(f"{column} = excluded.{column}" for column in self.COLUMNS[1:])
+        self._select_one = f"SELECT {columns} FROM {self.TABLE} WHERE id = ?"
+        self._select_all = f"SELECT {columns} FROM {self.TABLE} ORDER BY rowid"
+        self._select_ids = f"SELECT id FROM {self.TABLE} ORDER BY rowid"
+        self._exists = f"SELECT 1 FROM {self.TABLE} WHERE id = ?"
+        self._count = f"SELECT COUNT(*) FROM {self.TABLE}"
+        self._delete = f"DELETE FROM {self.TABLE} WHERE id = ?"
+        self._delete_all = f"DELETE FROM {self.TABLE}"
+        # An upsert keeps the rowid, so iteration order stays insertion order like a dict
+        self._upsert = (f"INSERT INTO {self.TABLE} ({columns}) VALUES ({', '.join('?' * len(self.COLUMNS))}) "
+                        f"ON CONFLICT (id) DO UPDATE SET {updates}")
+
+    def _to_row(self, entity):
+        raise NotImplementedError
+
+    def _from_row(self, row):
+        raise NotImplementedError
+
+    def _entity(self, row):
+        """ The live object for a row, creating it if nothing references it any more """
+        entity = self._live.get(row[0])
+        if entity is not None:
+            return entity
+        entity = self._from_row(row)
+        with self._lock:
+            return self._live.setdefault(row[0], entity)
+
+    def __getitem__(self, key):
+        entity = self._live.get(key)
+        if entity is not None:
+            return entity
+        with self._storage.reader() as connection:
+            row = connection.execute(self._select_one, (key,)).fetchone()
+        if row is None:
+            raise KeyError(key)
+        return self._entity(row)
+
+    def __contains__(self, key):
+        if key in self._live:
+            return True
+        with self._storage.reader() as connection:
+            return connection.execute(self._exists, (key,)).fetchone() is not None
+
+    def __setitem__(self, key, value):
+        if key in self:
+            self._on_remove(self[key])
+        self._storage.write(self._upsert, self._to_row(value))
+        with self._lock:
+            self._live[key] = value
+        self._on_add(value)
+
+    def __delitem__(self, key):
+        value = self[key]
+        self._storage.write(self._delete, (key,))
+        with self._lock:
+            self._live.pop(key, None)
+        self._on_remove(value)
+
+    def __iter__(self):
+        with self._storage.reader() as connection:
+            ids = [row[0] for row in connection.execute(self._select_ids)]
+        return iter(ids)
+
+    def __len__(self):
+        with self._storage.reader() as connection:
+            return connection.execute(self._count).fetchone()[0]
+
+    def values(self):
+        with self._storage.reader() as connection:
+            rows = connection.execute(self._select_all).fetchall()
+        return [self._entity(row) for row in rows]
+
+    def items(self):
+        return [(entity.id, entity) for entity in self.values()]
+
+    def clear(self):
+        for value in self.values():
+            self._on_remove(value)
+        self._storage.write(self._delete_all)
+        with self._lock:
+            self._live.clear()
+
+    def put_many(self, values):
+        """ Stores new entities in one transaction without the per-entity hook, see _Collection """
+        self._storage.write_many(self._upsert, [self._to_row(value) for value in values])
+        with self._lock:
+            for value in values:
+                self._live[value.id] = value
+
+    def persist(self, value):
+        """ Writes back an entity changed in place """
+        self._storage.write(self._upsert, self._to_row(value))
+
+    def __repr__(self):
+        return f"<{type(self).__name__} {self.TABLE} ({len(self)} rows)>"
+
+
+class _BookTable(_SQLiteCollection):
+    TABLE = "books"
+    COLUMNS = ("id", "title", "author", "isbn", "publication_year", "category", "status",
+               "added_date", "last_updated")
+
+    def _to_row(self, book):
+        return (book.id, book.title, book.author, book.isbn, json.dumps(book.publication_year), book.category,
+                book.status.value, to_epoch(book.added_date), to_epoch(book.last_updated))
+
+    def _from_row(self, row):
+        book_id, title, author, isbn, year, category, status, added_date, last_updated = row
+        book = Book(title, author, isbn, json.loads(year), category, book_id, from_epoch(added_date))
+        book.status = BookStatus(status)
+        book.last_updated = from_epoch(last_updated)
+        book._owner = self._system
+        return book
+
+
+class _UserTable(_SQLiteCollection):
+    TABLE = "users"
+    COLUMNS = ("id", "name", "email", "role", "joined_date", "active")
+
+    LOANS = "SELECT id FROM borrow_records WHERE user_id = ? AND is_returned = 0 ORDER BY rowid"
+
+    def _to_row(self, user):
+        return (user.id, user.name, user.email, user.role.value, to_epoch(user.joined_date), int(user.active))
+
+    def _from_row(self, row):
+        user_id, name, email, role, joined_date, active = row
+        user = User(name, email, UserRole(role), user_id, from_epoch(joined_date))
+        user.active = bool(active)
+        # borrowed_books is not stored, it is the user's open loans
+        with self._storage.reader() as connection:
+            user.borrowed_books = [loan[0] for loan in connection.execute(self.LOANS, (user_id,))]
+        user._owner = self._system
+        return user
+
+
+class _RecordTable(_SQLiteCollection):
+    TABLE = "borrow_records"
+    COLUMNS = ("id", "book_id", "user_id", "borrow_date", "due_date", "return_date", "is_returned", "extended")
+
+    archive = None  # returned records stay in the table, there is no separate archive
+
+    def _to_row(self, record):
+        return (record.id, record.book_id, record.user_id, to_epoch(record.borrow_date), to_epoch(record.due_date),
+                None if record.return_date is None else to_epoch(record.return_date),
+                int(record.is_returned), int(record.extended))
+
+    def _from_row(self, row):
+        record_id, book_id, user_id, borrow_date, due_date, return_date, is_returned, extended = row
+        record = BorrowRecord(book_id, user_id, record_id=record_id, borrow_date=from_epoch(borrow_date))
+        record.due_date = from_epoch(due_date)
+        record.return_date = None if return_date is None else from_epoch(return_date)
+        record.is_returned = bool(is_returned)
+        record.extended = bool(extended)
+        record._owner = self._system
+        return record
+
+    def live(self):
+        return self.values()
+
+
+class SQLiteStorage:
+    """ Keeps books, users and borrow records in a SQLite database.
+    Without a path the database lives in memory for as long as the storage is open """
+
+    def __init__(self, path=None, readers=4):
+        if path is None:
+            # A named, shared-cache in-memory database, so the pool connections see the same data
+            self.path = f"file:library-{uuid.uuid4()}?mode=memory&cache=shared"
+            self._in_memory = True
+        else:
+            self.path = str(path)
+            self._in_memory = False
+
+        self._write_lock = threading.Lock()
+        self._writer = self._connect()
+        self._writer.executescript(SCHEMA)
+        if not self._in_memory:
+            self._writer.execute("PRAGMA journal_mode = WAL")
+            self._writer.execute("PRAGMA synchronous = NORMAL")
+
+        self._readers = queue.LifoQueue()
+        for _ in range(readers):
+            connection = self._connect()
+            if self._in_memory:
+                # Shared-cache readers would otherwise wait on the writer's table locks
+                connection.execute("PRAGMA read_uncommitted = 1")
+            self._readers.put(connection)
+        self._reader_count = readers
+
+    def _connect(self):
+        # Autocommit: every write is its own transaction, like a change to a dict
+        return sqlite3.connect(self.path, uri=self._in_memory, isolation_level=None, check_same_thread=False)
+
+    @contextlib.contextmanager
+    def reader(self):
+        """ Borrows a connection from the reader pool """
+        connection = self._readers.get()
+        try:
+            yield connection
+        finally:
+            self._readers.put(connection)
+
+    def write(self, statement, parameters=()):
+        with self._write_lock:
+            self._writer.execute(statement, parameters)
+
+    def write_many(self, statement, rows):
+        """ Runs `statement` once per row, all in one transaction """
+        with self._write_lock:
+            self._writer.execute("BEGIN")
+            try:
+                self._writer.executemany(statement, rows)
+            except BaseException:
+                self._writer.execute("ROLLBACK")
+                raise
+            self._writer.execute("COMMIT")
+
+    def collections(self, system):
+        return (
+            _BookTable(self, system, system._index_book, system._unindex_book),
+            _UserTable(self, system, system._index_user, system._unindex_user),
+            _RecordTable(self, system, system._index_record, system._unindex_record),
+        )
+
+    def close(self):
+        for _ in range(self._reader_count):
+            self._readers.get().close()
+        self._reader_count = 0
+        with self._write_lock:
+            self._writer.close()
@@ -0,0 +1,75 @@
+import asyncio
+import inspect
+
+import pytest
+from async_library import AsyncLibrarySystem, HEAVY_READ_METHODS, LIGHT_READ_METHODS, WRITE_METHODS
+from library_management_system import LibrarySystem
+
+
+def test_async_facade_coalesces_writes():
+    """ Quando muitos clientes escrevem ao mesmo tempo, então os comandos são aplicados em lotes """
+
+    async def scenario():
+        async with AsyncLibrarySystem() as library:
+            user_id = await library.add_user("Maria", "maria@teste.com.br")
+            book_ids = await asyncio.gather(*(
+                library.add_book(f"Livro {i}", "Autor", f"978-{i:010d}", 2000, "Fiction") for i in range(50)
+            ))
+
+            assert len(set(book_ids)) == 50
+            assert library.batches < library.commands
+
+            record_id = await library.borrow_book(book_ids[0], user_id)
+            assert (await library.get_book(book_ids[0])).status.value == "borrowed"
+            assert await library.return_book(record_id) is True
+
+            results = await library.search_books("livro", limit=5)
+            assert len(results) == 5
+
+            report = await library.generate_reports()
+            assert report["total_books"] == 50
+
+    asyncio.run(scenario())
+
+
+def test_async_facade_propagates_errors():
+    """ Quando um comando falha, então apenas o cliente dele recebe o erro """
+
+    async def scenario():
+        async with AsyncLibrarySystem() as library:
+            user_id = await library.add_user("Maria", "maria@teste.com.br")
+            book_id = await library.add_book("O Hobbit", "J.R.R. Tolkien", "978-3-16-148410-1", 1937, "Fiction")
+
+            outcomes = await asyncio.gather(
+                library.borrow_book(book_id, user_id),
+                library.borrow_book(book_id, user_id),
+                return_exceptions=True,
+            )
+            assert isinstance(outcomes[0], str)
+            assert isinstance(outcomes[1], ValueError)
+
+            with pytest.raises(AttributeError):
+                library.not_a_method
+
+        with pytest.raises(RuntimeError, match="closed"):
+            await library.add_user("Ana", "ana@teste.com.br")
+
+    asyncio.run(scenario())
+
+
+def test_async_facade_covers_every_instance_method(tmp_path):
+    """ Quando um método público é adicionado ao LibrarySystem, então a fachada assíncrona também o oferece """
+
+    public = {name for name, member in vars(LibrarySystem).items()
+              if not name.startswith("_") and inspect.isfunction(member)}
+    assert public == set(WRITE_METHODS) | set(HEAVY_READ_METHODS) | set(LIGHT_READ_METHODS)
+
+    async def scenario():
+        async with AsyncLibrarySystem() as library:
+            await library.enable_metrics()
+            await library.add_book("O Hobbit", "J.R.R. Tolkien", "978-3-16-148410-1", 1937, "Fiction")
+            assert [book.title for book in await library.iter_books()] == ["O Hobbit"]
+            assert await library.export(tmp_path / "books.ndjson") == 1
+            assert (await library.get_metrics())["add_book"]["calls"] == 1
+
+    asyncio.run(scenario())
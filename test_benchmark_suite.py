@@ -0,0 +1,44 @@
+import json
+
+import pytest
+
+from benchmarks import suite
+
+
+def test_suite_measures_every_case():
+    """ Quando a suíte roda numa biblioteca pequena, então cada caso traz percentis, vazão e memória """
+
+    summary = suite.run(scale=300, calls=20)
+
+    assert set(summary["results"]) == set(suite.CASES)
+    for result in summary["results"].values():
+        assert result["p50_us"] <= result["p90_us"] <= result["p99_us"] <= result["max_us"]
+        assert result["ops_per_s"] > 0
+        assert result["peak_kib"] >= 0
+
+
+def test_compare_flags_regressions_beyond_tolerance(tmp_path, capsys):
+    """ Quando um caso fica mais lento que a linha de base além da tolerância, então a comparação falha """
+
+    baseline = {"scale": 300, "results": {
+        "generate_reports": {"p50_us": 10.0, "ops_per_s": 100_000.0, "peak_kib": 1.0},
+        "add_book": {"p50_us": 10.0, "ops_per_s": 100_000.0, "peak_kib": 1.0},
+    }}
+    current = {"scale": 300, "results": {
+        "generate_reports": {"p50_us": 11.0, "ops_per_s": 91_000.0, "peak_kib": 50.0},
+        "add_book": {"p50_us": 20.0, "ops_per_s": 50_000.0, "peak_kib": 1.0},
+    }}
+
+    regressions = suite.compare(baseline, current, tolerance=0.2)
+    assert len(regressions) == 2
+    assert all(regression.startswith("add_book") for regression in regressions)
+
+    with pytest.raises(ValueError, match="scale"):
+        suite.compare(baseline, dict(current, scale=1000), tolerance=0.2)
+
+    # Uma linha de base impossível de alcançar faz o processo terminar com erro
+    path = tmp_path / "baseline.json"
+    unreachable = {"scale": 300, "results": {"generate_reports": {"p50_us": 0.0, "ops_per_s": 1e12, "peak_kib": 0.0}}}
+    path.write_text(json.dumps(unreachable))
+    assert suite.main(["--scale", "300", "--calls", "5", "--case", "generate_reports", "--compare", str(path)]) == 1
+    assert "REGRESSION generate_reports" in capsys.readouterr().out
@@ -0,0 +1,63 @@
+from datetime import datetime, timedelta
+
+import pytest
+import library_management_system as library
+from borrow_log import BorrowLog, BorrowRecordView
+
+
+def test_borrow_log_round_trip(sample_libray_system):
+    """ Quando registros vão para o log colunar, então as views devolvem os mesmos atributos """
+
+    user_id = sample_libray_system.add_user("Maria", "maria@teste.com.br")
+    book_id = sample_libray_system.add_book("O Hobbit", "J.R.R. Tolkien", "978-3-16-148410-1", 1937, "Fiction")
+    returned_id = sample_libray_system.borrow_book(book_id, user_id)
+    sample_libray_system.return_book(returned_id)
+    open_id = sample_libray_system.borrow_book(book_id, user_id)
+
+    log = BorrowLog.from_records(sample_libray_system.borrow_records.values())
+
+    assert len(log) == 2
+    assert list(log) == [returned_id, open_id]
+
+    for record_id, record in sample_libray_system.borrow_records.items():
+        view = log[record_id]
+        assert isinstance(view, BorrowRecordView)
+        assert view.to_dict() == record.to_dict()
+
+
+def test_borrow_log_view_writes_through(sample_borrow):
+    """ Quando a view é alterada, então a alteração fica gravada nas colunas do log """
+
+    sample_borrow.id = "0b8f5c1e-6a4f-4f61-9d55-3b0e8a5d2f10"
+    log = BorrowLog.from_records([sample_borrow])
+    view = log[sample_borrow.id]
+
+    assert view.extend_borrow() is True
+    assert log.row(0).due_date == sample_borrow.due_date + timedelta(days=7)
+    assert log.row(0).extended is True
+
+    assert view.return_book() is True
+    assert log.row(0).is_returned is True
+    assert log.row(0).return_date <= datetime.now()
+    assert "ffffffff-ffff-ffff-ffff-ffffffffffff" not in log
+
+
+def test_borrow_log_requires_uuid_ids(sample_borrow):
+    """ Quando o id do registro não é um UUID, então ele não cabe no log compacto """
+
+    sample_borrow.id = "123"
+
+    with pytest.raises(ValueError, match="must be a UUID"):
+        BorrowLog.from_records([sample_borrow])
+
+
+def test_entities_have_no_instance_dict(sample_book, sample_user, sample_borrow):
+    """ Quando as entidades são criadas, então elas usam __slots__ e não carregam __dict__ """
+
+    for entity in (sample_book, sample_user, sample_borrow):
+        assert not hasattr(entity, "__dict__")
+
+    with pytest.raises(AttributeError):
+        sample_book.unknown_field = 1
+
+    assert library.BorrowRecord.__slots__
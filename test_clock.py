@@ -0,0 +1,104 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+import library_management_system as library
+from clock import CoarseClock, ManualClock
+from holds import Hold
+from sharded_library import ShardedLibrarySystem
+
+
+def test_manual_clock_drives_every_timestamp():
+    """ Quando o sistema usa um relógio manual, então datas, atrasos e extensões seguem esse relógio """
+
+    start = datetime(2024, 1, 1, 9, 0)
+    clock = ManualClock(start)
+    system = library.LibrarySystem(clock=clock)
+    user_id = system.add_user("Maria", "maria@teste.com.br")
+    book_id = system.add_book("O Hobbit", "J.R.R. Tolkien", "978-3-16-148410-1", 1937, "Fiction")
+    assert system.get_book(book_id).added_date == start
+    assert system.get_user(user_id).joined_date == start
+
+    record_id = system.borrow_book(book_id, user_id)
+    record = system.borrow_records[record_id]
+    assert record.borrow_date == start
+    assert system.get_book(book_id).last_updated == start
+    assert system.get_overdue_books() == []
+    assert not record.is_overdue() and not record.to_dict()["is_overdue"]
+
+    clock.advance(days=15)
+    assert [item["record"].id for item in system.get_overdue_books()] == [record_id]
+    # The record reads its system's clock, not the wall clock
+    assert record.is_overdue() and record.to_dict()["is_overdue"]
+    assert system.generate_reports() == system.recompute_reports()
+    assert system.generate_reports()["overdue_borrows"] == 1
+    with pytest.raises(ValueError):
+        system.extend_borrowing(record_id)
+
+    system.return_book(record_id)
+    assert record.return_date == start + timedelta(days=15)
+    assert system.get_book(book_id).last_updated == start + timedelta(days=15)
+
+    with pytest.raises(ValueError):
+        clock.advance(timedelta(seconds=-1))
+
+
+def test_entities_fall_back_to_a_plain_function_clock(monkeypatch):
+    """ Quando o relógio de classe é uma função comum, então livros, usuários, empréstimos e reservas o usam sem o sistema """
+
+    start = datetime(2024, 1, 1, 9, 0)
+
+    def frozen():
+        return start
+
+    for entity in (library.Book, library.User, library.BorrowRecord, Hold):
+        monkeypatch.setattr(entity, "clock", frozen)
+
+    book = library.Book("O Hobbit", "J.R.R. Tolkien", "978-3-16-148410-1", 1937, "Fiction")
+    book.update_status(library.BookStatus.BORROWED)
+    record = library.BorrowRecord(book.id, "leitor")
+    assert book.added_date == book.last_updated == record.borrow_date == start
+    assert library.User("Maria", "maria@teste.com.br").joined_date == start
+    assert Hold(book.id, "leitor").placed_date == start
+    assert not record.is_overdue()
+
+
+def test_sharded_library_shares_its_clock():
+    """ Quando a biblioteca particionada recebe um relógio, então todas as partições o usam """
+
+    clock = ManualClock(datetime(2024, 1, 1))
+    system = ShardedLibrarySystem(shards=3, clock=clock)
+    user_id = system.add_user("Maria", "maria@teste.com.br")
+    record_ids = [
+        system.borrow_book(system.add_book(f"Livro {i}", "Autor", f"978-0-00-00000{i}-0", 2000, "Fiction"), user_id)
+        for i in range(3)
+    ]
+    assert all(shard.clock is clock for shard in system.shards)
+    assert system.get_user(user_id).joined_date == datetime(2024, 1, 1)
+    assert {book.added_date for book in system.get_all_books()} == {datetime(2024, 1, 1)}
+
+    clock.advance(days=20)
+    assert sorted(record.id for record in system.iter_overdue()) == sorted(record_ids)
+    assert all(record.to_dict()["is_overdue"] for record in system.iter_overdue())
+
+
+def test_coarse_clock_refreshes_once_per_tick():
+    """ Quando o relógio grosso é lido várias vezes no mesmo tique, então o horário só é recalculado no tique seguinte """
+
+    ticks = [0.0]
+    reads = []
+
+    def source():
+        reads.append(ticks[0])
+        return datetime(2024, 1, 1) + timedelta(seconds=ticks[0])
+
+    clock = CoarseClock(resolution=0.5, source=source, ticks=lambda: ticks[0])
+    first = clock()
+    ticks[0] = 0.4
+    assert clock() == first
+    ticks[0] = 0.6
+    assert clock() == datetime(2024, 1, 1) + timedelta(seconds=0.6)
+    assert len(reads) == 2
+
+    with pytest.raises(ValueError):
+        CoarseClock(resolution=0)
@@ -0,0 +1,165 @@
+import time
+import threading
+
+import library_management_system as library
+
+
+def run_threads(count, target):
+    barrier = threading.Barrier(count)
+
+    def worker(index):
+        barrier.wait()
+        target(index)
+
+    threads = [threading.Thread(target=worker, args=(index,)) for index in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+def test_concurrent_borrow_never_double_lends():
+    """ Quando várias threads tentam emprestar o mesmo livro, então apenas uma consegue """
+
+    system = library.LibrarySystem(concurrent=True)
+    book_id = system.add_book("O Hobbit", "J.R.R. Tolkien", "978-3-16-148410-1", 1937, "Fiction")
+    user_ids = [system.add_user(f"Usuário {i}", f"usuario{i}@teste.com.br") for i in range(16)]
+
+    for _ in range(20):
+        successes = []
+
+        def borrow(index):
+            try:
+                successes.append(system.borrow_book(book_id, user_ids[index]))
+            except ValueError:
+                pass
+
+        run_threads(len(user_ids), borrow)
+
+        assert len(successes) == 1
+        system.return_book(successes[0])
+
+
+def test_concurrent_checkout_cycles_keep_invariants():
+    """ Quando muitas threads emprestam e devolvem ao mesmo tempo, então os índices continuam consistentes """
+
+    system = library.LibrarySystem(concurrent=True)
+    book_ids = [system.add_book(f"Livro {i}", "Autor", f"978-{i:010d}", 2000, "Fiction") for i in range(8)]
+    user_ids = [system.add_user(f"Usuário {i}", f"usuario{i}@teste.com.br") for i in range(8)]
+
+    def cycle(index):
+        for step in range(200):
+            book_id = book_ids[(index + step) % len(book_ids)]
+            try:
+                record_id = system.borrow_book(book_id, user_ids[index])
+            except ValueError:
+                continue
+            system.return_book(record_id)
+
+    run_threads(len(user_ids), cycle)
+
+    report = system.generate_reports()
+    assert report == system.recompute_reports()
+    assert report["current_borrows"] == 0
+    assert report["available_books"] == len(book_ids)
+    assert all(not system.get_user(user_id).borrowed_books for user_id in user_ids)
+
+    for book_id in book_ids:
+        history = system.get_borrow_history(book_id=book_id)
+        # Um livro nunca fica com dois empréstimos sobrepostos
+        for earlier, later in zip(history, history[1:]):
+            assert earlier.return_date <= later.borrow_date
+
+
+def test_concurrent_batches_are_all_or_nothing():
+    """ Quando várias threads emprestam lotes que se sobrepõem, então cada lote sai inteiro ou não sai """
+
+    system = library.LibrarySystem(concurrent=True)
+    book_ids = [system.add_book(f"Livro {i}", "Autor", f"978-{i:010d}", 2000, "Fiction") for i in range(12)]
+    user_ids = [system.add_user(f"Usuário {i}", f"usuario{i}@teste.com.br") for i in range(8)]
+
+    def cycle(index):
+        for step in range(100):
+            batch = [book_ids[(index + step + offset) % len(book_ids)] for offset in range(3)]
+            result = system.borrow_books(user_ids[index], batch)
+            if result["errors"]:
+                assert result["ids"] == [None] * 3
+                continue
+            assert [system.borrow_records[record_id].book_id for record_id in result["ids"]] == batch
+            assert system.return_books(result["ids"])["errors"] == {}
+
+    run_threads(len(user_ids), cycle)
+
+    report = system.generate_reports()
+    assert report == system.recompute_reports()
+    assert report["current_borrows"] == 0
+    assert report["available_books"] == len(book_ids)
+
+
+def test_lock_table_orders_stripes():
+    """ Quando chaves são travadas em ordens diferentes, então as mesmas faixas são adquiridas na mesma ordem """
+
+    table = library.LockTable(stripes=8)
+    first = table.hold("a", "b")._locks
+    second = table.hold("b", "a")._locks
+
+    assert first == second
+
+
+def test_concurrent_holds_hand_the_book_to_each_holder_once():
+    """ Quando várias threads reservam e buscam o mesmo livro, então cada leitor o recebe uma única vez, na ordem da fila """
+
+    system = library.LibrarySystem(concurrent=True)
+    book_id = system.add_book("O Hobbit", "J.R.R. Tolkien", "978-3-16-148410-1", 1937, "Fiction")
+    owner_id = system.add_user("Dona", "dona@teste.com.br")
+    user_ids = [system.add_user(f"Usuário {i}", f"usuario{i}@teste.com.br") for i in range(16)]
+    record_id = system.borrow_book(book_id, owner_id)
+
+    run_threads(len(user_ids), lambda index: system.place_hold(book_id, user_ids[index]))
+    queue = [hold.user_id for hold in system.get_holds(book_id)]
+    assert sorted(queue) == sorted(user_ids)
+    system.return_book(record_id)
+
+    def collect(index):
+        # Everyone keeps trying; only the holder of the READY hold can take the book
+        while True:
+            try:
+                record_id = system.borrow_book(book_id, user_ids[index])
+            except ValueError:
+                time.sleep(0.001)  # back off, or the losers starve the holder of the book lock
+                continue
+            system.return_book(record_id)
+            return
+
+    run_threads(len(user_ids), collect)
+
+    served = [record.user_id for record in system.get_borrow_history(book_id=book_id)][1:]
+    assert served == queue
+    assert system.holds == {} and system.get_book(book_id).status == library.BookStatus.AVAILABLE
+
+
+def test_history_scan_runs_beside_writers():
+    """ Quando o histórico completo é lido enquanto outra thread empresta e devolve, então a leitura não falha """
+
+    system = library.LibrarySystem(concurrent=True)
+    book_ids = [system.add_book(f"Livro {i}", "Autor", f"978-{i:010d}", 2000, "Fiction") for i in range(50)]
+    user_ids = [system.add_user(f"Usuário {i}", f"usuario{i}@teste.com.br") for i in range(50)]
+    for i in range(20_000):
+        system.return_book(system.borrow_book(book_ids[i % 50], user_ids[i % 50]))
+
+    done = threading.Event()
+
+    def write():
+        i = 0
+        while not done.is_set():
+            system.return_book(system.borrow_book(book_ids[i % 50], user_ids[i % 50]))
+            i += 1
+
+    writer = threading.Thread(target=write)
+    writer.start()
+    try:
+        for _ in range(20):
+            assert len(system.get_borrow_history()) >= 20_000
+    finally:
+        done.set()
+        writer.join()
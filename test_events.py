@@ -0,0 +1,145 @@
+import threading
+
+import pytest
+
+import library_management_system as library
+from events import Borrowed, EventLog, Returned, StatusChanged
+from sharded_library import ShardedLibrarySystem
+
+
+def test_changes_are_published_as_typed_events(sample_libray_system):
+    """ Quando os eventos estão ligados, então cada mudança chega ao assinante como um evento tipado, em ordem """
+
+    system = sample_libray_system
+    with pytest.raises(ValueError):
+        system.subscribe()
+    system.enable_events(capacity=100)
+    subscription = system.subscribe()
+
+    user_id = system.add_user("Maria", "maria@teste.com.br")
+    book_id = system.add_book("Livro", "Autor", "978-3-16-148410-0", 2000, "Fiction")
+    system.update_book(book_id, title="Outro Livro", isbn="ignorado")
+    record_id = system.borrow_book(book_id, user_id)
+    system.extend_borrowing(record_id)
+    system.return_book(record_id)
+
+    events = subscription.poll()
+    assert [event.kind for event in events] == [
+        "UserAdded", "BookAdded", "BookUpdated", "StatusChanged", "Borrowed", "Extended", "StatusChanged", "Returned",
+    ]
+    assert [event.seq for event in events] == list(range(8))
+    assert events[2].changes == {"title": "Outro Livro"}
+    assert (events[3].old_status, events[3].new_status) == (library.BookStatus.AVAILABLE, library.BookStatus.BORROWED)
+    assert events[4].to_dict() == {"seq": 4, "kind": "Borrowed", "record_id": record_id, "book_id": book_id,
+                                   "user_id": user_id, "due_date": events[4].due_date}
+    assert events[5].due_date == system.borrow_records[record_id].due_date
+    assert subscription.poll() == [] and subscription.lag == 0
+
+    # Um assinante novo pode reler o que ainda está no buffer
+    assert len(system.subscribe(from_seq=0).poll(max_events=3)) == 3
+
+
+def test_batches_publish_only_complete_loans(sample_libray_system):
+    """ Quando um lote de empréstimos é recusado, então nenhum evento Borrowed é publicado """
+
+    system = sample_libray_system
+    user_id = system.add_user("Maria", "maria@teste.com.br")
+    book_ids = [system.add_book(f"Livro {i}", "Autor", f"978-3-16-1484{i:02d}-0", 2000, "Fiction") for i in range(3)]
+    system.enable_events()
+    subscription = system.subscribe()
+
+    assert system.borrow_books(user_id, book_ids + ["livro-que-nao-existe"])["errors"]
+    assert subscription.poll() == []
+
+    record_ids = system.borrow_books(user_id, book_ids)["ids"]
+    system.return_books(record_ids)
+    events = subscription.poll()
+    assert [event.record_id for event in events if isinstance(event, Borrowed)] == record_ids
+    assert [event.record_id for event in events if isinstance(event, Returned)] == record_ids
+    assert sum(isinstance(event, StatusChanged) for event in events) == 6
+
+
+def test_rolled_back_batches_publish_nothing(sample_libray_system, monkeypatch):
+    """ Quando um lote falha no meio e é desfeito, então nenhum evento, nem de status, é publicado """
+
+    system = sample_libray_system
+    user_id = system.add_user("Maria", "maria@teste.com.br")
+    book_ids = [system.add_book(f"Livro {i}", "Autor", f"978-3-16-1484{i:02d}-0", 2000, "Fiction") for i in range(4)]
+    other_id = system.add_user("Ana", "ana@teste.com.br")
+    record_ids = system.borrow_books(user_id, book_ids[:2])["ids"]
+    system.enable_events()
+    subscription = system.subscribe()
+
+    for step in ("_take_back", "_lend"):
+        original = getattr(system, step)
+        calls = []
+
+        def fail_second_call(*args, original=original, calls=calls):
+            calls.append(args)
+            if len(calls) == 2:
+                raise RuntimeError("disco cheio")
+            return original(*args)
+        monkeypatch.setattr(system, step, fail_second_call)
+    with pytest.raises(RuntimeError):
+        system.return_books(record_ids)
+    with pytest.raises(RuntimeError):
+        system.borrow_books(other_id, book_ids[2:])
+    assert subscription.poll() == []
+
+    monkeypatch.undo()
+    system.return_books(record_ids)
+    assert [event.kind for event in subscription.poll()] == ["StatusChanged", "Returned"] * 2
+
+
+def test_slow_subscribers_miss_overwritten_events():
+    """ Quando um assinante fica mais de `capacity` eventos para trás, então sabe quantos perdeu e o produtor não espera """
+
+    log = EventLog(capacity=4)
+    lenient = log.subscribe()
+    strict = log.subscribe(strict=True)
+    for i in range(10):
+        log.publish(Returned(f"r{i}", "b", "u", None))
+
+    assert lenient.lag == 10
+    assert [event.record_id for event in lenient.poll(max_events=2)] == ["r6", "r7"]
+    assert lenient.missed == 6 and lenient.lag == 2
+
+    with pytest.raises(ValueError, match="6 events"):
+        strict.poll()
+    assert [event.seq for event in strict.poll()] == [6, 7, 8, 9]
+
+
+def test_poll_waits_for_events_from_another_thread():
+    """ Quando o assinante espera com timeout, então ele acorda assim que um evento é publicado """
+
+    log = EventLog(capacity=8)
+    subscription = log.subscribe()
+    assert subscription.poll(timeout=0.01) == []
+
+    received = []
+    reader = threading.Thread(target=lambda: received.extend(subscription.poll(timeout=5)))
+    reader.start()
+    log.publish(Returned("r1", "b", "u", None))
+    reader.join(timeout=5)
+    assert [event.record_id for event in received] == ["r1"]
+
+
+def test_sharded_library_shares_one_event_log():
+    """ Quando uma biblioteca particionada publica eventos, então todos os shards escrevem na mesma sequência """
+
+    system = ShardedLibrarySystem(shards=3)
+    log = system.enable_events()
+    assert all(shard.events is log for shard in system.shards)
+    subscription = system.subscribe()
+
+    user_id = system.add_user("Maria", "maria@teste.com.br")
+    book_ids = [system.add_book(f"Livro {i}", "Autor", f"978-3-16-1484{i:02d}-0", 2000, "Fiction") for i in range(6)]
+    for book_id in book_ids[:3]:
+        system.borrow_book(book_id, user_id)
+
+    events = subscription.poll()
+    assert [event.seq for event in events] == list(range(len(events)))
+    assert sum(isinstance(event, Borrowed) for event in events) == 3
+
+    assert system.disable_events() is log
+    assert all(shard.events is None for shard in system.shards)
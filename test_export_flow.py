@@ -0,0 +1,129 @@
+import io
+import csv
+import json
+import socket
+import threading
+from datetime import datetime, timedelta
+
+import pytest
+
+import export
+import library_management_system as library
+
+
+def _populate(system):
+    user_id = system.add_user("Maria \"Mia\" Souza", "maria@teste.com.br")
+    system.add_user("José", "jose@teste.com.br", role=system.get_user(user_id).role)
+    hobbit_id = system.add_book("O Hobbit", "J.R.R. Tolkien", "978-3-16-148410-1", 1937, "Fiction")
+    aneis_id = system.add_book("O Senhor dos Anéis, vol. 1", "J.R.R. Tolkien", "978-3-16-148410-0", 1954, "Fiction")
+    system.add_book("Cosmos", "Carl Sagan", "978-3-16-148410-2", 1980, "Science")
+    system.return_book(system.borrow_book(hobbit_id, user_id))
+    late_id = system.borrow_book(aneis_id, user_id)
+    record = system.borrow_records[late_id]
+    record.due_date = datetime.now() - timedelta(days=1)
+    system.borrow_records[late_id] = record
+
+
+def _expected(system, kind):
+    entities = {
+        "books": system.iter_books(),
+        "users": system.iter_users(active_only=False),
+        "borrow_records": system.iter_borrow_history(),
+    }[kind]
+    return [entity.to_dict() for entity in entities]
+
+
+@pytest.mark.parametrize("kind", ["books", "users", "borrow_records"])
+def test_ndjson_and_columns_match_to_dict(sample_libray_system, kind):
+    """ Quando a biblioteca é exportada em NDJSON ou em colunas, então cada linha é igual ao to_dict da entidade """
+
+    _populate(sample_libray_system)
+    expected = _expected(sample_libray_system, kind)
+
+    output = io.StringIO()
+    assert sample_libray_system.export(output, kind) == len(expected)
+    assert [json.loads(line) for line in output.getvalue().splitlines()] == expected
+
+    output = io.StringIO()
+    assert sample_libray_system.export(output, kind, format="columns") == len(expected)
+    columns = json.loads(output.getvalue())
+    assert [dict(zip(columns, values)) for values in zip(*columns.values())] == expected
+
+
+def test_csv_export_to_path_and_socket(sample_libray_system, tmp_path):
+    """ Quando a exportação vai para um arquivo CSV ou um socket, então o conteúdo chega completo """
+
+    _populate(sample_libray_system)
+    path = tmp_path / "records.csv"
+    assert sample_libray_system.export(path, "borrow_records", format="csv") == 2
+
+    with open(path, newline="", encoding="utf-8") as handle:
+        rows = list(csv.DictReader(handle))
+    expected = _expected(sample_libray_system, "borrow_records")
+    assert [row["id"] for row in rows] == [record["id"] for record in expected]
+    assert [row["is_overdue"] for row in rows] == ["false", "true"]
+    assert [row["return_date"] == "" for row in rows] == [False, True]
+
+    sender, receiver = socket.socketpair()
+    with sender, receiver:
+        assert sample_libray_system.export(sender, "users") == 2
+        sender.shutdown(socket.SHUT_WR)
+        data = b"".join(iter(lambda: receiver.recv(65536), b""))
+    assert [json.loads(line) for line in data.decode("utf-8").splitlines()] == _expected(sample_libray_system, "users")
+
+
+def test_export_spans_several_chunks(sample_libray_system, monkeypatch):
+    """ Quando há mais linhas que o tamanho do bloco, então nenhuma linha se perde entre blocos """
+
+    monkeypatch.setattr(export, "CHUNK_ROWS", 2)
+    _populate(sample_libray_system)
+    expected = _expected(sample_libray_system, "books")
+
+    for format in ("ndjson", "csv", "columns"):
+        output = io.StringIO()
+        assert sample_libray_system.export(output, "books", format=format) == 3
+        text = output.getvalue()
+        if format == "ndjson":
+            assert [json.loads(line) for line in text.splitlines()] == expected
+        elif format == "csv":
+            assert [row["title"] for row in csv.DictReader(io.StringIO(text))] == [book["title"] for book in expected]
+        else:
+            assert json.loads(text)["title"] == [book["title"] for book in expected]
+
+    with pytest.raises(ValueError):
+        sample_libray_system.export(io.StringIO(), "loans")
+    with pytest.raises(ValueError):
+        sample_libray_system.export(io.StringIO(), "books", format="xml")
+
+
+def test_slow_export_does_not_block_writers(monkeypatch):
+    """ Quando a exportação escreve num destino lento, então empréstimos concorrentes não esperam por ela """
+
+    monkeypatch.setattr(export, "CHUNK_ROWS", 1)
+    system = library.LibrarySystem(concurrent=True)
+    user_id = system.add_user("Maria", "maria@teste.com.br")
+    book_ids = [system.add_book(f"Livro {i}", "Autor", f"978-3-16-1484{i:02d}-0", 2000, "Fiction") for i in range(20)]
+    writing = threading.Event()
+    release = threading.Event()
+
+    class SlowSink(io.StringIO):
+        def write(self, text):
+            writing.set()
+            release.wait(5)
+            return super().write(text)
+
+    output = SlowSink()
+    exporter = threading.Thread(target=system.export, args=(output, "books"))
+    exporter.start()
+    assert writing.wait(5)
+
+    # The export is stuck in the sink, the loan still goes through
+    borrower = threading.Thread(target=system.borrow_book, args=(book_ids[0], user_id))
+    borrower.start()
+    borrower.join(2)
+    lent_meanwhile = not borrower.is_alive()
+    release.set()
+    exporter.join()
+    borrower.join()
+    assert lent_meanwhile
+    assert len(output.getvalue().splitlines()) == 20
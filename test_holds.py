@@ -0,0 +1,137 @@
+from datetime import datetime
+
+import pytest
+
+import library_management_system as library
+from clock import ManualClock
+from holds import Hold, HoldQueue, HoldStatus
+from sharded_library import ShardedLibrarySystem
+
+
+def _library_with_a_borrowed_book(system):
+    owner_id = system.add_user("Dona", "dona@teste.com.br")
+    book_id = system.add_book("O Hobbit", "J.R.R. Tolkien", "978-3-16-148410-1", 1937, "Fiction")
+    record_id = system.borrow_book(book_id, owner_id)
+    return book_id, record_id
+
+
+def test_returned_book_goes_to_the_next_holder_by_priority(sample_libray_system):
+    """ Quando um livro com reservas é devolvido, então ele fica reservado para o próximo da fila, bibliotecários primeiro """
+
+    system = sample_libray_system
+    book_id, record_id = _library_with_a_borrowed_book(system)
+    first = system.add_user("Ana", "ana@teste.com.br")
+    second = system.add_user("Bia", "bia@teste.com.br")
+    librarian = system.add_user("Lia", "lia@teste.com.br", library.UserRole.LIBRARIAN)
+
+    holds = [system.place_hold(book_id, user_id) for user_id in (first, second, librarian)]
+    assert [hold.user_id for hold in system.get_holds(book_id)] == [librarian, first, second]
+    with pytest.raises(ValueError, match="already holds"):
+        system.place_hold(book_id, first)
+    with pytest.raises(ValueError, match="already has this book"):
+        system.place_hold(book_id, system.get_user_by_email("dona@teste.com.br").id)
+    with pytest.raises(ValueError, match="other users hold"):
+        system.extend_borrowing(record_id)
+
+    system.return_book(record_id)
+    book = system.get_book(book_id)
+    assert book.status == library.BookStatus.RESERVED
+    assert system.holds[holds[2]].status == HoldStatus.READY
+    with pytest.raises(ValueError, match="reserved"):
+        system.borrow_book(book_id, first)
+
+    record_id = system.borrow_book(book_id, librarian)
+    assert holds[2] not in system.holds
+    assert system.get_user_holds(librarian) == []
+
+    system.return_book(record_id)
+    assert [hold.status for hold in system.get_holds(book_id)] == [HoldStatus.READY, HoldStatus.WAITING]
+    assert system.get_holds(book_id)[0].user_id == first
+    assert system.generate_reports() == system.recompute_reports()
+
+
+def test_uncollected_holds_expire(sample_libray_system):
+    """ Quando o leitor não busca o livro no prazo, então a reserva expira e o livro passa ao próximo """
+
+    clock = ManualClock(datetime(2024, 1, 1, 9, 0))
+    system = sample_libray_system
+    system.clock = clock
+    book_id, record_id = _library_with_a_borrowed_book(system)
+    first = system.add_user("Ana", "ana@teste.com.br")
+    second = system.add_user("Bia", "bia@teste.com.br")
+    other = system.add_user("Caio", "caio@teste.com.br")
+    first_hold = system.place_hold(book_id, first)
+    system.place_hold(book_id, second)
+    system.return_book(record_id)
+
+    clock.advance(days=system.hold_pickup_days)
+    assert system.expire_holds() == 0
+    clock.advance(minutes=1)
+    assert system.expire_holds() == 1
+    assert system.get_user_holds(first) == []
+    assert system.get_holds(book_id)[0].user_id == second
+
+    # Sem ninguém mais na fila, o próximo toque no livro o devolve à estante
+    clock.advance(days=system.hold_pickup_days, minutes=1)
+    system.borrow_book(book_id, other)
+    assert system.get_holds(book_id) == []
+    with pytest.raises(ValueError, match="Hold not found"):
+        system.cancel_hold(first_hold)
+
+
+def test_cancelling_a_ready_hold_and_batches(sample_libray_system):
+    """ Quando uma reserva pronta é cancelada, então o livro vai para o próximo, e lotes também entregam e buscam reservas """
+
+    system = sample_libray_system
+    book_id, record_id = _library_with_a_borrowed_book(system)
+    first = system.add_user("Ana", "ana@teste.com.br")
+    second = system.add_user("Bia", "bia@teste.com.br")
+    with pytest.raises(ValueError, match="available"):
+        system.place_hold(system.add_book("Livro", "Autor", "978-3-16-148410-2", 2000, "Fiction"), first)
+
+    first_hold = system.place_hold(book_id, first)
+    second_hold = system.place_hold(book_id, second)
+    system.enable_events()
+    subscription = system.subscribe()
+    system.return_books([record_id])
+    assert [event.kind for event in subscription.poll()][-2:] == ["StatusChanged", "HoldReady"]
+
+    system.cancel_hold(first_hold)
+    assert system.holds[second_hold].status == HoldStatus.READY
+    assert system.borrow_books(first, [book_id])["errors"] == {0: "Book is not available, current status: reserved"}
+    assert system.borrow_books(second, [book_id])["errors"] == {}
+    assert system.holds == {} and system.get_book(book_id).status == library.BookStatus.BORROWED
+
+
+def test_holds_follow_their_book_across_shards():
+    """ Quando a biblioteca é particionada, então a reserva fica no shard do livro e o leitor pode estar em outro """
+
+    system = ShardedLibrarySystem(shards=3)
+    user_ids = [system.add_user(f"Leitor {i}", f"leitor{i}@teste.com.br") for i in range(4)]
+    book_id = system.add_book("O Hobbit", "J.R.R. Tolkien", "978-3-16-148410-1", 1937, "Fiction")
+    record_id = system.borrow_book(book_id, user_ids[0])
+    hold_ids = [system.place_hold(book_id, user_id) for user_id in user_ids[1:]]
+
+    system.return_book(record_id)
+    assert system.get_holds(book_id)[0].id == hold_ids[0]
+    system.cancel_hold(hold_ids[0])
+    system.borrow_book(book_id, user_ids[2])
+    assert [hold.id for hold in system.get_user_holds(user_ids[3])] == [hold_ids[2]]
+
+
+def test_hold_queue_keeps_priority_and_arrival_order():
+    """ Quando muitas reservas entram e saem da fila, então a ordem é prioridade e depois chegada """
+
+    queue = HoldQueue()
+    holds = [Hold("livro", f"leitor{i}", priority=i % 2) for i in range(20_000)]
+    for hold in holds:
+        queue.push(hold)
+    for hold in holds[::3]:
+        queue.discard(hold)
+
+    kept = [hold for index, hold in enumerate(holds) if index % 3]
+    assert len(queue) == len(kept)
+    expected = [hold for hold in kept if hold.priority == 0] + [hold for hold in kept if hold.priority == 1]
+    assert queue.ordered() == expected
+    assert [queue.pop() for _ in range(len(kept))] == expected
+    assert queue.pop() is None
@@ -0,0 +1,112 @@
+import time
+import threading
+
+import journal
+import library_management_system as library
+from journal import JournalDirectory
+
+
+def assert_same_state(recovered, original):
+    for attribute in ("books", "users", "borrow_records"):
+        expected = {entity_id: entity.to_dict() for entity_id, entity in getattr(original, attribute).items()}
+        assert {entity_id: entity.to_dict() for entity_id, entity in getattr(recovered, attribute).items()} == expected
+    for user_id, user in original.users.items():
+        assert recovered.users[user_id].borrowed_books == user.borrowed_books
+    assert recovered.generate_reports() == original.generate_reports()
+
+
+def run_operations(system):
+    maria_id = system.add_user("Maria", "maria@teste.com.br")
+    ana_id = system.add_user("Ana", "ana@teste.com.br")
+    hobbit_id = system.add_book("O Hobbit", "J.R.R. Tolkien", "978-3-16-148410-1", 1937, "Fiction")
+    aneis_id = system.add_book("O Senhor dos Anéis", "J.R.R. Tolkien", "978-3-16-148410-0", 1954, "Fiction")
+
+    returned_id = system.borrow_book(hobbit_id, maria_id)
+    system.return_book(returned_id)
+    open_id = system.borrow_book(aneis_id, maria_id)
+    system.extend_borrowing(open_id)
+    system.update_book(hobbit_id, title="O Hobbit (edição anotada)", category="Other")
+    system.get_book(hobbit_id).update_status(library.BookStatus.MAINTENANCE)
+    system.get_user(ana_id).deactivate()
+
+
+def test_recover_replays_journal(sample_libray_system, tmp_path):
+    """ Quando o sistema cai, então o diário é reaplicado e o estado volta igual """
+
+    sample_libray_system.enable_journal(tmp_path)
+    run_operations(sample_libray_system)
+    sample_libray_system.close_journal()
+
+    recovered = library.LibrarySystem.recover(tmp_path)
+    assert_same_state(recovered, sample_libray_system)
+
+    # O sistema recuperado continua registrando no diário
+    recovered.add_user("Pedro", "pedro@teste.com.br")
+    recovered.close_journal()
+    assert library.LibrarySystem.recover(tmp_path).get_user_by_email("pedro@teste.com.br") is not None
+
+
+def test_recover_ignores_torn_tail(sample_libray_system, tmp_path):
+    """ Quando a última entrada do diário ficou pela metade, então ela é descartada """
+
+    sample_libray_system.enable_journal(tmp_path, durable=True)
+    sample_libray_system.add_user("Maria", "maria@teste.com.br")
+    sample_libray_system.close_journal()
+
+    segment = JournalDirectory(tmp_path).segment_path(0)
+    with open(segment, "ab") as file:
+        file.write(b"\x40\x00\x00\x00\x01\x02\x03\x04[\"u\",\"inc")
+
+    recovered = library.LibrarySystem.recover(tmp_path)
+    assert len(recovered.users) == 1
+
+
+def test_compaction_folds_journal_into_snapshot(sample_libray_system, tmp_path):
+    """ Quando o diário é compactado, então os segmentos antigos viram um snapshot """
+
+    sample_libray_system.enable_journal(tmp_path)
+    run_operations(sample_libray_system)
+    sample_libray_system.compact_journal(wait=True)
+    sample_libray_system.add_book("Cosmos", "Carl Sagan", "978-3-16-148410-2", 1980, "Science")
+    sample_libray_system.close_journal()
+
+    directory = JournalDirectory(tmp_path)
+    manifest = directory.manifest()
+    assert manifest["snapshot"] is not None
+    assert directory.segments() == [manifest["first_segment"]]
+
+    assert_same_state(library.LibrarySystem.recover(tmp_path), sample_libray_system)
+
+
+def test_durable_writers_share_fsyncs(tmp_path, monkeypatch):
+    """ Quando vários leitores emprestam ao mesmo tempo com diário durável, então as operações dividem os fsyncs """
+
+    fsyncs = []
+
+    def slow_fsync(descriptor):
+        fsyncs.append(descriptor)
+        time.sleep(0.002)
+    monkeypatch.setattr(journal.os, "fsync", slow_fsync)
+
+    system = library.LibrarySystem(concurrent=True)
+    system.borrow_limits[library.UserRole.MEMBER] = None
+    system.enable_journal(tmp_path, durable=True)
+    user_ids = [system.add_user(f"Leitor {i}", f"leitor{i}@teste.com.br") for i in range(8)]
+    book_ids = [system.add_book(f"Livro {i}", "Autor", f"978-3-16-1484{i:02d}-0", 2000, "Fiction") for i in range(400)]
+    # A write returns only once its entries are on disk
+    assert system._journal._flushed == system._journal._appended
+    fsyncs.clear()
+
+    def checkouts(worker):
+        for book_id in book_ids[worker::8]:
+            system.borrow_book(book_id, user_ids[worker])
+    threads = [threading.Thread(target=checkouts, args=(worker,)) for worker in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    # Each checkout journals its record and its book; alone they would take 800 fsyncs
+    assert len(fsyncs) < 200
+    system.close_journal()
+    assert library.LibrarySystem.recover(tmp_path).generate_reports()["current_borrows"] == 400
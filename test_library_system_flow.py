@@ -1,3 +1,5 @@
+from datetime import datetime, timedelta
+
 import pytest
 import library_management_system as library
 
@@ -179,4 +181,420 @@ def test_borrow_book(sample_libray_system, sample_book, sample_user):
     assert sample_book.status == library.BookStatus.BORROWED
 
 
+def test_get_book_by_isbn(sample_libray_system):
+    """ Quando um livro é adicionado, então ele pode ser capturado pelo ISBN e o ISBN não pode se repetir """
+
+    book_id = sample_libray_system.add_book(
+        title="O Senhor dos Anéis",
+        author="J.R.R. Tolkien",
+        isbn="978-3-16-148410-0",
+        publication_year=1954,
+        category="Fiction"
+    )
+
+    assert sample_libray_system.get_book_by_isbn("978-3-16-148410-0").id == book_id
+    assert sample_libray_system.get_book_by_isbn("000-0-00-000000-0") is None
+
+    with pytest.raises(ValueError, match="already exists"):
+        sample_libray_system.add_book("Outro", "Outro", "978-3-16-148410-0", 2000, "Fiction")
+
+    del sample_libray_system.books[book_id]
+
+    assert sample_libray_system.get_book_by_isbn("978-3-16-148410-0") is None
+    assert sample_libray_system.add_book("Outro", "Outro", "978-3-16-148410-0", 2000, "Fiction") is not None
+
+def test_get_user_by_email(sample_libray_system, sample_user):
+    """ Quando um usuário é adicionado, então ele pode ser capturado pelo email normalizado """
+
+    user_id = sample_libray_system.add_user("Maria", "Maria@Teste.com.br")
+
+    assert sample_libray_system.get_user_by_email(" maria@teste.com.br ").id == user_id
+
+    with pytest.raises(ValueError, match="already exists"):
+        sample_libray_system.add_user("Maria 2", "maria@teste.com.br")
+
+    # Usuários inseridos diretamente também são indexados
+    sample_libray_system.users[sample_user.id] = sample_user
+    assert sample_libray_system.get_user_by_email(sample_user.email) is sample_user
+
+def test_search_books_ranking_and_filters(sample_libray_system):
+    """ Quando livros são pesquisados, então acentos são ignorados, o título pesa mais e o ano filtra """
+
+    tolkien_id = sample_libray_system.add_book("O Senhor dos Anéis", "J.R.R. Tolkien", "978-3-16-148410-0", 1954, "Fiction")
+    hobbit_id = sample_libray_system.add_book("O Hobbit", "J.R.R. Tolkien", "978-3-16-148410-1", 1937, "Fiction")
+    sample_libray_system.add_book("Aneis de Saturno", "Carl Sagan", "978-3-16-148410-2", 1980, "Science")
+
+    result = sample_libray_system.search_books("aneis")
+    assert len(result) == 2
+
+    # Busca por trecho de palavra e por ano
+    assert [book.id for book in sample_libray_system.search_books("obbi")] == [hobbit_id]
+    # Trechos de uma ou duas letras no meio da palavra também encontram
+    assert {book.id for book in sample_libray_system.search_books("lk")} == {tolkien_id, hobbit_id}
+    assert {book.id for book in sample_libray_system.search_books("ol")} == {tolkien_id, hobbit_id}
+    assert tolkien_id in {book.id for book in sample_libray_system.search_books("k")}
+    assert [book.id for book in sample_libray_system.search_books("1954")] == [tolkien_id]
+    assert [book.id for book in sample_libray_system.search_books("tolkien", year=1937)] == [hobbit_id]
+
+    # Paginação
+    assert len(sample_libray_system.search_books("tolkien", limit=1)) == 1
+    assert len(sample_libray_system.search_books("tolkien", limit=1, offset=1)) == 1
+    assert sample_libray_system.search_books("tolkien", limit=1, offset=2) == []
+
+    # O índice acompanha as atualizações
+    sample_libray_system.update_book(hobbit_id, title="Silmarillion")
+    assert sample_libray_system.search_books("hobbit") == []
+    assert [book.id for book in sample_libray_system.search_books("silmar")] == [hobbit_id]
+
+def test_get_all_books_by_status_and_category(sample_libray_system, sample_user):
+    """ Quando livros mudam de status ou categoria, então a listagem filtrada e o relatório acompanham """
+
+    fiction_id = sample_libray_system.add_book("O Hobbit", "J.R.R. Tolkien", "978-3-16-148410-1", 1937, "Fiction")
+    science_id = sample_libray_system.add_book("Cosmos", "Carl Sagan", "978-3-16-148410-2", 1980, "Science")
+    sample_libray_system.users[sample_user.id] = sample_user
+
+    sample_libray_system.borrow_book(fiction_id, sample_user.id)
+
+    borrowed = sample_libray_system.get_all_books(status=library.BookStatus.BORROWED)
+    assert [book.id for book in borrowed] == [fiction_id]
+    assert sample_libray_system.get_all_books(status=library.BookStatus.AVAILABLE, category="Fiction") == []
+
+    sample_libray_system.update_book(science_id, category="History")
+    assert sample_libray_system.get_all_books(category="Science") == []
+    assert [book.id for book in sample_libray_system.get_all_books(category="History")] == [science_id]
 
+    report = sample_libray_system.generate_reports()
+    assert report["available_books"] == 1
+    assert report["borrowed_books"] == 1
+    assert report["books_by_category"] == {"Fiction": 1, "History": 1}
+
+def test_overdue_and_due_between(sample_libray_system):
+    """ Quando empréstimos vencem, então apenas os ativos e vencidos aparecem, do mais antigo para o mais novo """
+
+    user_id = sample_libray_system.add_user("Maria", "maria@teste.com.br")
+    book_ids = [
+        sample_libray_system.add_book(f"Livro {i}", "Autor", f"978-3-16-14841{i}-0", 2000, "Fiction")
+        for i in range(4)
+    ]
+
+    late_id = sample_libray_system.borrow_book(book_ids[0], user_id, borrow_days=-2)
+    later_id = sample_libray_system.borrow_book(book_ids[1], user_id, borrow_days=-5)
+    on_time_id = sample_libray_system.borrow_book(book_ids[2], user_id, borrow_days=3)
+
+    overdue = sample_libray_system.get_overdue_books()
+    assert [item["record"].id for item in overdue] == [later_id, late_id]
+    assert overdue[0]["book"].id == book_ids[1]
+    assert overdue[0]["user"].id == user_id
+
+    sample_libray_system.return_book(later_id)
+    assert [item["record"].id for item in sample_libray_system.get_overdue_books()] == [late_id]
+
+    now = datetime.now()
+    due_soon = sample_libray_system.get_due_between(now, now + timedelta(days=7))
+    assert [record.id for record in due_soon] == [on_time_id]
+
+    # A prorrogação move o empréstimo para fora da janela
+    sample_libray_system.extend_borrowing(on_time_id, additional_days=10)
+    assert sample_libray_system.get_due_between(now, now + timedelta(days=7)) == []
+
+    report = sample_libray_system.generate_reports()
+    assert report["current_borrows"] == 2
+    assert report["overdue_borrows"] == 1
+
+def test_report_counters_follow_every_change(sample_libray_system):
+    """ Quando livros, usuários e empréstimos mudam, então os contadores do relatório batem com uma contagem completa """
+
+    system = sample_libray_system
+    maria_id = system.add_user("Maria", "maria@teste.com.br")
+    joao_id = system.add_user("João", "joao@teste.com.br")
+    book_ids = [system.add_book(f"Livro {i}", "Autor", f"978-3-16-14841{i}-0", 2000, "Fiction") for i in range(4)]
+    assert system.generate_reports() == system.recompute_reports()
+
+    record_id = system.borrow_book(book_ids[0], maria_id)
+    system.borrow_book(book_ids[1], joao_id, borrow_days=-1)
+    system.return_book(record_id)
+    system.update_book(book_ids[2], category="Science")
+    system.get_book(book_ids[3]).update_status(library.BookStatus.LOST)
+    system.get_user(maria_id).deactivate()
+    system.get_user(maria_id).deactivate()
+    system.users.pop(joao_id)
+    system.books.pop(book_ids[0])
+
+    report = system.generate_reports()
+    assert report == system.recompute_reports()
+    assert report["active_users"] == 0
+    assert report["books_by_category"] == {"Fiction": 2, "Science": 1}
+
+    system.get_user(maria_id).reactivate()
+    assert system.generate_reports()["active_users"] == 1
+
+def test_borrow_history_by_user_book_and_period(sample_libray_system):
+    """ Quando o histórico é consultado, então ele vem em ordem cronológica e filtrado por usuário, livro e período """
+
+    maria_id = sample_libray_system.add_user("Maria", "maria@teste.com.br")
+    joao_id = sample_libray_system.add_user("João", "joao@teste.com.br")
+    book_id = sample_libray_system.add_book("O Hobbit", "J.R.R. Tolkien", "978-3-16-148410-1", 1937, "Fiction")
+
+    first_id = sample_libray_system.borrow_book(book_id, maria_id)
+    sample_libray_system.return_book(first_id)
+    second_id = sample_libray_system.borrow_book(book_id, joao_id)
+    sample_libray_system.return_book(second_id)
+    third_id = sample_libray_system.borrow_book(book_id, maria_id)
+
+    history = sample_libray_system.get_borrow_history(user_id=maria_id)
+    assert [record.id for record in history] == [first_id, third_id]
+
+    history = sample_libray_system.get_borrow_history(book_id=book_id)
+    assert [record.id for record in history] == [first_id, second_id, third_id]
+
+    history = sample_libray_system.get_borrow_history(user_id=joao_id, book_id=book_id)
+    assert [record.id for record in history] == [second_id]
+
+    second_date = sample_libray_system.borrow_records[second_id].borrow_date
+    history = sample_libray_system.get_borrow_history(book_id=book_id, start=second_date)
+    assert [record.id for record in history] == [second_id, third_id]
+    history = sample_libray_system.get_borrow_history(book_id=book_id, end=second_date)
+    assert [record.id for record in history] == [first_id]
+
+    stream = sample_libray_system.iter_borrow_history(user_id=maria_id)
+    assert next(stream).id == first_id
+    assert sample_libray_system.get_borrow_history(user_id="desconhecido") == []
+
+def test_add_books_bulk(sample_libray_system):
+    """ Quando livros são importados em lote, então as linhas válidas entram e as inválidas são reportadas """
+
+    sample_libray_system.add_book("O Hobbit", "J.R.R. Tolkien", "978-3-16-148410-1", 1937, "Fiction")
+
+    result = sample_libray_system.add_books_bulk([
+        ("O Senhor dos Anéis", "J.R.R. Tolkien", "978-3-16-148410-0", 1954, "Fiction"),
+        {"title": "Cosmos", "author": "Carl Sagan", "isbn": "978-3-16-148410-2",
+         "publication_year": 1980, "category": "Science"},
+        ("Repetido", "Autor", "978-3-16-148410-0", 2000, "Fiction"),  # duplicado no lote
+        ("Existente", "Autor", "978-3-16-148410-1", 2000, "Fiction"),  # já cadastrado
+        ("Sem categoria", "Autor", "978-3-16-148410-3", 2000, "Fantasia"),
+        ("Linha curta",),
+    ])
+
+    assert len(result["ids"]) == 6
+    assert all(result["ids"][:2]) and result["ids"][2:] == [None] * 4
+    assert sorted(result["errors"]) == [2, 3, 4, 5]
+    assert "first seen at row 0" in result["errors"][2]
+    assert result["errors"][3] == "A book with ISBN 978-3-16-148410-1 already exists"
+
+    assert len(sample_libray_system.books) == 3
+    first, second = (sample_libray_system.get_book(book_id) for book_id in result["ids"][:2])
+    assert first.added_date == second.added_date
+    assert sample_libray_system.search_books("cosmos")[0] is second
+
+def test_add_users_bulk(sample_libray_system):
+    """ Quando usuários são importados em lote, então emails repetidos e papéis inválidos são reportados """
+
+    result = sample_libray_system.add_users_bulk([
+        ("Maria", "maria@teste.com.br"),
+        {"name": "Ana", "email": "ana@teste.com.br", "role": "librarian"},
+        ("Maria de novo", " MARIA@teste.com.br "),
+        ("Pedro", "pedro@teste.com.br", "chefe"),
+    ])
+
+    assert result["ids"][2:] == [None, None]
+    assert sorted(result["errors"]) == [2, 3]
+    assert sample_libray_system.get_user_by_email("ana@teste.com.br").role == library.UserRole.LIBRARIAN
+
+def test_bulk_rows_indexed_per_chunk(sample_libray_system, monkeypatch):
+    """ Quando o lote é guardado em vários blocos, então cada linha aparece nas buscas, filtros e páginas """
+
+    monkeypatch.setattr(library, "BULK_CHUNK_ROWS", 4)
+    monkeypatch.setattr(library.SortedIds, "CHUNK_SIZE", 2)
+    system = sample_libray_system
+    single_ids = [system.add_book(f"Avulso {i}", "Autor", f"978-0-00-0000{i:02d}-0", 2000, "Fiction") for i in range(5)]
+    rows = [(f"Lote {i}", "Autor", f"978-1-00-0000{i:02d}-0", 2000, ["Fiction", "Science"][i % 2]) for i in range(11)]
+    book_ids = system.add_books_bulk(rows)["ids"]
+
+    assert [book.id for book in system.iter_books()] == sorted(single_ids + book_ids)
+    assert [book.id for book in system.iter_books(after=sorted(book_ids)[3], limit=4)] == \
+        [book_id for book_id in sorted(single_ids + book_ids) if book_id > sorted(book_ids)[3]][:4]
+    assert {book.id for book in system.get_all_books(category="Science")} == set(book_ids[1::2])
+    assert len(system.get_all_books(status=library.BookStatus.AVAILABLE)) == 16
+    assert system.search_books("lote 7")[0].id == book_ids[7]
+    assert system.add_books_bulk([rows[0]])["errors"] == {0: f"A book with ISBN {rows[0][2]} already exists"}
+
+    result = system.add_users_bulk([(f"Usuário {i}", f"USUARIO{i}@teste.com.br ") for i in range(9)])
+    assert [user.id for user in system.iter_users()] == sorted(result["ids"])
+    assert system.get_user_by_email("usuario8@teste.com.br").id == result["ids"][8]
+
+def test_cursor_pagination(sample_libray_system):
+    """ Quando os resultados são lidos em páginas com cursor, então cada item aparece uma única vez e em ordem """
+
+    system = sample_libray_system
+    book_ids = [system.add_book(f"Livro {i}", "Autor", f"978-3-16-1484{i:02d}-0", 2000, "Fiction") for i in range(10)]
+    user_ids = [system.add_user(f"Usuário {i}", f"usuario{i}@teste.com.br") for i in range(3)]
+
+    def pages(iterate, size, **filters):
+        found, after = [], None
+        while True:
+            page = list(iterate(after=after, limit=size, **filters))
+            found.extend(page)
+            if len(page) < size:
+                return found
+            after = page[-1].id
+
+    assert [book.id for book in pages(system.iter_books, 3)] == sorted(book_ids)
+    assert [user.id for user in pages(system.iter_users, 2)] == sorted(user_ids)
+
+    # Um cursor removido continua valendo
+    first_page = list(system.iter_books(limit=2))
+    system.books.pop(first_page[-1].id)
+    assert [book.id for book in system.iter_books(after=first_page[-1].id, limit=1)] == [sorted(book_ids)[2]]
+
+    loans = [system.borrow_book(book_id, user_ids[0], borrow_days=-10 + i)
+             for i, book_id in enumerate(sorted(book_ids)[2:5])]
+    for loan in loans:
+        system.return_book(loan)
+    overdue = [system.borrow_book(book_id, user_ids[1], borrow_days=-5 + i)
+               for i, book_id in enumerate(sorted(book_ids)[5:8])]
+    system.return_book(overdue[1])
+
+    assert [record.id for record in pages(system.iter_borrow_history, 2, user_id=user_ids[0])] == loans
+    assert [record.id for record in pages(system.iter_overdue, 1)] == [overdue[0], overdue[2]]
+    assert list(system.iter_overdue(after=overdue[0])) == [system.borrow_records[overdue[2]]]
+
+    with pytest.raises(ValueError, match="Limit must not be negative"):
+        system.iter_books(limit=-1)
+
+
+def test_sorted_ids_page_from_chunks(monkeypatch):
+    """ Quando muitos ids entram e saem, então as páginas seguem em ordem e um cursor pausado vê os ids do início """
+
+    monkeypatch.setattr(library.SortedIds, "CHUNK_SIZE", 4)
+    ids = library.SortedIds()
+    expected = set()
+    paused = []
+    for step in range(3000):
+        key = f"{(step * 7919) % 1000:04d}"
+        if step % 3 == 2:
+            ids.discard(key)
+            expected.discard(key)
+        else:
+            ids.add(key)
+            expected.add(key)
+        if step % 500 == 0:
+            paused.append((ids.after(), sorted(expected)))
+
+    assert list(ids.after()) == sorted(expected) and len(ids) == len(expected)
+    for cursor in ("0000", "0499", "0500", "9999"):
+        assert list(ids.after(cursor)) == [key for key in sorted(expected) if key > cursor]
+    for iterator, snapshot in paused:
+        assert list(iterator) == snapshot
+
+
+def test_borrow_and_return_books_in_batch(sample_libray_system):
+    """ Quando vários livros são emprestados ou devolvidos de uma vez, então ou todos mudam ou nenhum muda """
+
+    system = sample_libray_system
+    user_id = system.add_user("Maria", "maria@teste.com.br")
+    book_ids = [system.add_book(f"Livro {i}", "Autor", f"978-3-16-1484{i:02d}-0", 2000, "Fiction") for i in range(6)]
+    report = system.generate_reports()
+
+    result = system.borrow_books(user_id, [book_ids[0], "nao-existe", book_ids[0]])
+    assert result["ids"] == [None, None, None]
+    assert result["errors"] == {1: "Book not found", 2: f"Duplicate book {book_ids[0]} in batch"}
+    result = system.borrow_books(user_id, book_ids[:4])
+    assert result["errors"] == {3: "User cannot borrow more books"}
+    assert system.generate_reports() == report
+
+    result = system.borrow_books(user_id, book_ids[:3])
+    assert result["errors"] == {}
+    assert system.get_user(user_id).borrowed_books == result["ids"]
+    assert len({system.borrow_records[record_id].borrow_date for record_id in result["ids"]}) == 1
+
+    returned = system.return_books([result["ids"][0], result["ids"][0]])
+    assert returned == {"returned": [False, False], "errors": {1: f"Duplicate record {result['ids'][0]} in batch"}}
+    assert system.generate_reports()["current_borrows"] == 3
+
+    assert system.return_books(result["ids"]) == {"returned": [True, True, True], "errors": {}}
+    assert system.generate_reports() == system.recompute_reports() == report
+    assert system.return_books(result["ids"][:1])["errors"] == {0: "Book already returned"}
+
+    with pytest.raises(ValueError, match="User not found"):
+        system.borrow_books("nao-existe", book_ids)
+
+
+def test_batch_is_rolled_back_when_a_step_fails(sample_libray_system, monkeypatch):
+    """ Quando um passo do lote falha no meio, então os passos já aplicados são desfeitos """
+
+    system = sample_libray_system
+    user_id = system.add_user("Maria", "maria@teste.com.br")
+    other_id = system.add_user("Ana", "ana@teste.com.br")
+    book_ids = [system.add_book(f"Livro {i}", "Autor", f"978-3-16-1484{i:02d}-0", 2000, "Fiction") for i in range(4)]
+    record_ids = system.borrow_books(user_id, book_ids[:2])["ids"]
+    report = system.generate_reports()
+
+    def fail_second_call(step):
+        original = getattr(system, step)
+        calls = []
+
+        def wrapper(*args):
+            calls.append(args)
+            if len(calls) == 2:
+                raise RuntimeError("disco cheio")
+            return original(*args)
+        monkeypatch.setattr(system, step, wrapper)
+
+    fail_second_call("_take_back")
+    with pytest.raises(RuntimeError):
+        system.return_books(record_ids)
+    fail_second_call("_lend")
+    with pytest.raises(RuntimeError):
+        system.borrow_books(other_id, book_ids[2:])
+
+    assert system.generate_reports() == system.recompute_reports() == report
+    assert system.get_user(user_id).borrowed_books == record_ids
+    assert system.get_user(other_id).borrowed_books == []
+    assert len(system.get_borrow_history(user_id=other_id)) == 0
+
+
+def test_rolled_back_return_is_not_counted_twice(sample_libray_system, monkeypatch):
+    """ Quando a devolução de um empréstimo vencido é desfeita, então ele volta a vencer uma única vez """
+
+    system = sample_libray_system
+    user_id = system.add_user("Maria", "maria@teste.com.br")
+    book_ids = [system.add_book(f"Livro {i}", "Autor", f"978-3-16-1484{i:02d}-0", 2000, "Fiction") for i in range(2)]
+    record_ids = [system.borrow_book(book_id, user_id, borrow_days=-2) for book_id in book_ids]
+
+    original = system._take_back
+    calls = []
+
+    def fail_second_call(*args):
+        calls.append(args)
+        if len(calls) == 2:
+            raise RuntimeError("disco cheio")
+        return original(*args)
+    monkeypatch.setattr(system, "_take_back", fail_second_call)
+    with pytest.raises(RuntimeError):
+        system.return_books(record_ids)
+
+    # The first loan was returned and reopened with the same due date
+    assert system.generate_reports()["overdue_borrows"] == system.recompute_reports()["overdue_borrows"] == 2
+    assert sorted(item["record"].id for item in system.get_overdue_books()) == sorted(record_ids)
+
+
+def test_borrow_limits_per_role(sample_libray_system):
+    """ Quando cada papel tem seu limite, então membros param no limite e contas institucionais não """
+
+    system = sample_libray_system
+    system.borrow_limits[library.UserRole.LIBRARIAN] = None
+    member_id = system.add_user("Maria", "maria@teste.com.br")
+    school_id = system.add_user("Escola", "escola@teste.com.br", library.UserRole.LIBRARIAN)
+    book_ids = [system.add_book(f"Livro {i}", "Autor", f"978-3-16-1484{i:02d}-0", 2000, "Fiction") for i in range(8)]
+
+    for book_id in book_ids[:3]:
+        system.borrow_book(book_id, member_id)
+    with pytest.raises(ValueError, match="cannot borrow more"):
+        system.borrow_book(book_ids[3], member_id)
+
+    record_ids = system.borrow_books(school_id, book_ids[3:])["ids"]
+    school = system.get_user(school_id)
+    assert school.borrowed_books == record_ids
+    system.return_book(record_ids[2])
+    assert school.to_dict()["borrowed_count"] == 4
+    assert school.to_dict(loans_limit=2)["borrowed_books"] == record_ids[:2]
@@ -0,0 +1,95 @@
+import pytest
+
+from metrics import Histogram, error_class
+from sharded_library import ShardedLibrarySystem
+
+
+def test_metrics_record_calls_errors_and_result_sizes(sample_libray_system, tmp_path):
+    """ Quando as métricas estão ligadas, então chamadas, erros, latências e tamanhos de resultado são registrados """
+
+    system = sample_libray_system
+    assert system.get_metrics() == {}
+    system.enable_metrics()
+
+    user_id = system.add_user("Maria", "maria@teste.com.br")
+    book_ids = [system.add_book(f"Livro {i}", "Autor", f"978-3-16-1484{i:02d}-0", 2000, "Fiction") for i in range(3)]
+    system.borrow_book(book_ids[0], user_id)
+    for book_id in book_ids[:2]:
+        with pytest.raises(ValueError):
+            system.borrow_book(book_id, "usuario-que-nao-existe")
+    with pytest.raises(ValueError):
+        system.borrow_book(book_ids[0], user_id)
+    system.search_books("livro")
+
+    metrics = system.get_metrics()
+    assert metrics["add_book"]["calls"] == 3
+    assert metrics["borrow_book"]["calls"] == 4
+    assert metrics["borrow_book"]["errors"] == {
+        "ValueError: User not found": 2,
+        "ValueError: Book is not available, current status": 1,
+    }
+    latency = metrics["borrow_book"]["latency_us"]
+    assert 0 < latency["min"] <= latency["p50"] <= latency["p99"] <= latency["max"]
+    assert metrics["search_books"]["result_size"]["sum"] == 3
+    assert "result_size" not in metrics["add_book"]
+
+    # Chamadas internas não são contadas de novo
+    system.get_borrow_history(user_id=user_id)
+    system.export(tmp_path / "books.ndjson")
+    metrics = system.get_metrics()
+    assert metrics["get_borrow_history"]["calls"] == metrics["export"]["calls"] == 1
+    assert metrics["iter_borrow_history"]["calls"] == metrics["iter_books"]["calls"] == 0
+
+    path = tmp_path / "library.prom"
+    system.write_metrics(path)
+    text = path.read_text()
+    assert 'library_calls_total{method="borrow_book"} 4' in text
+    assert 'library_errors_total{method="borrow_book",error="ValueError: User not found"} 2' in text
+    assert 'library_call_duration_seconds_bucket{method="borrow_book",le="+Inf"} 4' in text
+    assert 'library_result_size_count{method="search_books"} 1' in text
+
+    # Desligadas, os métodos voltam a ser os da classe
+    system.disable_metrics()
+    assert "borrow_book" not in vars(system)
+    system.get_user(user_id)
+    assert system.get_metrics() == {}
+
+
+def test_sharded_metrics_count_each_request_once(tmp_path):
+    """ Quando a biblioteca particionada mede seus métodos, então cada pedido conta uma vez, sem as chamadas internas """
+
+    system = ShardedLibrarySystem(shards=3)
+    system.enable_metrics()
+    user_id = system.add_user("Maria", "maria@teste.com.br")
+    book_ids = system.add_books_bulk([(f"Livro {i}", "Autor", f"978-3-16-1484{i:02d}-0", 2000, "Fiction")
+                                      for i in range(4)])["ids"]
+    system.borrow_books(user_id, book_ids[:2])
+    system.get_borrow_history(user_id=user_id)
+
+    calls = {name: stats["calls"] for name, stats in system.get_metrics().items() if stats["calls"]}
+    assert calls == {"add_user": 1, "add_books_bulk": 1, "borrow_books": 1, "get_borrow_history": 1}
+    system.write_metrics(tmp_path / "library.prom")
+    assert 'library_calls_total{method="borrow_books"} 1' in (tmp_path / "library.prom").read_text()
+    system.disable_metrics()
+    assert system.get_metrics() == {}
+
+
+def test_histogram_buckets_and_error_classes():
+    """ Quando valores de várias grandezas são registrados, então os percentis ficam dentro da precisão dos baldes """
+
+    histogram = Histogram()
+    for value in range(1, 100_001):
+        histogram.record(value)
+
+    assert histogram.count == 100_000
+    assert histogram.percentile(100) == 100_000
+    for percent in (50, 90, 99):
+        exact = 1000 * percent
+        assert exact <= histogram.percentile(percent) <= exact * 1.125
+
+    cumulative = dict(histogram.cumulative([1, 2, 1024, 1 << 20]))
+    assert cumulative == {1: 1, 2: 2, 1024: 1024, 1 << 20: 100_000}
+
+    assert error_class(ValueError("A book with ISBN 978-3-16-148410-1 already exists")) == \
+        "ValueError: A book with ISBN <id> already exists"
+    assert error_class(KeyError("x")) == "KeyError: 'x'"
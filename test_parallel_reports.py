@@ -0,0 +1,53 @@
+import pytest
+import library_management_system as library
+from parallel_reports import ParallelReportEngine
+from snapshot import SnapshotError
+
+
+@pytest.fixture
+def reporting_system(sample_libray_system):
+    """ Dado um sistema com empréstimos devolvidos, abertos e atrasados """
+
+    system = sample_libray_system
+    maria_id = system.add_user("Maria", "maria@teste.com.br")
+    ana_id = system.add_user("Ana", "ana@teste.com.br")
+    book_ids = system.add_books_bulk(
+        (f"Livro {i}", "Autor", f"978-{i:010d}", 2000, ("Fiction", "Science", "History")[i % 3])
+        for i in range(30)
+    )["ids"]
+
+    for book_id in book_ids[:10]:
+        system.return_book(system.borrow_book(book_id, maria_id))
+    system.borrow_book(book_ids[10], maria_id)
+    system.borrow_book(book_ids[11], ana_id, borrow_days=-1)
+    system.get_book(book_ids[12]).update_status(library.BookStatus.MAINTENANCE)
+    system.get_user(ana_id).deactivate()
+
+    return system
+
+
+@pytest.mark.parametrize("workers", [0, 2])
+def test_parallel_report_matches_generate_reports(reporting_system, workers):
+    """ Quando o relatório é calculado em paralelo, então ele é idêntico ao generate_reports """
+
+    with ParallelReportEngine(workers=workers) as engine:
+        report = engine.generate_reports(reporting_system)
+
+    assert report == reporting_system.generate_reports()
+    assert report["overdue_borrows"] == 1
+    assert report["current_borrows"] == 2
+
+
+def test_parallel_report_from_snapshot_file(reporting_system, tmp_path, monkeypatch):
+    """ Quando o relatório é calculado de um snapshot dividido em várias partes, então o resultado é o mesmo """
+
+    monkeypatch.setattr("parallel_reports.MIN_SHARD_ROWS", 4)
+    path = tmp_path / "library.snapshot"
+    reporting_system.save(path)
+
+    with ParallelReportEngine(workers=0, shards_per_worker=8) as engine:
+        assert engine.generate_reports(path) == reporting_system.generate_reports()
+
+    (tmp_path / "broken.snapshot").write_bytes(b"not a snapshot at all")
+    with pytest.raises(SnapshotError):
+        ParallelReportEngine(workers=0).generate_reports(tmp_path / "broken.snapshot")
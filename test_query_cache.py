@@ -0,0 +1,53 @@
+import library_management_system as library
+from query_cache import QueryCache
+
+
+def test_cache_invalidates_only_affected_results():
+    """ Quando um livro muda, então só os resultados que dependem dele deixam de vir do cache """
+
+    system = library.LibrarySystem(cache_size=16)
+    user_id = system.add_user("Maria", "maria@teste.com.br")
+    hobbit_id = system.add_book("O Hobbit", "J.R.R. Tolkien", "978-3-16-148410-1", 1937, "Fiction")
+    system.add_book("Cosmos", "Carl Sagan", "978-3-16-148410-2", 1980, "Science")
+
+    assert [book.id for book in system.search_books("hobbit")] == [hobbit_id]
+    assert len(system.get_all_books(status=library.BookStatus.AVAILABLE)) == 2
+    assert len(system.get_all_books(category="Science")) == 1
+
+    system.borrow_book(hobbit_id, user_id)
+
+    # A busca e o filtro por categoria não dependem do status
+    assert [book.id for book in system.search_books("hobbit")] == [hobbit_id]
+    assert len(system.get_all_books(category="Science")) == 1
+    assert len(system.get_all_books(status=library.BookStatus.AVAILABLE)) == 1
+    assert system.cache.stats()["hits"] == 2
+    assert system.cache.stats()["invalidations"] == 1
+
+    # Mudar só a categoria, ou nada, não invalida as buscas
+    system.update_book(hobbit_id, category="Other")
+    system.update_book(hobbit_id)
+    hits = system.cache.stats()["hits"]
+    assert [book.id for book in system.search_books("hobbit")] == [hobbit_id]
+    assert system.cache.stats()["hits"] == hits + 1
+
+    system.update_book(hobbit_id, title="O Hobbit, edição anotada")
+    assert [book.title for book in system.search_books("hobbit")] == ["O Hobbit, edição anotada"]
+    assert system.cache.stats()["invalidations"] == 2
+
+
+def test_cache_evicts_least_recent_and_expired_entries():
+    """ Quando o cache enche ou o tempo de vida acaba, então as entradas antigas são descartadas """
+
+    now = [0.0]
+    cache = QueryCache(maxsize=2, ttl=10, clock=lambda: now[0])
+    cache.put("a", 1, "A")
+    cache.put("b", 1, "B")
+    assert cache.get("a", 1) == "A"
+    cache.put("c", 1, "C")
+
+    assert cache.get("b", 1) is None
+    assert cache.get("a", 1) == "A"
+    now[0] = 10
+    assert cache.get("c", 1) is None
+    assert cache.stats() == {"size": 1, "maxsize": 2, "hits": 2, "misses": 2,
+                             "evictions": 1, "expirations": 1, "invalidations": 0}
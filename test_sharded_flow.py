@@ -0,0 +1,127 @@
+import io
+import json
+from datetime import datetime
+
+import pytest
+import library_management_system as library
+from clock import ManualClock
+from sharded_library import ShardedLibrarySystem
+
+
+@pytest.fixture
+def sharded_system():
+    """ Dado uma biblioteca dividida em quatro shards """
+    return ShardedLibrarySystem(shards=4)
+
+
+def test_sharded_unique_isbn_email_and_search(sharded_system):
+    """ Quando livros e usuários caem em shards diferentes, então ISBN, email e busca continuam globais """
+
+    book_ids = [
+        sharded_system.add_book(f"O Hobbit {i}", "J.R.R. Tolkien", f"978-3-16-14841{i}-0", 1937, "Fiction")
+        for i in range(8)
+    ]
+    assert len({sharded_system._shard_of(book_id) for book_id in book_ids}) > 1
+
+    with pytest.raises(ValueError, match="already exists"):
+        sharded_system.add_book("Outro", "Autor", "978-3-16-148415-0", 2000, "Fiction")
+
+    result = sharded_system.add_users_bulk([("Maria", "maria@teste.com.br"), ("Maria", "MARIA@teste.com.br")])
+    assert result["errors"] == {1: "A user with email MARIA@teste.com.br already exists"}
+
+    single = library.LibrarySystem()
+    for i in range(8):
+        single.add_book(f"O Hobbit {i}", "J.R.R. Tolkien", f"978-3-16-14841{i}-0", 1937, "Fiction")
+
+    def titles(system, **options):
+        return [book.title for book in system.search_books("hobbit", **options)]
+
+    assert titles(sharded_system) == titles(single)
+    assert titles(sharded_system, limit=3, offset=2) == titles(single, limit=3, offset=2)
+    assert sharded_system.get_book_by_isbn("978-3-16-148413-0").id == book_ids[3]
+    assert len(sharded_system.books) == 8
+
+
+def test_sharded_loans_across_shards(sharded_system, tmp_path):
+    """ Quando o livro e o usuário estão em shards diferentes, então empréstimo, devolução e relatórios funcionam """
+
+    book_ids = [sharded_system.add_book(f"Livro {i}", "Autor", f"978-{i:010d}", 2000, "Fiction") for i in range(12)]
+    user_id = sharded_system.add_user("Maria", "maria@teste.com.br")
+    user_shard = sharded_system._shard_of(user_id)
+    remote_ids = [book_id for book_id in book_ids if sharded_system._shard_of(book_id) is not user_shard]
+
+    late_id = sharded_system.borrow_book(remote_ids[0], user_id, borrow_days=-1)
+    open_id = sharded_system.borrow_book(remote_ids[1], user_id)
+    returned_id = sharded_system.borrow_book(remote_ids[2], user_id)
+    sharded_system.return_book(returned_id)
+    sharded_system.extend_borrowing(open_id)
+
+    user = sharded_system.get_user(user_id)
+    assert user.borrowed_books == [late_id, open_id]
+    assert sharded_system.get_book(remote_ids[2]).status == library.BookStatus.AVAILABLE
+    assert [item["record"].id for item in sharded_system.get_overdue_books()] == [late_id]
+    assert [record.id for record in sharded_system.get_borrow_history(user_id=user_id)] == \
+        [late_id, open_id, returned_id]
+
+    report = sharded_system.generate_reports()
+    assert report == sharded_system.recompute_reports()
+    assert report["borrowed_books"] == 2
+    assert report["overdue_borrows"] == 1
+
+    sharded_system.save(tmp_path / "library")
+    loaded = ShardedLibrarySystem.load(tmp_path / "library")
+    assert sorted(loaded.get_user(user_id).borrowed_books) == sorted([late_id, open_id])
+    assert loaded.generate_reports() == report
+    loaded.return_book(late_id)
+    assert loaded.get_user(user_id).borrowed_books == [open_id]
+
+    # A exportação percorre os cursores de todos os shards
+    for kind, entities in (("books", sharded_system.iter_books()), ("borrow_records", sharded_system.iter_borrow_history())):
+        output = io.StringIO()
+        expected = [entity.to_dict() for entity in entities]
+        assert sharded_system.export(output, kind) == len(expected)
+        assert [json.loads(line) for line in output.getvalue().splitlines()] == expected
+
+
+def test_sharded_batch_checkout(sharded_system):
+    """ Quando um lote tem livros em vários shards, então o empréstimo e a devolução são tudo ou nada """
+
+    book_ids = [sharded_system.add_book(f"Livro {i}", "Autor", f"978-{i:010d}", 2000, "Fiction") for i in range(8)]
+    user_id = sharded_system.add_user("Maria", "maria@teste.com.br")
+    other_id = sharded_system.add_user("Ana", "ana@teste.com.br")
+    taken_id = sharded_system.borrow_book(book_ids[3], other_id)
+
+    result = sharded_system.borrow_books(user_id, book_ids[:4])
+    assert result["errors"] == {3: "Book is not available, current status: borrowed"}
+    assert sharded_system.generate_reports()["current_borrows"] == 1
+
+    result = sharded_system.borrow_books(user_id, book_ids[:3])
+    assert sharded_system.get_user(user_id).borrowed_books == result["ids"]
+    assert sharded_system.return_books(result["ids"] + [taken_id])["returned"] == [True] * 4
+    report = sharded_system.generate_reports()
+    assert report == sharded_system.recompute_reports()
+    assert report["current_borrows"] == 0
+
+
+def test_sharded_history_pages_in_borrow_order():
+    """ Quando o histórico de vários shards é lido em páginas, então nenhum empréstimo se perde e a ordem é a das datas """
+
+    clock = ManualClock(datetime(2024, 1, 1, 9, 0))
+    system = ShardedLibrarySystem(shards=3, clock=clock)
+    user_ids = [system.add_user(f"Leitor {i}", f"leitor{i}@teste.com.br") for i in range(3)]
+    book_ids = [system.add_book(f"Livro {i}", "Autor", f"978-3-16-1484{i:02d}-0", 2000, "Fiction") for i in range(6)]
+
+    loans = []
+    for i in range(30):
+        clock.advance(minutes=1)
+        loans.append(system.borrow_book(book_ids[i % 6], user_ids[i % 3]))
+        system.return_book(loans[-1])
+
+    found, after = [], None
+    while True:
+        page = list(system.iter_borrow_history(after=after, limit=5))
+        found.extend(record.id for record in page)
+        if len(page) < 5:
+            break
+        after = page[-1].id
+    assert found == loans
@@ -0,0 +1,115 @@
+from datetime import datetime
+
+import pytest
+import library_management_system as library
+from clock import ManualClock
+from snapshot import SnapshotError
+
+
+@pytest.fixture
+def populated_system(sample_libray_system):
+    """ Dado um sistema com livros, usuários, empréstimos abertos e devolvidos """
+
+    system = sample_libray_system
+    maria_id = system.add_user("Maria", "maria@teste.com.br")
+    ana_id = system.add_user("Ana", "ana@teste.com.br", library.UserRole.LIBRARIAN)
+    hobbit_id = system.add_book("O Hobbit", "J.R.R. Tolkien", "978-3-16-148410-1", 1937, "Fiction")
+    aneis_id = system.add_book("O Senhor dos Anéis", "J.R.R. Tolkien", "978-3-16-148410-0", 1954, "Fiction")
+    system.add_book("Cosmos", "Carl Sagan", "978-3-16-148410-2", None, "Science")
+
+    returned_id = system.borrow_book(hobbit_id, maria_id)
+    system.return_book(returned_id)
+    open_id = system.borrow_book(aneis_id, maria_id)
+    system.extend_borrowing(open_id)
+    system.borrow_book(hobbit_id, ana_id, borrow_days=-1)
+    system.get_user(ana_id).deactivate()
+
+    return system
+
+
+def test_snapshot_round_trip(populated_system, tmp_path):
+    """ Quando o sistema é salvo e carregado, então livros, usuários e empréstimos voltam iguais """
+
+    path = tmp_path / "library.snapshot"
+    populated_system.save(path)
+    loaded = library.LibrarySystem.load(path)
+
+    assert loaded.allowed_categories == populated_system.allowed_categories
+    for attribute in ("books", "users", "borrow_records"):
+        original = getattr(populated_system, attribute)
+        restored = getattr(loaded, attribute)
+        assert len(restored) == len(original)
+        for entity_id, entity in original.items():
+            assert restored[entity_id].to_dict() == entity.to_dict()
+
+    assert loaded.generate_reports() == populated_system.generate_reports()
+    assert loaded.generate_reports() == loaded.recompute_reports()
+    assert [book.title for book in loaded.search_books("aneis")] == ["O Senhor dos Anéis"]
+    assert loaded.get_book_by_isbn("978-3-16-148410-2").publication_year is None
+
+    maria = loaded.get_user_by_email("maria@teste.com.br")
+    assert [record.id for record in loaded.get_borrow_history(user_id=maria.id)] == \
+        [record.id for record in populated_system.get_borrow_history(user_id=maria.id)]
+
+
+def test_snapshot_keeps_working_after_load(populated_system, tmp_path):
+    """ Quando um snapshot carregado recebe novas operações, então ele pode ser salvo de novo """
+
+    path = tmp_path / "library.snapshot"
+    populated_system.save(path)
+    loaded = library.LibrarySystem.load(path)
+
+    open_record = next(record for record in loaded.borrow_records.values() if not record.is_returned
+                       and not record.is_overdue())
+    loaded.return_book(open_record.id)
+    maria = loaded.get_user_by_email("maria@teste.com.br")
+    assert maria.borrowed_books == []
+
+    archived = next(record for record in loaded.borrow_records.values() if record.id != open_record.id
+                    and record.is_returned)
+    with pytest.raises(ValueError, match="already returned"):
+        loaded.return_book(archived.id)
+
+    loaded.save(path)
+    reloaded = library.LibrarySystem.load(path)
+    assert reloaded.generate_reports() == loaded.generate_reports()
+    assert len(reloaded.get_borrow_history(user_id=maria.id)) == 2
+
+
+def test_load_rejects_other_files(tmp_path):
+    """ Quando o arquivo não é um snapshot, então o carregamento falha """
+
+    path = tmp_path / "not-a-snapshot"
+    path.write_bytes(b"x" * 32)
+
+    with pytest.raises(SnapshotError):
+        library.LibrarySystem.load(path)
+
+
+def test_history_pages_in_borrow_order_after_load(tmp_path):
+    """ Quando o histórico de um snapshot carregado é lido em páginas, então abertos e devolvidos se intercalam por data """
+
+    clock = ManualClock(datetime(2024, 1, 1, 9, 0))
+    system = library.LibrarySystem(clock=clock)
+    user_id = system.add_user("Maria", "maria@teste.com.br")
+    book_ids = [system.add_book(f"Livro {i}", "Autor", f"978-3-16-1484{i:02d}-0", 2000, "Fiction") for i in range(2)]
+
+    loans = [system.borrow_book(book_ids[0], user_id)]  # the oldest loan stays open
+    for _ in range(14):
+        clock.advance(hours=1)
+        loans.append(system.borrow_book(book_ids[1], user_id))
+        system.return_book(loans[-1])
+
+    path = tmp_path / "library.snapshot"
+    system.save(path)
+    loaded = library.LibrarySystem.load(path)
+
+    found, after = [], None
+    while True:
+        page = list(loaded.iter_borrow_history(after=after, limit=5))
+        found.extend(record.id for record in page)
+        if len(page) < 5:
+            break
+        after = page[-1].id
+    assert found == loans
+    assert [record.id for record in loaded.get_borrow_history()] == loans
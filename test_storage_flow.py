@@ -0,0 +1,80 @@
+import gc
+import threading
+
+import library_management_system as library
+from storage import SQLiteStorage
+
+
+def test_sqlite_storage_survives_reopen(tmp_path):
+    """ Quando o banco SQLite é reaberto, então livros, usuários, empréstimos e índices voltam iguais """
+
+    path = tmp_path / "library.db"
+    storage = SQLiteStorage(path)
+    system = library.LibrarySystem(storage=storage)
+    user_id = system.add_user("Maria", "maria@teste.com.br")
+    hobbit_id = system.add_book("O Hobbit", "J.R.R. Tolkien", "978-3-16-148410-1", 1937, "Fiction")
+    aneis_id = system.add_book("O Senhor dos Anéis", "J.R.R. Tolkien", "978-3-16-148410-0", 1954, "Fiction")
+    system.return_book(system.borrow_book(hobbit_id, user_id))
+    open_id = system.borrow_book(aneis_id, user_id)
+    system.update_book(hobbit_id, category="History")
+    report = system.generate_reports()
+    storage.close()
+
+    storage = SQLiteStorage(path)
+    reopened = library.LibrarySystem(storage=storage)
+    try:
+        assert reopened.generate_reports() == report
+        assert reopened.get_user(user_id).borrowed_books == [open_id]
+        assert reopened.get_book_by_isbn("978-3-16-148410-0").status == library.BookStatus.BORROWED
+        assert [book.id for book in reopened.search_books("aneis")] == [aneis_id]
+        assert len(reopened.get_borrow_history(user_id=user_id)) == 2
+    finally:
+        storage.close()
+
+
+def test_sqlite_storage_drops_unused_entities_and_serves_threads():
+    """ Quando ninguém guarda um livro, então ele sai da memória e é relido do banco, inclusive por várias threads """
+
+    storage = SQLiteStorage(readers=4)
+    system = library.LibrarySystem(concurrent=True, storage=storage)
+    try:
+        book_ids = [system.add_book(f"Livro {i}", "Autor", f"978-{i:010d}", 2000, "Fiction") for i in range(50)]
+        system.get_book(book_ids[0]).update_status(library.BookStatus.LOST)
+        gc.collect()
+        assert len(system.books._live) == 0
+        assert system.get_book(book_ids[0]).status == library.BookStatus.LOST
+
+        errors = []
+
+        def read():
+            try:
+                for book_id in book_ids:
+                    assert system.get_book(book_id).id == book_id
+            except Exception as error:
+                errors.append(error)
+
+        threads = [threading.Thread(target=read) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert errors == []
+    finally:
+        storage.close()
+
+
+def test_sqlite_storage_keeps_only_the_loans_index(tmp_path):
+    """ Quando um banco antigo é reaberto, então só fica o índice de empréstimos por usuário, o único usado em SQL """
+
+    path = tmp_path / "library.db"
+    storage = SQLiteStorage(path)
+    storage.write("CREATE INDEX books_isbn ON books (isbn)")
+    storage.close()
+
+    storage = SQLiteStorage(path)
+    try:
+        with storage.reader() as connection:
+            indexes = connection.execute("SELECT name FROM sqlite_master WHERE type = 'index' AND sql IS NOT NULL")
+            assert [row[0] for row in indexes] == ["borrow_records_user_id"]
+    finally:
+        storage.close()
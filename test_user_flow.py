@@ -1,3 +1,4 @@
+import pytest
 import library_management_system as library
 
 
@@ -43,4 +44,30 @@ def test_reactivate_user(sample_user):
     sample_user.reactivate()
     assert sample_user.active == True
 
+def test_active_loans_keep_order_and_page(sample_user):
+    """ Quando um usuário tem muitos empréstimos, então a ordem se mantém e o to_dict pode paginar a lista """
 
+    sample_user.borrowed_books = [f"r{i}" for i in range(1000)]
+    loans = sample_user.borrowed_books
+    position = loans.remove("r10")
+    loans.discard("r11")
+    assert "r10" not in loans and len(loans) == 998
+    loans.restore("r10", position)
+    assert loans.page(9, 3) == ["r9", "r10", "r12"]
+
+    user_dict = sample_user.to_dict(loans_offset=2, loans_limit=2)
+    assert user_dict["borrowed_books"] == ["r2", "r3"]
+    assert user_dict["borrowed_count"] == 999
+
+    with pytest.raises(ValueError):
+        loans.remove("r11")
+
+def test_can_borrow_respects_the_limit(sample_user):
+    """ Quando o limite é atingido exatamente, então o usuário não pode pegar mais um livro """
+
+    sample_user.borrowed_books = ['1', '2']
+    assert sample_user.can_borrow(max_books=3) == True
+    assert sample_user.can_borrow(max_books=3, count=2) == False
+    sample_user.borrowed_books = ['1', '2', '3']
+    assert sample_user.can_borrow(max_books=3) == False
+    assert sample_user.can_borrow(max_books=None) == True